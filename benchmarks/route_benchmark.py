@@ -0,0 +1,444 @@
+"""
+Benchmarks every url of the site against a stored baseline: latency percentiles, requests per second and SQL
+queries per request, and fails (exit code 1) when a route got slower or runs more queries than the baseline allows.
+
+It builds a throwaway SQLite database with synthetic data (users with profiles, posts, comments, likes, follows and
+the timelines they make, profile pictures and gallery photos, all with bulk inserts), then requests each route in-process through django's test client
+with a logged in session: a few warm up requests, one with the queries captured, then --requests timed ones.
+Every named url in tutorial_project/urls.py and blog/urls.py must have an entry in ROUTES below, the run stops if one
+is missing, so a new view gets benchmarked from the day it's added. Write routes (creating, editing and deleting posts
+and comments, registering, uploading) are included, objects they delete are created before the timer starts.
+
+In-process means no web server, socket or static files are involved: the numbers are the time spent in middleware,
+views, templates and the database, which is what changes when the code changes. For server level load see
+async_benchmark.py, for concurrent writers sqlite_stress.py.
+
+The baseline (benchmarks/baseline.json) is compared like this:
+  queries   must not be more than in the baseline, the count doesn't depend on the machine so this check is exact
+  p95       may be up to --tolerance (default 50%) plus --slack-ms (default 2 ms) above the baseline, timings do
+            depend on the machine, so save a baseline on the machine that runs the comparison (eg the ci runner)
+Routes missing from the baseline are reported as new and don't fail the run.
+
+    python benchmarks/route_benchmark.py                           # compare with benchmarks/baseline.json
+    python benchmarks/route_benchmark.py --save-baseline           # (re)write the baseline from this run
+    python benchmarks/route_benchmark.py --only blog-home post-detail --requests 200
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+SETTINGS = '''
+from tutorial_project.settings import *
+
+DEBUG = False
+CRISPY_RENDER_CACHE = True #what production runs with, settings.py derives it from DEBUG before we change that
+ALLOWED_HOSTS = ['testserver']
+DATABASES['default']['NAME'] = {db!r} #same tuned sqlite settings, throwaway file
+MEDIA_ROOT = {media!r}
+STATIC_ROOT = {static!r} #collected by generate(), the pages link the hashed names from its manifest
+#register and login hash a password, with the real hasher that alone is ~99% of their time whatever the code does
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend' #password reset sends a mail
+LOGGING['loggers']['tutorial_project.timing']['level'] = 'WARNING' #no line per request on the console
+'''
+PASSWORD = 'bench-pass-123'
+
+
+def setup_django(workdir):
+    db = os.path.join(workdir, 'bench.sqlite3')
+    media = os.path.join(workdir, 'media')
+    static = os.path.join(workdir, 'static')
+    Path(workdir, 'route_bench_settings.py').write_text(SETTINGS.format(db=db, media=media, static=static))
+    sys.path[:0] = [workdir, str(ROOT)]
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'route_bench_settings'
+    import django
+    django.setup()
+
+
+def picture(seed, size=(800, 600)):
+    from PIL import Image
+    buffer = BytesIO()
+    rng = random.Random(seed)
+    Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3))).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def bulk(model, objects, batch_size=2000):
+    #bulk_create in batches, returns the objects with their primary keys (sqlite returns them)
+    return model.objects.bulk_create(objects, batch_size=batch_size)
+
+
+def generate(args):
+    #fills the database with synthetic data, returns the benchmark user (owner of some posts, staff for the admin)
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from django.core.management import call_command
+    from django.utils import timezone
+    from blog.models import Comment, Follow, Like, Post, TimelineEntry, recount_post_counters
+    from gallery.models import ImageUpload
+    from imaging.models import ImageJob
+    from users.models import Profile
+
+    rng = random.Random(args.seed)
+    call_command('migrate', verbosity=0)
+    call_command('collectstatic', interactive=False, verbosity=0)
+
+    bench = User.objects.create_superuser(username='bench', email='bench@example.com', password=PASSWORD)
+    password = make_password(PASSWORD) #hashed once, shared by every synthetic user
+    users = bulk(User, (
+        User(username=f'user{i}', email=f'user{i}@example.com', password=password) for i in range(args.users)
+    ))
+    bulk(Profile, (Profile(user=user) for user in users)) #bulk_create skips the signal that makes them
+
+    #a pool of distinct pictures shared by profiles and gallery photos, each one resized once and its renditions
+    #copied to the others, the way identical uploads share renditions anyway
+    pictures = [
+        default_storage.save(f'bench/picture{i}.png', ContentFile(picture(args.seed + i))) for i in range(args.images)
+    ]
+    bulk(ImageUpload, (
+        ImageUpload(title=f'Photo {i}', image=pictures[i % len(pictures)]) for i in range(args.photos)
+    ))
+    for i, name in enumerate(pictures):
+        Profile.objects.filter(user__in=users[i::len(pictures)]).update(image=name)
+        for model in (Profile, ImageUpload):
+            instance = model.objects.filter(image=name).first()
+            if instance is not None:
+                instance.process_image()
+                model.objects.filter(image=name).update(renditions=instance.renditions)
+    ImageJob.objects.all().delete()
+
+    authors = [bench, *users]
+    now = timezone.now()
+    posts = bulk(Post, (
+        Post(
+            title=f'Post {i}', content='Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * rng.randint(2, 30),
+            author=authors[i % len(authors)], date_posted=now - timezone.timedelta(minutes=args.posts - i),
+        )
+        for i in range(args.posts)
+    ))
+    #half the comments on the newest post so its detail page has plenty to paginate, the rest spread out
+    hot = posts[-1]
+    bulk(Comment, (
+        Comment(
+            post=hot if i % 2 else rng.choice(posts), user=rng.choice(authors), content=f'Comment {i}',
+        )
+        for i in range(args.comments)
+    ))
+    pairs = set()
+    while len(pairs) < min(args.likes, len(posts) * len(authors)):
+        pairs.add((rng.choice(posts).pk, rng.choice(authors).pk))
+    bulk(Like, (Like(post_id=post_id, user_id=user_id) for post_id, user_id in pairs))
+    recount_post_counters(Post.objects.all())
+
+    #everyone follows --follows others (the benchmark user too), and every post is in its followers' timelines
+    #the way fan_out_post() leaves it, except user0's which are left to be merged in when a timeline is read
+    follows = set()
+    for follower in authors:
+        for followee in rng.sample(authors, min(args.follows + 1, len(authors))):
+            if followee != follower:
+                follows.add((follower.pk, followee.pk))
+    bulk(Follow, (Follow(follower_id=follower, followee_id=followee) for follower, followee in follows))
+    followers = {}
+    for follower, followee in follows:
+        followers.setdefault(followee, []).append(follower)
+    fanned = [post for post in posts if post.author_id != users[0].pk]
+    bulk(TimelineEntry, (
+        TimelineEntry(user_id=user_id, post_id=post.pk, posted_at=post.date_posted)
+        for post in fanned for user_id in [post.author_id, *followers.get(post.author_id, [])]
+    ))
+    Post.objects.filter(pk__in=[post.pk for post in fanned]).update(fanned_out=True)
+    return bench
+
+
+class Route:
+    #one request to benchmark
+    #path and data are callables taking the Context, called before the timer starts (they may create objects),
+    #client is 'user' (the logged in benchmark user), 'anon' (no cookies, not logged in) or 'fresh'
+    #(a new logged in session per request, for logout)
+    def __init__(self, name, path, method='GET', data=None, status=200, client='user'):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data
+        self.status = status
+        self.client = client
+
+    @property
+    def key(self):
+        return f'{self.name} {self.method}'
+
+
+class Context:
+    #what the routes need: the benchmark user, their posts and comments, a counter for unique names
+    def __init__(self, user):
+        from blog.models import Comment, Post
+        self.user = user
+        self.post = Post.objects.filter(author=user).latest('id')
+        self.hot_post = Post.objects.latest('id')
+        self.comment = Comment.objects.create(post=self.hot_post, user=user, content='Mine')
+        self.counter = itertools.count()
+        self.clients = {}
+
+    def unique(self, prefix):
+        return f'{prefix}{next(self.counter)}'
+
+    def new_post(self):
+        from blog.models import Post
+        return Post.objects.create(title='Throwaway', content='To be deleted', author=self.user)
+
+    def new_comment(self):
+        from blog.models import Comment
+        return Comment.objects.create(post=self.hot_post, user=self.user, content='To be deleted')
+
+    def upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return SimpleUploadedFile('upload.png', picture(0, (400, 300)), content_type='image/png')
+
+
+def reset_link(ctx):
+    from django.contrib.auth.tokens import default_token_generator
+    from django.utils.encoding import force_bytes
+    from django.utils.http import urlsafe_base64_encode
+    from django.urls import reverse
+    uidb64 = urlsafe_base64_encode(force_bytes(ctx.user.pk))
+    return reverse('password_reset_confirm', args=[uidb64, default_token_generator.make_token(ctx.user)])
+
+
+def url(name, *args):
+    from django.urls import reverse
+    return lambda ctx: reverse(name, args=[arg(ctx) if callable(arg) else arg for arg in args])
+
+
+ROUTES = [
+    #tutorial_project/urls.py
+    Route('admin:index', url('admin:index')),
+    Route('register', url('register'), client='anon'),
+    Route('register', url('register'), 'POST', status=302, client='anon', data=lambda ctx: {
+        'username': ctx.unique('new'), 'email': 'new@example.com', 'birthday': '2000-01-01',
+        'password1': 'Sl0w-and-steady', 'password2': 'Sl0w-and-steady',
+    }),
+    Route('login', url('login'), client='anon'),
+    Route('login', url('login'), 'POST', status=302, client='anon', data=lambda ctx: {
+        'username': 'bench', 'password': PASSWORD,
+    }),
+    Route('logout', url('logout'), 'POST', client='fresh'),
+    Route('profile', url('profile')),
+    Route('profile', url('profile'), 'POST', status=302, data=lambda ctx: {
+        'username': 'bench', 'email': 'bench@example.com', 'birthday': ctx.user.profile.birthday.isoformat(),
+    }),
+    Route('password_change', url('password_change')),
+    Route('password_change_done', url('password_change_done')),
+    Route('password_reset', url('password_reset'), client='anon'),
+    Route('password_reset', url('password_reset'), 'POST', status=302, client='anon', data=lambda ctx: {
+        'email': 'bench@example.com',
+    }),
+    Route('password_reset_done', url('password_reset_done'), client='anon'),
+    Route('password_reset_confirm', reset_link, status=302, client='anon'), #a valid link redirects to the form
+    Route('password_reset_complete', url('password_reset_complete'), client='anon'),
+    Route('user-list', url('user-list')),
+    Route('media', url('media', 'bench/picture0.png')),
+    #blog/urls.py
+    Route('blog-home', url('blog-home')),
+    Route('user-posts', url('user-posts', 'bench')),
+    #follow and unfollow in turns, following copies their recent posts into the timeline
+    Route('user-follow', url('user-follow', 'user1'), 'POST', status=302, data=lambda ctx: {
+        'follow': str(next(ctx.counter) % 2),
+    }),
+    Route('post-timeline', url('post-timeline')),
+    Route('post-detail', url('post-detail', lambda ctx: ctx.hot_post.pk)),
+    Route('post-detail', url('post-detail', lambda ctx: ctx.hot_post.pk), 'POST', status=302, data=lambda ctx: {
+        'content': 'Benchmark comment',
+    }),
+    #no liked=1/0, so the runs alternate between liking and unliking the hot post
+    Route('post-like', url('post-like', lambda ctx: ctx.hot_post.pk), 'POST'),
+    Route('post-create', url('post-create')),
+    Route('post-create', url('post-create'), 'POST', status=302, data=lambda ctx: {
+        'title': 'Benchmark post', 'content': 'Created by the benchmark',
+    }),
+    Route('post-update', url('post-update', lambda ctx: ctx.post.pk)),
+    Route('post-update', url('post-update', lambda ctx: ctx.post.pk), 'POST', status=302, data=lambda ctx: {
+        'title': ctx.unique('Edited '), 'content': 'Edited by the benchmark',
+    }),
+    Route('post-delete', url('post-delete', lambda ctx: ctx.post.pk)),
+    Route('post-delete', lambda ctx: url('post-delete', ctx.new_post().pk)(ctx), 'POST', status=302),
+    Route('comment-update', url('comment-update', lambda ctx: ctx.hot_post.pk, lambda ctx: ctx.comment.pk)),
+    Route(
+        'comment-update', url('comment-update', lambda ctx: ctx.hot_post.pk, lambda ctx: ctx.comment.pk), 'POST',
+        status=302, data=lambda ctx: {'content': ctx.unique('Edited comment ')},
+    ),
+    Route('comment-delete', url('comment-delete', lambda ctx: ctx.hot_post.pk, lambda ctx: ctx.comment.pk)),
+    Route(
+        'comment-delete', lambda ctx: url('comment-delete', ctx.hot_post.pk, ctx.new_comment().pk)(ctx), 'POST',
+        status=302,
+    ),
+    Route('post-search', lambda ctx: url('post-search')(ctx) + '?q=lorem+ipsum'),
+    Route('blog-about', url('blog-about')),
+    Route('api-posts', url('api-posts')),
+    Route('api-posts-export', url('api-posts-export')),
+    Route('api-post-comments', url('api-post-comments', lambda ctx: ctx.hot_post.pk)),
+    Route('api-comments-export', url('api-comments-export')),
+    #gallery/urls.py
+    Route('gallery-home', url('gallery-home')),
+    Route('gallery-photos', url('gallery-photos')),
+    Route('upload-photo', url('upload-photo')),
+    Route('upload-photo', url('upload-photo'), 'POST', status=302, data=lambda ctx: {
+        'title': 'Upload', 'image': ctx.upload(),
+    }),
+]
+
+
+def url_names(patterns):
+    #names of all the urls of the site, the whole admin counts as its index page
+    from django.urls import URLResolver
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace == 'admin':
+                yield 'admin:index'
+            else:
+                yield from url_names(pattern.url_patterns)
+        elif pattern.name:
+            yield pattern.name
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else float('nan')
+
+
+def request(client, route, ctx, count_queries=False):
+    #prepares outside the timer, returns (seconds, queries, response) with a streamed body fully read inside it
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    path = route.path(ctx)
+    data = route.data(ctx) if route.data else {}
+    if route.client != 'user':
+        #one client per kind, emptied each time: a new Client would also load the middleware again on its first request
+        client = ctx.clients.setdefault(route.client, Client())
+        client.cookies.clear()
+        if route.client == 'fresh':
+            client.force_login(ctx.user)
+    with CaptureQueriesContext(connection) if count_queries else nullcontext() as queries:
+        started = time.perf_counter()
+        response = client.post(path, data) if route.method == 'POST' else client.get(path, data)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        elapsed = time.perf_counter() - started
+    #read the count now, the next request clears the log captured_queries points into
+    return elapsed, len(queries) if count_queries else None, response
+
+
+def measure(route, client, ctx, requests, warmup):
+    for _ in range(warmup): #fills caches, compiles templates, the first request of a route is never representative
+        request(client, route, ctx)
+    _, queries, response = request(client, route, ctx, count_queries=True)
+    if response.status_code != route.status:
+        raise SystemExit(f'{route.key} answered {response.status_code}, expected {route.status}')
+    latencies = [request(client, route, ctx)[0] for _ in range(requests)]
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        'p50': round(percentile(latencies, 0.50), 3),
+        'p95': round(percentile(latencies, 0.95), 3),
+        'p99': round(percentile(latencies, 0.99), 3),
+        'rps': round(len(latencies) / total, 1),
+        'queries': queries,
+    }
+
+
+def regressions(key, result, baseline, tolerance, slack_ms):
+    #what got worse than the baseline, empty when the route is fine or new
+    expected = baseline.get(key)
+    if expected is None:
+        return []
+    problems = []
+    if result['queries'] > expected['queries']:
+        problems.append(f"queries {expected['queries']} -> {result['queries']}")
+    allowed = expected['p95'] * (1 + tolerance) + slack_ms
+    if result['p95'] > allowed:
+        problems.append(f"p95 {expected['p95']:.1f} -> {result['p95']:.1f} ms (allowed {allowed:.1f})")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--comments', type=int, default=20000)
+    parser.add_argument('--likes', type=int, default=20000)
+    parser.add_argument('--follows', type=int, default=20, help='Users each user follows')
+    parser.add_argument('--images', type=int, default=10, help='Distinct pictures for profiles and photos')
+    parser.add_argument('--photos', type=int, default=60, help='Gallery photos')
+    parser.add_argument('--requests', type=int, default=50, help='Timed requests per route')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', nargs='+', metavar='URL_NAME', help='Benchmark only these url names')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Write this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed p95 slowdown, 0.5 = 50%%')
+    parser.add_argument('--slack-ms', type=float, default=2.0, help='Allowed p95 slowdown on top, in ms')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='blog-route-bench-')
+    try:
+        setup_django(workdir)
+        from django.test import Client
+        from django.urls import get_resolver
+
+        missing = set(url_names(get_resolver().url_patterns)) - {route.name for route in ROUTES}
+        if missing:
+            raise SystemExit(f'No benchmark for: {", ".join(sorted(missing))}, add them to ROUTES')
+
+        started = time.perf_counter()
+        ctx = Context(generate(args))
+        print(
+            f'{args.users} users, {args.posts} posts, {args.comments} comments, {args.likes} likes '
+            f'(built in {time.perf_counter() - started:.0f}s), {args.requests} requests per route\n'
+        )
+        client = Client()
+        client.force_login(ctx.user)
+
+        baseline = json.loads(args.baseline.read_text())['routes'] if args.baseline.exists() else {}
+        results, failed = {}, []
+        print(f'{"route":<30} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"req/s":>8} {"queries":>8}')
+        for route in ROUTES:
+            if args.only and route.name not in args.only:
+                continue
+            result = results[route.key] = measure(route, client, ctx, args.requests, args.warmup)
+            problems = [] if args.save_baseline else regressions(
+                route.key, result, baseline, args.tolerance, args.slack_ms,
+            )
+            note = 'new' if baseline and route.key not in baseline else 'REGRESSION: ' + ', '.join(problems) if problems else ''
+            print(
+                f'{route.key:<30} {result["p50"]:>8.1f} {result["p95"]:>8.1f} {result["p99"]:>8.1f} '
+                f'{result["rps"]:>8.0f} {result["queries"]:>8}  {note}'
+            )
+            if problems:
+                failed.append(route.key)
+
+        if args.save_baseline:
+            routes = {**baseline, **results} if args.only else results
+            args.baseline.write_text(json.dumps({'routes': routes}, indent=2, sort_keys=True) + '\n')
+            print(f'\nSaved the baseline to {args.baseline}')
+        elif failed:
+            print(f'\n{len(failed)} route(s) regressed against {args.baseline}')
+            sys.exit(1)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
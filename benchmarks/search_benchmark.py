@@ -0,0 +1,118 @@
+"""
+Compares post search with the FTS5 index against the icontains (LIKE '%word%') scan it replaces.
+
+Builds a throwaway SQLite database per size with the same blog_post columns and the same FTS5 table and triggers
+as blog/search.py, fills it with synthetic posts (zipf word frequencies) and times the first results page for
+common and for rare search words.
+
+How to read it: icontains has to look at every row until it has found a page of matches, so it is quick for words
+that are everywhere and scans the whole table for rare ones, growing linearly with the table. FTS5 goes straight to
+the matching rows through the index, so rare words stay under a millisecond at any size. Ranking by bm25 has to score
+every match before it can return the best 13, which is the price of relevance ordering on very common words.
+
+    python benchmarks/search_benchmark.py                      # 100k and 1M posts
+    python benchmarks/search_benchmark.py --posts 20000 --queries 50
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tutorial_project.settings')
+
+import django
+
+django.setup()
+
+from blog.search import FTS_SCHEMA, FTS_TABLE, RANK, search_terms
+
+PAGE = 13
+WORDS = [f'w{i:05d}' for i in range(20000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(WORDS) + 1)))
+
+#roughly what Post.objects.filter(Q(title__icontains=w) | Q(content__icontains=w)).order_by('-last_updated')[:13] runs
+ICONTAINS_SQL = (
+    "SELECT id FROM blog_post WHERE title LIKE ? ESCAPE '\\' OR content LIKE ? ESCAPE '\\' "
+    "ORDER BY last_updated DESC, id DESC LIMIT ?"
+)
+FTS_SQL = f'SELECT rowid, {RANK} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? ORDER BY {RANK}, rowid LIMIT ?'
+#same match without ranking, for comparison with icontains which isn't ranked either
+FTS_NEWEST_SQL = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? ORDER BY rowid DESC LIMIT ?'
+
+
+def sentence(rng, words):
+    #zipf word frequencies (the n-th most common word shows up 1/n as often), like real text
+    return ' '.join(rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=words))
+
+
+def build(path, posts, rng):
+    db = sqlite3.connect(path)
+    db.execute(
+        'CREATE TABLE blog_post (id INTEGER PRIMARY KEY, title TEXT, content TEXT, last_updated TEXT)'
+    )
+    db.execute('CREATE INDEX blog_post_updated_id_idx ON blog_post (last_updated, id)')
+    for statement in FTS_SCHEMA:
+        db.execute(statement)
+    batch = 10000
+    for start in range(0, posts, batch):
+        rows = [
+            (sentence(rng, 6), sentence(rng, 60), f'2024-01-01 00:00:{i:09d}')
+            for i in range(start, min(start + batch, posts))
+        ]
+        db.executemany('INSERT INTO blog_post (title, content, last_updated) VALUES (?, ?, ?)', rows)
+        db.commit()
+    db.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    db.commit()
+    return db
+
+
+def timed(db, sql, params):
+    started = time.perf_counter()
+    db.execute(sql, params).fetchall()
+    return (time.perf_counter() - started) * 1000
+
+
+def run(posts, queries, seed):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        db = build(os.path.join(tmp, 'bench.sqlite3'), posts, rng)
+        print(f'\n{posts:,} posts (built in {time.perf_counter() - started:.0f}s)')
+
+        buckets = {
+            'common': rng.choices(WORDS[:50], k=queries), #in a good share of all posts
+            'rare': rng.choices(WORDS[2000:], k=queries), #in a handful of posts
+        }
+        for bucket, terms in buckets.items():
+            results = {name: [] for name in ('icontains', 'fts5 bm25', 'fts5 newest')}
+            for term in terms:
+                pattern = f'%{term}%'
+                results['icontains'].append(timed(db, ICONTAINS_SQL, (pattern, pattern, PAGE)))
+                results['fts5 bm25'].append(timed(db, FTS_SQL, (search_terms(term), PAGE)))
+                results['fts5 newest'].append(timed(db, FTS_NEWEST_SQL, (search_terms(term), PAGE)))
+            for name, samples in results.items():
+                samples.sort()
+                p95 = samples[max(int(len(samples) * 0.95) - 1, 0)]
+                print(f'  {bucket:<7} {name:<12} median {statistics.median(samples):8.2f} ms   p95 {p95:8.2f} ms')
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    for posts in args.posts:
+        run(posts, args.queries, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Multi-process stress test of the SQLite settings: several processes post comments while others read the feed.
+
+Each profile gets a throwaway database with the app's tables and some posts. Writer processes add comments to a
+handful of posts inside transaction.atomic(), reading the post first and then saving the comment (Comment.save also
+bumps Post.comment_count), the shape of any view that looks something up and then writes in one transaction.
+Reader processes run the feed query. All of them run at once for --duration seconds.
+
+  default  sqlite as django sets it up out of the box: rollback journal, deferred transactions, 5s busy timeout
+  tuned    DATABASES['default'] from tutorial_project/settings.py: WAL, synchronous=NORMAL, BEGIN IMMEDIATE,
+           20s busy timeout, mmap and a bigger page cache
+
+What to look for: "locked" counts writes that failed with "database is locked". A deferred transaction starts as a
+reader and has to upgrade to a writer, when another process holds the write lock that upgrade fails immediately
+whatever the busy timeout is, so the default profile loses writes as soon as writers collide. With BEGIN IMMEDIATE
+the lock is taken up front, where the busy timeout applies, so the tuned profile should have none. Read latency shows
+readers blocking behind writers with the rollback journal, with WAL they don't. At the end the comment counters are
+checked against the real number of comments, they must match in both profiles (a failed write rolls back its
+counter update too).
+
+    python benchmarks/sqlite_stress.py
+    python benchmarks/sqlite_stress.py --writers 8 --readers 8 --duration 20
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SETTINGS = '''
+from tutorial_project.settings import *
+
+DATABASES['default']['NAME'] = {db!r}
+if {profile!r} == 'default':
+    DATABASES['default'] = {{'ENGINE': 'django.db.backends.sqlite3', 'NAME': {db!r}}}
+'''
+HOT_POSTS = 5
+
+
+def setup_django(workdir):
+    sys.path[:0] = [workdir, str(ROOT)]
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'stress_settings'
+    import django
+    django.setup()
+
+
+def prepare(workdir, profile, posts):
+    db = os.path.join(workdir, 'stress.sqlite3')
+    Path(workdir, 'stress_settings.py').write_text(SETTINGS.format(db=db, profile=profile))
+    setup_django(workdir)
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from blog.models import Post
+
+    call_command('migrate', verbosity=0)
+    authors = [User.objects.create_user(username=f'user{i}') for i in range(20)]
+    Post.objects.bulk_create(
+        Post(title=f'Post {i}', content='Lorem ipsum dolor sit amet. ' * 10, author=authors[i % len(authors)])
+        for i in range(posts)
+    )
+
+
+def writer(args):
+    workdir, number, duration = args
+    setup_django(workdir)
+    from django.contrib.auth.models import User
+    from django.db import OperationalError, transaction
+    from blog.models import Comment, Post
+
+    user = User.objects.get(username=f'user{number % 20}')
+    posts = list(Post.objects.order_by('-id').values_list('id', flat=True)[:HOT_POSTS])
+    done = locked = 0
+    latencies = []
+    stop_at = time.monotonic() + duration
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                post = Post.objects.get(pk=posts[done % len(posts)]) #read first, like a view inside a transaction
+                Comment(post=post, user=user, content='Stress test comment').save()
+            done += 1
+            latencies.append(time.perf_counter() - started)
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+    return 'write', done, locked, latencies
+
+
+def reader(args):
+    workdir, number, duration = args
+    setup_django(workdir)
+    from django.db import OperationalError
+    from blog.models import Post
+
+    done = locked = 0
+    latencies = []
+    stop_at = time.monotonic() + duration
+    while time.monotonic() < stop_at:
+        started = time.perf_counter()
+        try:
+            list(Post.objects.select_related('author__profile').order_by('-last_updated', '-id')[:13])
+            done += 1
+            latencies.append(time.perf_counter() - started)
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+    return 'read', done, locked, latencies
+
+
+def worker(args):
+    role = args[0]
+    return (writer if role == 'write' else reader)(args[1:])
+
+
+def check_counters(workdir):
+    setup_django(workdir)
+    from blog.models import Post, recount_post_counters
+    return recount_post_counters(Post.objects.all())
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else float('nan')
+
+
+def run(profile, args):
+    workdir = tempfile.mkdtemp(prefix=f'blog-sqlite-{profile}-')
+    ctx = multiprocessing.get_context('spawn') #fresh interpreters, no database connection inherited from the parent
+    try:
+        with ctx.Pool(1) as pool:
+            pool.apply(prepare, (workdir, profile, args.posts))
+        jobs = [('write', workdir, i, args.duration) for i in range(args.writers)]
+        jobs += [('read', workdir, i, args.duration) for i in range(args.readers)]
+        with ctx.Pool(len(jobs)) as pool:
+            results = pool.map(worker, jobs)
+        with ctx.Pool(1) as pool:
+            drifted = pool.apply(check_counters, (workdir,))
+
+        for role in ('write', 'read'):
+            done = sum(result[1] for result in results if result[0] == role)
+            locked = sum(result[2] for result in results if result[0] == role)
+            latencies = [latency for result in results if result[0] == role for latency in result[3]]
+            print(
+                f'{profile:<8} {role + "s":<7} {done / args.duration:>9.0f} {locked:>8} '
+                f'{percentile(latencies, 0.50):>9.1f} {percentile(latencies, 0.99):>9.1f}'
+            )
+        print(f'{profile:<8} posts with wrong comment counters: {drifted}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--profiles', nargs='+', choices=['default', 'tuned'], default=['default', 'tuned'])
+    args = parser.parse_args()
+
+    print(f'{args.writers} writer and {args.readers} reader processes, {args.duration:g}s per profile\n')
+    print(f'{"profile":<8} {"op":<7} {"per sec":>9} {"locked":>8} {"p50 ms":>9} {"p99 ms":>9}')
+    for profile in args.profiles:
+        run(profile, args)
+
+
+if __name__ == '__main__':
+    main()
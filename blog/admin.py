@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import Post, Comment, Like
+from .models import Post, Comment, Like, Follow
 
 #we register our models(eg = post) here so that they show up in the admin page
 
 admin.site.register(Post)
 admin.site.register(Comment)
 admin.site.register(Like)
+admin.site.register(Follow)
@@ -0,0 +1,159 @@
+import json
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views import View
+from .models import Post, Comment
+from .pagination import CursorPaginator
+
+#read only json api for integrations, so they don't have to scrape home.html
+#
+#  GET /api/posts/?cursor=...                   newest first, a page at a time: {"results": [...], "next": url or null}
+#  GET /api/posts/<pk>/comments/?cursor=...     a post's comments, oldest first, same shape
+#  GET /api/posts/export/                       every post as NDJSON (one json object per line), oldest first
+#  GET /api/comments/export/                    every comment as NDJSON
+#
+#the pages use the same cursor pagination as the feeds, the exports stream rows from the database in chunks
+#with .iterator() and write them out as they come, so exporting the whole table takes the same memory as a few rows
+#the post records have a user_id so an export can be fed straight back into `manage.py load_posts`
+
+EXPORT_CHUNK_SIZE = 2000
+
+#fields of the rows, read with values() so no model instances are built for the exports
+POST_FIELDS = ('id', 'title', 'content', 'author_id', 'author__username', 'date_posted', 'last_updated', 'like_count', 'comment_count')
+COMMENT_FIELDS = ('id', 'post_id', 'user_id', 'user__username', 'content', 'commented_at')
+
+def post_record(row):
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'content': row['content'],
+        'user_id': row['author_id'],
+        'author': row['author__username'],
+        'date_posted': row['date_posted'],
+        'last_updated': row['last_updated'],
+        'like_count': row['like_count'],
+        'comment_count': row['comment_count'],
+    }
+
+def comment_record(row):
+    return {
+        'id': row['id'],
+        'post_id': row['post_id'],
+        'user_id': row['user_id'],
+        'user': row['user__username'],
+        'content': row['content'],
+        'commented_at': row['commented_at'],
+    }
+
+def dumps(record):
+    return json.dumps(record, cls=DjangoJSONEncoder, separators=(',', ':')) #datetimes as ISO 8601
+
+def _lookup(obj, field):
+    #'author__username' -> obj.author.username, the related objects are already there from select_related
+    for name in field.split('__'):
+        obj = getattr(obj, name)
+    return obj
+
+
+class APIView(LoginRequiredMixin, View):
+    raise_exception = True #403 for anonymous clients instead of a redirect to the login page
+    http_method_names = ['get', 'head', 'options']
+
+
+class CursorListAPIView(APIView):
+    queryset = None
+    fields = ()
+    per_page = 50
+    max_per_page = 200
+    ordering = None
+
+    def get_queryset(self):
+        #like ListView: set queryset, or override this when it depends on the request
+        if self.queryset is None:
+            raise ImproperlyConfigured(f'{type(self).__name__} needs a queryset or a get_queryset()')
+        return self.queryset.all()
+
+    def to_record(self, row):
+        return {field: _lookup(row, field) for field in self.fields}
+
+    def get(self, request, *args, **kwargs):
+        try:
+            per_page = min(int(request.GET.get('per_page', self.per_page)), self.max_per_page)
+        except ValueError:
+            per_page = self.per_page
+        paginator = CursorPaginator(self.get_queryset(), max(per_page, 1), self.ordering)
+        try:
+            page = paginator.page(request.GET.get('cursor'))
+        except ValueError:
+            raise Http404('Invalid cursor')
+        next_url = None
+        if page.has_next():
+            query = request.GET.copy()
+            query['cursor'] = page.next_cursor
+            next_url = f'{request.path}?{query.urlencode()}'
+        results = [self.to_record(row) for row in page]
+        return JsonResponse({'results': results, 'next': next_url})
+
+
+class PostListAPIView(CursorListAPIView):
+    queryset = Post.objects.select_related('author')
+    fields = POST_FIELDS
+    ordering = ('-last_updated', '-id') #same order and index as the home page
+
+    def to_record(self, post):
+        record = post_record(super().to_record(post))
+        record['url'] = reverse('post-detail', kwargs={'pk': post.pk})
+        return record
+
+
+class CommentListAPIView(CursorListAPIView):
+    fields = COMMENT_FIELDS
+    ordering = ('commented_at', 'id') #same order and index as the comments on the detail page
+
+    def get_queryset(self):
+        post = get_object_or_404(Post.objects.only('pk'), pk=self.kwargs['pk'])
+        return post.post_comment.select_related('user')
+
+    def to_record(self, comment):
+        return comment_record(super().to_record(comment))
+
+
+class ExportAPIView(APIView):
+    queryset = None
+    fields = ()
+
+    def to_record(self, row):
+        return row #the values() dict as it is
+
+    def rows(self):
+        #a server side cursor on postgres, chunks of EXPORT_CHUNK_SIZE rows fetched at a time on sqlite
+        return self.queryset.values(*self.fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    def get(self, request, *args, **kwargs):
+        lines = (dumps(self.to_record(row)) + '\n' for row in self.rows())
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="{self.filename}"'
+        return response
+
+
+class PostExportAPIView(ExportAPIView):
+    queryset = Post.objects.order_by('id')
+    fields = POST_FIELDS
+    filename = 'posts.ndjson'
+
+    def to_record(self, row):
+        return post_record(row)
+
+
+class CommentExportAPIView(ExportAPIView):
+    queryset = Comment.objects.order_by('id')
+    fields = COMMENT_FIELDS
+    filename = 'comments.ndjson'
+
+    def to_record(self, row):
+        return comment_record(row)
@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
+from django.db.models import Exists, OuterRef
+from django.http import Http404
+from django.shortcuts import render
+from .cards import render_post_cards
+from .conditional import (
+    COMMENT_STAMP_FIELDS, add_validators, apage_stamps, make_etag, not_modified, post_last_modified, post_stats, wants_validators,
+)
+from .forms import CommentForm
+from .models import Comment, Follow, Post, aliked_post_ids
+from .pagination import CursorPaginator
+from .views import PostDetailView, PostListView, UserPostListView
+
+#async versions of the busiest read pages: the feed, a user's feed and the post detail page
+#they do the same work as the class based views in blog/views.py, but every query goes through django's async orm
+#(aget, afirst, aaggregate, async for) so under an ASGI server (uvicorn, daphne...) a request waiting on the database
+#doesn't tie up a thread, the sync views get run in a thread pool one by one through sync_to_async instead
+#
+#they're used when ROOT_URLCONF = 'tutorial_project.urls_async', the normal urls.py keeps the sync views for WSGI
+#
+#everything the templates need is fetched before rendering (the user, select_related authors and profiles),
+#django's template engine is synchronous, so rendering can't be allowed to run a query of its own
+#(it would fail with SynchronousOnlyOperation), it's plain cpu work on data that is already in memory
+#these always use cursor pagination, BLOG_PAGINATION = 'offset' only applies to the sync views
+
+async def _load_user(request):
+    #login_required already awaited request.auser(), put that user where templates and context processors look
+    request.user = await request.auser()
+    return request.user
+
+async def _render_conditionally(request, name, stats, last_modified, render_page):
+    #blog/conditional.py for async views: 304 if the client has this version of the page, else render it
+    if stats is None or not wants_validators(request):
+        return await render_page()
+    etag = make_etag(request, name, list(stats.values()))
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = await render_page()
+    return add_validators(response, etag, last_modified)
+
+async def _feed(request, queryset, template_name, variant, name, extra_context, extra_stats=()):
+    paginator = CursorPaginator(queryset, PostListView.paginate_by, PostListView.cursor_ordering)
+    token = request.GET.get('cursor')
+    try:
+        window = paginator.window(token)
+    except ValueError:
+        raise Http404('Invalid cursor')
+    liked_ids = await aliked_post_ids(request.user, window)
+    stats = {'rows': await apage_stamps(window), 'liked': sorted(liked_ids)} #the like buttons, see PageConditionalMixin
+    stats['extra'] = list(extra_stats)
+
+    async def render_page():
+        page = await paginator.apage(token)
+        context = {
+            'posts': page.object_list, 'page_obj': page, 'is_paginated': page.has_other_pages(), 'cursor_pagination': True,
+            'cards': render_post_cards(page.object_list, variant, liked_ids), **extra_context,
+        }
+        return render(request, template_name, context)
+
+    return await _render_conditionally(request, name, stats, None, render_page) #the feeds only get an ETag
+
+@login_required
+async def post_list(request):
+    await _load_user(request)
+    queryset = Post.objects.select_related('author__profile')
+    return await _feed(request, queryset, PostListView.template_name, 'feed', 'post_list', {})
+
+@login_required
+async def user_posts(request, username):
+    await _load_user(request)
+    try:
+        users = User.objects.annotate(followed=Exists(Follow.objects.filter(follower=request.user, followee=OuterRef('pk'))))
+        author = await users.aget(username=username)
+    except User.DoesNotExist:
+        raise Http404('No such user')
+    queryset = Post.objects.filter(author=author).select_related('author__profile')
+    #user_posts.html reads the username from view.kwargs like it does for the class based view
+    extra = {'view': SimpleNamespace(kwargs={'username': username}), 'author': author}
+    return await _feed(request, queryset, UserPostListView.template_name, 'user', 'user_posts', extra, [author.followed])
+
+@login_required
+async def post_detail(request, pk):
+    await _load_user(request)
+    if request.method not in ('GET', 'HEAD'):
+        #comments are posted rarely compared to reads, the sync view handles them (and anything else) in a thread
+        return await sync_to_async(PostDetailView.as_view())(request, pk=pk)
+
+    stats = await post_stats(Post.objects, pk, request.user).afirst()
+    if stats is None:
+        raise Http404('No post found')
+    shown = CursorPaginator(Comment.objects.filter(post_id=pk), PostDetailView.comments_per_page, ('commented_at', 'id'))
+    try:
+        window = shown.window(request.GET.get('comments'))
+    except ValueError:
+        raise Http404('Invalid cursor')
+    stats['comments'] = await apage_stamps(window, COMMENT_STAMP_FIELDS) #the comments shown, see blog/conditional.py
+
+    async def render_page():
+        post = await Post.objects.select_related('author__profile').aget(pk=pk)
+        comments = post.post_comment.select_related('user')
+        paginator = CursorPaginator(comments, PostDetailView.comments_per_page, ('commented_at', 'id'))
+        try:
+            page = await paginator.apage(request.GET.get('comments'))
+        except ValueError:
+            raise Http404('Invalid cursor')
+        context = {'object': post, 'post': post, 'form': CommentForm(), 'comments': page, 'liked': stats['liked']}
+        return render(request, PostDetailView.template_name, context)
+
+    return await _render_conditionally(request, 'post_detail', stats, post_last_modified(stats), render_page)
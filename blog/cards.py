@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+#fragment cache for the post cards on the feeds (blog/post_card.html)
+#a card only changes when the post, its counters, its author or the author's profile changes, so the finished html
+#is kept in the cache and a feed page is mostly glued together from pre-built cards
+#
+#every card lives under one key per post: blog:post-card:<variant>:<post id>, and blog:post-card:<variant>:<post id>:liked
+#for the card with the like button pressed, which is the one thing on it that depends on who looks at the feed
+#the value is (stamp, html), the stamp is last_updated, the counters and the author's profile version, so an edit, a new
+#like or a new avatar never serves a stale card, also in the processes the signals in blog/signals.py can't reach
+#all the cards of a page are read with one get_many and the missing ones written back with one set_many
+#works the same with LocMemCache and FileBasedCache (values are just pickled tuples)
+
+#how each feed shows the date, the variant is part of the key so the two pages don't share cards
+CARD_DATE_FORMATS = {
+    'feed': 'r',
+    'user': 'F d , Y',
+}
+
+HITS_KEY = 'blog:post-card:hits'
+MISSES_KEY = 'blog:post-card:misses'
+
+def card_cache():
+    return caches[getattr(settings, 'BLOG_CARD_CACHE', 'default')]
+
+def card_key(variant, post_id, liked=False):
+    return f'blog:post-card:{variant}:{post_id}' + (':liked' if liked else '')
+
+def card_stamp(post):
+    #the author's profile version changes with their name and picture, see blog/signals.py
+    profile = getattr(post.author, 'profile', None)
+    return (post.last_updated.isoformat(), post.like_count, post.comment_count, profile and profile.version)
+
+def render_post_cards(posts, variant='feed', liked_ids=frozenset()):
+    #posts should come with author__profile selected, a miss renders the card and that reads both
+    #liked_ids are the posts the user liked (liked_post_ids() in blog/models.py), their cards show the button pressed
+    cache = card_cache()
+    keys = {post.pk: card_key(variant, post.pk, post.pk in liked_ids) for post in posts}
+    cached = cache.get_many(list(keys.values()))
+
+    cards, fresh = [], {}
+    for post in posts:
+        stamp = card_stamp(post)
+        entry = cached.get(keys[post.pk])
+        if entry is not None and entry[0] == stamp:
+            html = entry[1]
+        else:
+            html = render_to_string('blog/post_card.html', {
+                'post': post, 'date_format': CARD_DATE_FORMATS[variant], 'liked': post.pk in liked_ids,
+            })
+            fresh[keys[post.pk]] = (stamp, html)
+        cards.append(mark_safe(html)) #we rendered it ourselves with autoescaping on, so it's safe to output as is
+
+    if fresh:
+        cache.set_many(fresh, getattr(settings, 'BLOG_CARD_CACHE_TIMEOUT', 60 * 60 * 24))
+    count_card_lookups(len(cards) - len(fresh), len(fresh))
+    return cards
+
+def invalidate_post_cards(post_ids):
+    keys = [
+        card_key(variant, post_id, liked)
+        for post_id in post_ids for variant in CARD_DATE_FORMATS for liked in (False, True)
+    ]
+    if keys:
+        card_cache().delete_many(keys)
+
+def _incr(cache, key, amount):
+    if not amount:
+        return
+    try:
+        cache.incr(key, amount)
+    except ValueError: #key doesn't exist yet
+        if not cache.add(key, amount, timeout=None):
+            cache.incr(key, amount) #someone else created it in the meantime
+
+def count_card_lookups(hits, misses):
+    #one increment per page, not per card
+    cache = card_cache()
+    _incr(cache, HITS_KEY, hits)
+    _incr(cache, MISSES_KEY, misses)
+
+def card_cache_stats():
+    cache = card_cache()
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+
+def reset_card_cache_stats():
+    card_cache().delete_many([HITS_KEY, MISSES_KEY])
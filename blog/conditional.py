@@ -0,0 +1,113 @@
+import hashlib
+from calendar import timegm
+
+from django.contrib.messages import get_messages
+from django.db.models import Exists, Max, OuterRef
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import Like, liked_post_ids
+
+#conditional GET for the feeds and the post detail page
+#before rendering anything the view runs one small query over what the page is going to show
+#(a feed: the ids of its rows in order with each one's last_updated, like/comment counters and author's profile version,
+#the detail page: the post's, plus the comments shown and their users' profile versions) and hashes that into an ETag,
+#if the browser or proxy already has that version (If-None-Match) it gets an empty 304 instead
+#
+#only the post detail page sends a Last-Modified (If-Modified-Since) as well, a feed's newest last_updated
+#doesn't move when a post on the page is deleted or its author renamed, so the feeds rely on the ETag alone
+#the profile version (users/models.py) changes with the author's username and picture, which every card shows
+#
+#the pages are different for every user (nav bar, Update/Delete buttons, csrf token in forms),
+#so the user and their csrf secret go into the ETag too, and the response says Cache-Control: no-cache
+#so caches always revalidate instead of guessing how long the page stays fresh
+#the like buttons show which posts the user liked, that's part of the ETag as well: their like and someone else's
+#unlike on the same page leave the counters as they were
+
+def make_etag(request, name, parts):
+    parts = [name, request.user.pk, request.META.get('CSRF_COOKIE', ''), request.GET.urlencode(), *parts]
+    digest = hashlib.md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return quote_etag(digest)
+
+def wants_validators(request):
+    return not len(get_messages(request)) #a pending message has to be rendered, len() doesn't mark it as read
+
+def not_modified(request, etag, last_modified):
+    #the 304 response if the client already has this version, else None
+    return get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+
+def add_validators(response, etag, last_modified):
+    response.headers.setdefault('ETag', etag)
+    if last_modified is not None:
+        response.headers.setdefault('Last-Modified', http_date(_timestamp(last_modified)))
+    patch_cache_control(response, no_cache=True)
+    return response
+
+def _timestamp(last_modified):
+    return timegm(last_modified.utctimetuple()) if last_modified else None
+
+#what each card on a page of posts shows, per row of the page's window in page order: a post deleted from the
+#middle of the page, or one sliding in from the next page, changes the list even when the totals would come out the same
+PAGE_STAMP_FIELDS = ('pk', 'last_updated', 'like_count', 'comment_count', 'author__profile__version')
+#the same for the page of comments under a post, commented_at moves when a comment is edited
+#and the commenter's profile version when they change the name shown next to it
+COMMENT_STAMP_FIELDS = ('pk', 'commented_at', 'user__profile__version')
+
+def page_stamps(window, fields=PAGE_STAMP_FIELDS):
+    return list(window.values_list(*fields))
+
+async def apage_stamps(window, fields=PAGE_STAMP_FIELDS):
+    return [row async for row in window.values_list(*fields)]
+
+#the values a post detail page depends on, one row (or None when the post doesn't exist)
+#with a user, whether they liked the post comes along in the same query
+def post_stats(queryset, pk, user=None):
+    stats = queryset.filter(pk=pk).values(
+        'last_updated', 'like_count', 'comment_count', 'author__profile__version',
+    ).annotate(
+        latest_comment=Max('post_comment__commented_at'),
+    )
+    if user is not None and user.is_authenticated:
+        stats = stats.annotate(liked=Exists(Like.objects.filter(post=OuterRef('pk'), user=user)))
+    return stats.order_by('pk')
+
+def post_last_modified(stats):
+    #editing a comment moves commented_at so that counts too
+    return max(filter(None, [stats['last_updated'], stats['latest_comment']]))
+
+
+class ConditionalGetMixin:
+    def get_validators(self):
+        #returns (list of values the page depends on, last modified datetime or None), or None to skip the conditional handling
+        #views override this, without it the page is just rendered every time
+        return None
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators() if wants_validators(request) else None
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+
+        parts, last_modified = validators
+        etag = make_etag(request, type(self).__name__, parts)
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs) #only now does the page get queried and rendered
+        return add_validators(response, etag, last_modified)
+
+
+class PageConditionalMixin(ConditionalGetMixin):
+    #for the paginated post lists, used together with CursorPaginationMixin
+    def get_validators(self):
+        queryset = self.get_queryset()
+        window = self.page_window(queryset, self.get_paginate_by(queryset))
+        if window is None:
+            return None
+        stamps = page_stamps(window)
+        self.liked_ids = liked_post_ids(self.request.user, window) #kept for the cards, see get_liked_ids()
+        return [stamps, sorted(self.liked_ids)], None #no Last-Modified, see the top of the file
+
+    def get_liked_ids(self, posts):
+        #the posts of the page the user liked, already known when the validators ran
+        if not hasattr(self, 'liked_ids'):
+            self.liked_ids = liked_post_ids(self.request.user, posts)
+        return self.liked_ids
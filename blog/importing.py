@@ -0,0 +1,87 @@
+import json
+
+#streaming readers for the bulk importer (management command load_posts)
+#json.load() would read a multi-gigabyte export into memory in one go, these hand out one record at a time
+#and only ever keep a small window of the file in memory
+
+CHUNK_SIZE = 64 * 1024
+
+def iter_records(fp, fmt='auto'):
+    #fmt is 'json' (one big array like posts.json), 'ndjson' (one object per line) or 'auto' (look at the first character)
+    if fmt == 'auto':
+        first = _peek(fp)
+        fmt = 'json' if first == '[' else 'ndjson'
+    if fmt == 'json':
+        return iter_json_array(fp)
+    if fmt == 'ndjson':
+        return iter_ndjson(fp)
+    raise ValueError(f'Unknown format {fmt!r}')
+
+def _peek(fp):
+    #first non-whitespace character, without losing it (the readers below take care of leading whitespace)
+    buffered = getattr(fp, 'buffer', None)
+    if buffered is not None and hasattr(buffered, 'peek'):
+        head = buffered.peek(CHUNK_SIZE).decode('utf-8', errors='ignore').lstrip('\ufeff \t\r\n')
+        return head[:1]
+    position = fp.tell()
+    head = fp.read(CHUNK_SIZE).lstrip('\ufeff \t\r\n')
+    fp.seek(position)
+    return head[:1]
+
+def iter_ndjson(fp):
+    for line_number, line in enumerate(fp, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Line {line_number}: {e.msg}') from e
+
+def iter_json_array(fp):
+    #walks a top level [ {...}, {...}, ... ] array, decoding one element at a time with raw_decode
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = fp.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk #drop what we already handed out
+        position = 0
+
+    def skip(chars):
+        #moves past whitespace (and the given separators), reading more when the buffer runs out
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in chars:
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    fill()
+    skip('\ufeff \t\r\n')
+    if buffer[position:position + 1] != '[':
+        raise ValueError('Expected a JSON array')
+    position += 1
+
+    while True:
+        skip(' \t\r\n,')
+        if position >= len(buffer):
+            raise ValueError('Unexpected end of file, the array is not closed')
+        if buffer[position] == ']':
+            return
+        while True:
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f'Invalid JSON near character {e.pos}: {e.msg}') from e
+                fill() #the element is cut off at the end of the buffer, read more and try again
+        position = end
+        yield record
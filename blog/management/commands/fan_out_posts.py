@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from blog.models import Post
+from blog.timeline import fan_out_post
+from tutorial_project.replicas import use_primary
+
+#python manage.py fan_out_posts [--chunk-size 500]
+#writes the posts that were never fanned out (from before timelines existed, created in the admin or by load_posts)
+#into their followers' timelines, see blog/timeline.py
+#until then they still show up, merged in when a timeline is read, this just moves them to the cheap path
+#posts of authors with more than TIMELINE_FANOUT_LIMIT followers stay where they are
+#safe to run again and while the site is up, every post is its own short transaction
+
+class Command(BaseCommand):
+    help = 'Fan out posts that are not in their followers\' timelines yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of posts read per query')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        posts = entries = 0
+        last_id = 0
+        with use_primary():
+            while True:
+                #keyset walk over the primary key, posts left unfanned (big authors) don't come round again
+                chunk = list(
+                    Post.objects.filter(fanned_out=False, pk__gt=last_id).order_by('pk')
+                    .only('pk', 'author_id', 'date_posted')[:chunk_size]
+                )
+                if not chunk:
+                    break
+                for post in chunk:
+                    written = fan_out_post(post)
+                    posts += bool(written)
+                    entries += written
+                last_id = chunk[-1].pk
+
+        self.stdout.write(self.style.SUCCESS(f'Fanned out {posts} posts into {entries} timeline entries.'))
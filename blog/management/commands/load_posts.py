@@ -0,0 +1,146 @@
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from blog.importing import iter_records
+from blog.models import Post
+from blog.search import create_search_index, drop_search_triggers, fts_available, index_posts
+
+#python manage.py load_posts posts.json [--format auto|json|ndjson] [--batch-size 5000] [--defer-search-index]
+#loads posts from a posts.json style file: [{"title": ..., "content": ..., "user_id": 1}, ...]
+#or NDJSON (one such object per line), "date_posted" (ISO 8601) is optional
+#
+#the file is read as a stream (blog/importing.py), so its size doesn't matter, and every batch:
+# - looks up all of its user_ids in auth_user with one query
+# - inserts all of its posts with one bulk_create, in one transaction
+#posts whose user doesn't exist are skipped and counted (or stop the import with --strict)
+#with --defer-search-index all the batches go into one transaction instead, see handle()
+
+class Command(BaseCommand):
+    help = 'Bulk load posts from a JSON array or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to load, '-' for stdin")
+        parser.add_argument('--format', choices=['auto', 'json', 'ndjson'], default='auto')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Posts inserted per transaction')
+        parser.add_argument('--strict', action='store_true', help='Stop at the first invalid record or unknown user')
+        parser.add_argument(
+            '--defer-search-index', action='store_true',
+            help='Index the new posts at the end instead of row by row (much faster for big imports), '
+                 'the import then runs in one transaction and holds the write lock until it is done',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        if options['path'] == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(options['path'], encoding='utf-8-sig')
+            except OSError as e:
+                raise CommandError(f'Cannot open {options["path"]}: {e.strerror}')
+
+        #--defer-search-index: no trigger work per inserted row, the new posts are indexed in batches at the end
+        #the whole import then runs in one transaction that drops the triggers and puts them back before committing,
+        #it holds the database's write lock (IMMEDIATE transactions) from the start, so the site's own writes wait
+        #for it (up to the busy timeout) instead of going by unindexed, no other connection ever sees the triggers
+        #missing, and /search/ keeps reading the old index (without the new posts) until the commit
+        #best for big imports at a quiet time, a write that waits longer than the timeout fails with "database is locked"
+        defer_index = options['defer_search_index'] and fts_available()
+
+        self.loaded = self.skipped = 0
+        self.strict = options['strict']
+        self.started = time.monotonic()
+        with stream:
+            records = iter_records(stream, options['format'])
+            if defer_index:
+                with transaction.atomic():
+                    indexed_upto = self.newest_post_id() #nobody else can insert until the commit
+                    drop_search_triggers()
+                    error = self.load_records(records, batch_size)
+                    self.index_new_posts(indexed_upto, batch_size) #also when the import stopped, for what it loaded
+            else:
+                error = self.load_records(records, batch_size)
+        if error is not None:
+            raise CommandError(f'Import stopped after {self.loaded} posts: {error}')
+
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate = self.loaded / elapsed
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {self.loaded} posts in {elapsed:.1f}s ({rate:,.0f} rows/s), skipped {self.skipped}.'
+        ))
+
+    def load_records(self, records, batch_size):
+        #loads batch after batch, returns the ValueError that stopped the import (a broken file, --strict) or None
+        try:
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    return None
+                self.load_batch(batch)
+                elapsed = max(time.monotonic() - self.started, 1e-6)
+                self.stdout.write(f'{self.loaded} posts loaded, {self.skipped} skipped ({self.loaded / elapsed:,.0f} rows/s)')
+        except ValueError as e:
+            return e
+
+    def newest_post_id(self):
+        return Post.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+    def index_new_posts(self, after_id, batch_size):
+        #the posts this import inserted while the triggers were off, in the import's transaction
+        create_search_index()
+        indexed = 0
+        for indexed in index_posts(after_id, self.newest_post_id(), batch_size):
+            pass
+        self.stdout.write(f'Indexed {indexed} new posts for search.')
+
+    def load_batch(self, records):
+        #one query for all the authors of this batch instead of one per post
+        user_ids = {record.get('user_id') for record in records if isinstance(record, dict)}
+        known = set(User.objects.filter(pk__in=[pk for pk in user_ids if isinstance(pk, int)]).values_list('pk', flat=True))
+
+        now = timezone.now()
+        posts = []
+        for record in records:
+            post = self.build_post(record, known, now)
+            if post is None:
+                self.skipped += 1
+            else:
+                posts.append(post)
+
+        with transaction.atomic():
+            Post.objects.bulk_create(posts)
+        self.loaded += len(posts)
+
+    def build_post(self, record, known, now):
+        def reject(reason):
+            if self.strict:
+                raise ValueError(reason)
+            return None
+
+        if not isinstance(record, dict):
+            return reject('every record has to be a JSON object')
+        title, content, user_id = record.get('title'), record.get('content'), record.get('user_id')
+        if not isinstance(title, str) or not isinstance(content, str):
+            return reject(f'record without title/content: {record!r:.80}')
+        if user_id not in known:
+            return reject(f'unknown user_id {user_id!r}')
+        if len(title) > Post._meta.get_field('title').max_length:
+            return reject(f'title too long: {title:.40}...')
+
+        date_posted = now
+        if record.get('date_posted'):
+            date_posted = parse_datetime(str(record['date_posted']))
+            if date_posted is None:
+                return reject(f'invalid date_posted {record["date_posted"]!r}')
+            if timezone.is_naive(date_posted):
+                date_posted = timezone.make_aware(date_posted)
+        return Post(title=title, content=content, author_id=user_id, date_posted=date_posted)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from blog.cards import card_cache_stats, reset_card_cache_stats
+
+#python manage.py post_card_stats [--reset]
+#prints the hit/miss counters of the post card fragment cache (blog/cards.py)
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the post card fragment cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Set the counters back to zero afterwards')
+
+    def handle(self, *args, **options):
+        stats = card_cache_stats()
+        self.stdout.write(f"hits: {stats['hits']}  misses: {stats['misses']}  hit rate: {stats['hit_rate']:.1%}")
+        if options['reset']:
+            reset_card_cache_stats()
+            self.stdout.write('Counters reset.')
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from blog.models import Post
+from blog.search import FTS_TABLE, create_search_index, fts_available
+
+#python manage.py rebuild_search_index
+#empties the full text index and fills it again from blog_post with FTS5's own 'rebuild', in one transaction
+#the transaction holds the write lock (IMMEDIATE transactions) from the start, so no post can be edited or deleted
+#between emptying the index and filling it again: the delete trigger of such a post would remove words the index
+#doesn't have any more, which corrupts it. Writes from the site wait for the rebuild (up to the busy timeout),
+#searches keep reading the old index until it commits
+#also puts back the sync triggers if a table rebuild (some sqlite migrations) dropped them
+
+class Command(BaseCommand):
+    help = 'Rebuild the FTS5 post search index'
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError('Full text search needs SQLite with FTS5, this database searches with icontains instead')
+
+        started = time.monotonic()
+        with transaction.atomic(), connection.cursor() as cursor:
+            create_search_index()
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')") #reads every post, in sqlite itself
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')") #merge the index segments
+            indexed = Post.objects.count()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts in {elapsed:.1f}s.'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from blog.models import Post, recount_post_counters
+from tutorial_project.replicas import use_primary
+
+#python manage.py reconcile_counters [--chunk-size 1000]
+#recounts Post.like_count and Post.comment_count from the Like and Comment tables and fixes the ones that drifted
+#(eg rows changed with raw SQL or a queryset.update() that moved a comment to another post)
+#works through the posts in primary key chunks, each chunk in its own short transaction, so it never locks the
+#whole table and can run while the site is up
+#reads from the primary database, a lagging read replica would hide the newest drift
+
+class Command(BaseCommand):
+    help = 'Repair drift in the denormalized like/comment counters on Post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of posts checked per transaction')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        checked = repaired = 0
+        last_id = 0
+        with use_primary():
+            while True:
+                #keyset walk over the primary key, no OFFSET
+                post_ids = list(
+                    Post.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+                )
+                if not post_ids:
+                    break
+                with transaction.atomic():
+                    repaired += recount_post_counters(Post.objects.filter(pk__in=post_ids))
+                checked += len(post_ids)
+                last_id = post_ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} posts, repaired {repaired}.'))
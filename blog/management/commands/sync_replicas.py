@@ -0,0 +1,42 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+#python manage.py sync_replicas [--every 2]
+#a stand-in for database replication when trying the read replicas locally (tutorial_project/replicas.py):
+#copies the primary sqlite file over every replica in DATABASE_REPLICAS with sqlite's online backup,
+#once, or again every --every seconds so the replica lags behind like a real one would
+#real replicas (eg postgres streaming replication) are kept in sync by the database server instead
+
+def copy_database(source, target):
+    #page by page copy that is safe while the site is reading and writing either file
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database over the read replicas (local stand-in for replication)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0, help='Keep syncing every this many seconds')
+
+    def handle(self, *args, **options):
+        aliases = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not aliases:
+            raise CommandError('No DATABASE_REPLICAS configured (set BLOG_REPLICA_DB)')
+        databases = [connections.settings[alias] for alias in ['default', *aliases]]
+        if any(database['ENGINE'] != 'django.db.backends.sqlite3' for database in databases):
+            raise CommandError('sync_replicas only copies sqlite files, other databases replicate themselves')
+
+        primary = str(databases[0]['NAME'])
+        while True:
+            started = time.monotonic()
+            for alias, database in zip(aliases, databases[1:]):
+                copy_database(primary, str(database['NAME']))
+            self.stdout.write(f'Synced {len(aliases)} replica(s) in {(time.monotonic() - started) * 1000:.0f} ms.')
+            if not options['every']:
+                break
+            time.sleep(options['every'])
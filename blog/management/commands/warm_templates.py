@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from tutorial_project.templating import warm_templates
+
+#python manage.py warm_templates
+#compiles every template once, the way the server processes do at startup (tutorial_project/templating.py),
+#run it when deploying: it fails if a template has a syntax error, before any visitor finds it
+
+class Command(BaseCommand):
+    help = 'Compile every template into the cached loader and report the ones that fail'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        compiled, errors = warm_templates()
+        for name, error in errors.items():
+            self.stderr.write(f'{name}: {error}')
+        if errors:
+            raise CommandError(f'{len(errors)} template(s) failed to compile')
+        self.stdout.write(self.style.SUCCESS(
+            f'Compiled {compiled} templates in {(time.monotonic() - started) * 1000:.0f} ms.'
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_remove_like_total_likes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['last_updated', 'id'], name='blog_post_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'last_updated', 'id'], name='blog_post_author_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:26
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    #existing posts start with the real counts instead of 0
+    Post = apps.get_model('blog', 'Post')
+    Like = apps.get_model('blog', 'Like')
+    Comment = apps.get_model('blog', 'Comment')
+
+    def total(model):
+        rows = model.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(total=Count('pk')).values('total')
+        return Coalesce(Subquery(rows), 0)
+
+    Post.objects.update(like_count=total(Like), comment_count=total(Comment))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_post_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from blog.search import create_search_index, fts_available
+    if fts_available(schema_editor.connection): #FTS5 is SQLite only, other databases search with icontains
+        create_search_index(schema_editor.connection)
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("INSERT INTO blog_post_fts(blog_post_fts) VALUES ('rebuild')") #index the posts we already have
+
+
+def drop_index(apps, schema_editor):
+    from blog.search import drop_search_index, fts_available
+    if fts_available(schema_editor.connection):
+        drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_post_like_count_comment_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
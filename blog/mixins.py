@@ -0,0 +1,23 @@
+from django.contrib.auth.mixins import UserPassesTestMixin
+
+#OwnerRequiredMixin lets only the owner of an object (the author of a post, the writer of a comment) edit or delete it
+#UserPassesTestMixin's test_func and the view's get()/post() both call get_object(), which used to mean two identical
+#lookups per request plus one more for the owner, here the object is fetched once, with owner_field and related_fields
+#joined in, and the same instance is handed to test_func, the view and the template
+
+class OwnerRequiredMixin(UserPassesTestMixin):
+    owner_field = 'author' #foreign key to the user who owns the object
+    related_fields = () #other foreign keys the view or template reads, joined in the same query
+
+    def get_queryset(self):
+        return super().get_queryset().select_related(self.owner_field, *self.related_fields)
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset) #someone asked for a different queryset, don't memoize that
+        if not hasattr(self, '_owned_object'):
+            self._owned_object = super().get_object()
+        return self._owned_object
+
+    def test_func(self):
+        return getattr(self.get_object(), self.owner_field) == self.request.user
@@ -1,4 +1,7 @@
-from django.db import models
+from collections import Counter, defaultdict
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
 from django.contrib.auth.models import User
 
@@ -12,6 +15,17 @@ class Post(models.Model):
     
     last_updated = models.DateTimeField(auto_now=True) #saves every time new update is made
 
+    #denormalized counters, kept in step with Like and Comment rows (see bump_post_counters and blog/signals.py)
+    #so feeds can show and sort by counts without a COUNT over the child tables for every card
+    #run 'python manage.py reconcile_counters' if they ever drift
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    #True once the post is written into its author's followers' timelines (TimelineEntry, see blog/timeline.py)
+    #posts that aren't (authors with very many followers, posts from the admin or load_posts) are merged in when a
+    #timeline is read
+    fanned_out = models.BooleanField(default=False)
+
     #as django provides a way to create user and there is a one-to-many relation between user and post
     #we use a foreign key to establish a relationship
 
@@ -23,6 +37,18 @@ class Post(models.Model):
 
     #need to migrate(in cmd) after changes which is a great way to easily update your database with heavy SQL commands
 
+    class Meta:
+        #composite indexes for cursor pagination, the feed and a user's feed both page on (last_updated, id)
+        #so the database can seek straight to the cursor instead of scanning and sorting the whole table
+        indexes = [
+            models.Index(fields=['last_updated', 'id'], name='blog_post_updated_id_idx'),
+            models.Index(fields=['author', 'last_updated', 'id'], name='blog_post_author_updated_idx'),
+            #only the posts that weren't fanned out, the ones a timeline has to look up by author when it's read
+            models.Index(
+                fields=['author', 'date_posted', 'id'], name='blog_post_not_fanned_out_idx', condition=Q(fanned_out=False),
+            ),
+        ]
+
     def __str__(self): #double underscore is called dunder, these methods are called special/magic methods
         return self.title #for now returning title when instance is called
     
@@ -31,17 +57,59 @@ class Post(models.Model):
     #if we have repr defined but not str, when str is called, it will fallback to repr.
 
     #helper method to easily count number of likes and comments on a post, can be done through related_name
+    #these used to run self.post_likes.count(), now they read the counter columns so they cost no query
     def total_likes(self):
-        return self.post_likes.count()
+        return self.like_count
     
     def total_comments(self):
-        return self.post_comment.count()
-
-class Like(models.Model):
+        return self.comment_count
+
+
+def bump_post_counters(field, deltas):
+    #deltas maps post id -> how much to add (negative to subtract), eg {3: 1} or {3: -2, 7: -1}
+    #F() makes the database do the arithmetic (like_count = like_count + 1), so two requests liking at the same time
+    #can't overwrite each other the way reading the count in python, adding 1 and saving would
+    #posts that need the same change are grouped into one UPDATE
+    #never below 0: a counter that drifted (fixable with reconcile_counters) mustn't make the user's delete fail
+    by_delta = defaultdict(list)
+    for post_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(post_id)
+    for delta, post_ids in by_delta.items():
+        Post.objects.filter(pk__in=post_ids).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+class PostCounterQuerySet(models.QuerySet):
+    #bulk_create doesn't send post_save, so the counter has to be bumped here for the whole batch
+    #(deletes, including bulk and cascade deletes, do send post_delete for every row, see blog/signals.py)
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            deltas = Counter(obj.post_id for obj in objs)
+            if kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts'):
+                #we can't tell which rows were really inserted, so count those posts again
+                recount_post_counters(Post.objects.filter(pk__in=deltas))
+            else:
+                bump_post_counters(self.model.post_counter_field, deltas)
+        return objs
+
+
+class PostCounterMixin:
+    #saving a new like/comment and bumping the post's counter happen in one transaction
+    def save(self, *args, **kwargs):
+        if not self._state.adding: #editing an existing row doesn't touch the counter
+            return super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+class Like(PostCounterMixin, models.Model):
     #defining relationship between likes and post, user
     post = models.ForeignKey(Post, related_name='post_likes', on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    objects = PostCounterQuerySet.as_manager()
+    post_counter_field = 'like_count'
+
     class Meta:
         unique_together = ('post', 'user')
         #this is a meta constraint which makes it so that one user can like a post only once uless they unlike first
@@ -49,16 +117,131 @@ class Like(models.Model):
     def __str__(self):
         return f"Liked by {self.user} on {self.post}"
 
-class Comment(models.Model):
+class Comment(PostCounterMixin, models.Model):
     post = models.ForeignKey(Post, related_name='post_comment', on_delete=models.CASCADE) #sets a null value to pointing user
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     commented_at = models.DateTimeField(auto_now=True)
     content = models.TextField()
 
+    objects = PostCounterQuerySet.as_manager()
+    post_counter_field = 'comment_count'
+
+    class Meta:
+        indexes = [
+            #the comments of a post in order, for the cursor pagination on the post detail page
+            models.Index(fields=['post', 'commented_at', 'id'], name='blog_comment_post_time_idx'),
+        ]
+
     def __str__(self):
         return f"Commented by {self.user} on {self.post}"
 
 
+class Follow(models.Model):
+    #follower sees followee's posts in their timeline (blog/timeline.py)
+    follower = models.ForeignKey(User, related_name='following', on_delete=models.CASCADE)
+    followee = models.ForeignKey(User, related_name='followers', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('follower', 'followee') #also the index for "who does this user follow"
+        indexes = [
+            #the fan-out reads all followers of an author, straight from the index without touching the table
+            models.Index(fields=['followee', 'follower'], name='blog_follow_followee_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=~Q(follower=F('followee')), name='blog_follow_not_self'),
+        ]
 
+    def __str__(self):
+        return f"{self.follower} follows {self.followee}"
 
+class TimelineEntry(models.Model):
+    #one post in one user's timeline, written when the post is fanned out (blog/timeline.py)
+    user = models.ForeignKey(User, related_name='timeline', on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, related_name='timeline_entries', on_delete=models.CASCADE)
+    #post.date_posted, copied here so a page of the timeline is read from the index alone and sorted already
+    posted_at = models.DateTimeField()
 
+    class Meta:
+        unique_together = ('user', 'post') #fanning out twice (a retry, a follow backfill) leaves one entry
+        indexes = [
+            #a page of someone's timeline is one range scan: user = .. AND (posted_at, post_id) < cursor
+            models.Index(fields=['user', 'posted_at', 'post'], name='blog_timeline_user_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post} in {self.user}'s timeline"
+
+
+def set_like(post_id, user, liked):
+    #likes (liked=True) or unlikes a post for user and returns the post's new like_count
+    #raises Post.DoesNotExist when there's no such post, also when it's deleted while this runs
+    #idempotent, liking twice or unliking twice leaves one like or none, so a double click or a retried request is harmless
+    #neither way reads the like first and then decides what to write (two requests could both decide to insert):
+    #a like is INSERT ... ON CONFLICT DO NOTHING against the unique (post, user) constraint, an unlike a plain DELETE,
+    #and the counter only moves by the number of rows the database says the statement wrote, so two requests
+    #racing on the same like can't both count it (django's delete() would send post_delete for what it found before)
+    like_table = connection.ops.quote_name(Like._meta.db_table)
+    post_table = connection.ops.quote_name(Post._meta.db_table)
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            if liked:
+                #inserted from the post row itself, so a missing post inserts nothing instead of breaking the foreign key
+                cursor.execute(
+                    f'INSERT INTO {like_table} (post_id, user_id) SELECT id, %s FROM {post_table} WHERE id = %s '
+                    'ON CONFLICT DO NOTHING',
+                    [user.pk, post_id],
+                )
+                delta = cursor.rowcount
+            else:
+                cursor.execute(f'DELETE FROM {like_table} WHERE post_id = %s AND user_id = %s', [post_id, user.pk])
+                delta = -cursor.rowcount
+            if delta:
+                bump_post_counters('like_count', {post_id: delta})
+            return Post.objects.filter(pk=post_id).values_list('like_count', flat=True).get()
+    except IntegrityError as e:
+        #the post was deleted by another transaction after the insert found it (databases that don't serialize writes)
+        raise Post.DoesNotExist(f'Post {post_id} was deleted') from e
+
+def liked_post_ids(user, posts):
+    #the ids of the posts (eg a feed page) that user liked, in one query: WHERE user_id = .. AND post_id IN (..)
+    #posts is a list of posts or a Post queryset, which then goes into the IN as a subquery
+    query = _liked_query(user, posts)
+    return set(query) if query is not None else set()
+
+async def aliked_post_ids(user, posts):
+    #liked_post_ids for the async views
+    query = _liked_query(user, posts)
+    return {post_id async for post_id in query} if query is not None else set()
+
+def _liked_query(user, posts):
+    if not user.is_authenticated:
+        return None
+    if isinstance(posts, models.QuerySet):
+        post_ids = posts.values('pk')
+    else:
+        post_ids = [post.pk for post in posts]
+        if not post_ids:
+            return None
+    return Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True)
+
+
+def post_counter_subquery(model):
+    #the real number of likes/comments of the outer post, 0 instead of NULL when there are none
+    rows = model.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(rows), 0)
+
+def recount_post_counters(posts):
+    #recounts the counters of a Post queryset from the child tables and fixes the ones that drifted
+    #returns how many posts needed fixing
+    drifted = posts.annotate(
+        real_likes=post_counter_subquery(Like),
+        real_comments=post_counter_subquery(Comment),
+    ).filter(~Q(like_count=F('real_likes')) | ~Q(comment_count=F('real_comments')))
+    post_ids = list(drifted.values_list('pk', flat=True))
+    if post_ids:
+        Post.objects.filter(pk__in=post_ids).update(
+            like_count=post_counter_subquery(Like),
+            comment_count=post_counter_subquery(Comment),
+        )
+    return len(post_ids)
@@ -0,0 +1,185 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+
+#keyset (cursor) pagination, used instead of django's offset Paginator on big tables
+#offset pagination runs a COUNT(*) on every page and makes the database walk past OFFSET rows on deep pages,
+#a cursor remembers the sort key of the last row we showed and asks for rows "after" it, which is an index seek
+#so every page costs the same no matter how deep it is
+
+def encode_cursor(values, reverse=False):
+    #the token is opaque for the client, it's just base64 of the sort key values and the direction
+    payload = json.dumps({'r': int(reverse), 'k': values}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    #returns (values, reverse), raises ValueError for anything we didn't generate
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        values, reverse = payload['k'], bool(payload['r'])
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, TypeError, KeyError) as e:
+        raise ValueError('Invalid cursor') from e
+    if values is not None and not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values, reverse
+
+
+class CursorPage:
+    #mimics the bits of django's Page that templates and ListView use
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, last_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.last_cursor = last_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    #ordering is a tuple of field names that together are unique (always end with the pk), eg ('-last_updated', '-id')
+    #all fields must go the same direction so one composite index can serve both next and previous pages
+    def __init__(self, queryset, per_page, ordering):
+        descending = {field.startswith('-') for field in ordering}
+        if len(descending) != 1:
+            raise ValueError('Cursor ordering fields must all use the same direction')
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip('-') for field in ordering)
+        self.descending = descending.pop()
+
+    def _key(self, obj):
+        #sort key of a row as json friendly values (datetimes become iso strings)
+        values = []
+        for name in self.fields:
+            value = getattr(obj, self.queryset.model._meta.get_field(name).attname)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def _parse(self, values):
+        if len(values) != len(self.fields):
+            raise ValueError('Invalid cursor')
+        parsed = []
+        for name, value in zip(self.fields, values):
+            try:
+                parsed.append(self.queryset.model._meta.get_field(name).to_python(value))
+            except Exception as e:
+                raise ValueError('Invalid cursor') from e
+        return parsed
+
+    def _after(self, values, forward):
+        #builds (a < x) OR (a = x AND b < y) OR ... which the database turns into a range scan on the composite index
+        lookup = 'lt' if self.descending == forward else 'gt' #forward through a descending list means "smaller than"
+        condition = Q()
+        for i, name in enumerate(self.fields):
+            term = Q(**{f'{name}__{lookup}': values[i]})
+            for prev_name, prev_value in zip(self.fields[:i], values[:i]):
+                term &= Q(**{prev_name: prev_value})
+            condition |= term
+        return condition
+
+    def _window(self, token):
+        #returns (queryset of the rows for this page plus one, cursor values, reverse)
+        values, reverse = None, False
+        if token:
+            values, reverse = decode_cursor(token)
+            if values is not None:
+                values = self._parse(values)
+
+        if reverse:
+            #walking backwards: flip the ordering, then flip the rows back before showing them
+            ordering = list(self.fields) if self.descending else [f'-{name}' for name in self.fields]
+        else:
+            ordering = list(self.ordering)
+
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(values, forward=not reverse))
+        return queryset[:self.per_page + 1], values, reverse #one extra row tells us if there's another page, no COUNT needed
+
+    def window(self, token=None):
+        #the unevaluated, sliced queryset behind page(token), eg to aggregate over a page without loading it
+        return self._window(token)[0]
+
+    def page(self, token=None):
+        queryset, values, reverse = self._window(token)
+        return self._page(list(queryset), values, reverse)
+
+    async def apage(self, token=None):
+        #page() for async views, fetches the rows with the async orm
+        queryset, values, reverse = self._window(token)
+        return self._page([row async for row in queryset], values, reverse)
+
+    def _page(self, rows, values, reverse):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if reverse:
+            rows.reverse()
+            has_previous, has_next = has_more, values is not None
+        else:
+            has_previous, has_next = values is not None, has_more
+
+        next_cursor = encode_cursor(self._key(rows[-1])) if rows and has_next else None
+        previous_cursor = encode_cursor(self._key(rows[0]), reverse=True) if rows and has_previous else None
+        #"Last" is simply the first page of the reversed ordering, so it's as cheap as the first page
+        last_cursor = encode_cursor(None, reverse=True) if has_next else None
+        return CursorPage(rows, next_cursor, previous_cursor, last_cursor)
+
+
+class CursorPaginationMixin:
+    #drop-in for ListView, switches paginate_by over to cursor pagination when settings.BLOG_PAGINATION is 'cursor'
+    #set BLOG_PAGINATION = 'offset' to get django's numbered pages back
+    cursor_ordering = ('-last_updated', '-id')
+    cursor_kwarg = 'cursor'
+
+    def uses_cursor_pagination(self):
+        return getattr(settings, 'BLOG_PAGINATION', 'cursor') == 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.uses_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except ValueError:
+            raise Http404('Invalid cursor')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def page_window(self, queryset, page_size):
+        #the rows paginate_queryset() is going to show, as an unevaluated queryset, None if the page parameter is invalid
+        if not self.uses_cursor_pagination():
+            try:
+                number = int(self.request.GET.get(self.page_kwarg) or 1)
+            except ValueError:
+                return None #'last' and garbage, leave those to the paginator
+            if number < 1:
+                return None
+            return queryset[(number - 1) * page_size:number * page_size]
+        try:
+            return CursorPaginator(queryset, page_size, self.cursor_ordering).window(self.request.GET.get(self.cursor_kwarg))
+        except ValueError:
+            return None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cursor_pagination'] = isinstance(context.get('page_obj'), CursorPage)
+        return context
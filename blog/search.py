@@ -0,0 +1,155 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from .models import Post
+from .pagination import CursorPaginator, decode_cursor, encode_cursor
+
+#full text search over Post.title and Post.content with an SQLite FTS5 index
+#blog_post_fts is an "external content" table: it only stores the search index and reads the text from blog_post,
+#the triggers below keep it in step with every insert, update and delete (also bulk_create, queryset.update(), raw sql)
+#results are ranked with bm25 (best match first) and paged with a cursor on (score, id), no OFFSET
+#on databases without FTS5 search falls back to title/content icontains, newest first
+
+FTS_TABLE = 'blog_post_fts'
+
+FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content, content='blog_post', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    #only title/content changes touch the index, counter and last_updated updates don't
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, content ON blog_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+DROP_TRIGGERS = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+]
+
+DROP_SCHEMA = [*DROP_TRIGGERS, f'DROP TABLE IF EXISTS {FTS_TABLE}']
+
+#bm25 weights for (title, content), a word in the title counts more than one in the body
+RANK = f'bm25({FTS_TABLE}, 10.0, 1.0)'
+
+def fts_available(using=connection):
+    return using.vendor == 'sqlite'
+
+def create_search_index(using=connection):
+    #safe to run again, everything is IF NOT EXISTS (rebuild_search_index calls it in case a table rebuild dropped the triggers)
+    with using.cursor() as cursor:
+        for statement in FTS_SCHEMA:
+            cursor.execute(statement)
+
+def drop_search_index(using=connection):
+    with using.cursor() as cursor:
+        for statement in DROP_SCHEMA:
+            cursor.execute(statement)
+
+def drop_search_triggers(using=connection):
+    #stops keeping the index in step but leaves it searchable, for bulk imports (load_posts --defer-search-index)
+    #create_search_index() puts the triggers back, index_posts() adds what was written in the meantime
+    #only ever inside a transaction that does all of that before committing: a post another connection
+    #wrote or edited while the triggers were gone would never be (re)indexed, and deleting it later
+    #would then remove words the index doesn't have, which corrupts it
+    with using.cursor() as cursor:
+        for statement in DROP_TRIGGERS:
+            cursor.execute(statement)
+
+def index_posts(after_id, upto_id, batch_size=5000):
+    #adds the posts with after_id < id <= upto_id to the index, in primary key batches (keyset, no OFFSET) each in
+    #its own transaction, yields the number indexed so far after every batch
+    indexed = 0
+    while True:
+        rows = list(
+            Post.objects.filter(pk__gt=after_id, pk__lte=upto_id).order_by('pk').values_list('pk', 'title', 'content')[:batch_size]
+        )
+        if not rows:
+            return
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (%s, %s, %s)', rows)
+        indexed += len(rows)
+        after_id = rows[-1][0]
+        yield indexed
+
+def search_terms(text):
+    #turns whatever the user typed into a safe FTS5 query: every word quoted (so AND/OR/NEAR/* are just words),
+    #all words required, and the last one matched as a prefix so results show up while typing
+    words = re.findall(r'\w+', text or '')[:16]
+    if not words:
+        return ''
+    quoted = [f'"{word}"' for word in words]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+class SearchPage:
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def search_posts(text, per_page=13, cursor=None):
+    #returns a SearchPage of posts (author and profile selected) for the given search text
+    #raises ValueError for a cursor we didn't hand out
+    if not fts_available():
+        return _search_posts_icontains(text, per_page, cursor)
+
+    match = search_terms(text)
+    if not match:
+        return SearchPage([])
+
+    sql = f'SELECT rowid, {RANK} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+    params = [match]
+    if cursor:
+        values, _ = decode_cursor(cursor)
+        try:
+            score, last_id = float(values[0]), int(values[1])
+        except (TypeError, ValueError, IndexError) as e:
+            raise ValueError('Invalid cursor') from e
+        #bm25 scores are negative, lower is better, so "after" means a higher score (or the same score and a higher id)
+        sql += f' AND ({RANK} > %s OR ({RANK} = %s AND rowid > %s))'
+        params += [score, score, last_id]
+    sql += f' ORDER BY {RANK}, rowid LIMIT %s'
+    params.append(per_page + 1)
+
+    with connection.cursor() as db:
+        db.execute(sql, params)
+        rows = db.fetchall()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor([rows[-1][1], rows[-1][0]])
+
+    posts = Post.objects.select_related('author__profile').in_bulk([post_id for post_id, _ in rows])
+    return SearchPage([posts[post_id] for post_id, _ in rows if post_id in posts], next_cursor)
+
+def _search_posts_icontains(text, per_page, cursor):
+    words = re.findall(r'\w+', text or '')[:16]
+    if not words:
+        return SearchPage([])
+    condition = Q()
+    for word in words:
+        condition &= Q(title__icontains=word) | Q(content__icontains=word)
+    queryset = Post.objects.filter(condition).select_related('author__profile')
+    page = CursorPaginator(queryset, per_page, ('-last_updated', '-id')).page(cursor)
+    return SearchPage(page.object_list, page.next_cursor)
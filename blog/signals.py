@@ -0,0 +1,77 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.dispatch import receiver
+from users.models import Profile
+from .cards import invalidate_post_cards
+from .models import Post, Like, Comment, Follow, bump_post_counters
+from .timeline import backfill_timeline, remove_from_timeline
+
+#keeps Post.like_count and Post.comment_count in step with the Like and Comment tables
+#deletes send post_delete for every row, also queryset.delete() and when a user or post delete cascades
+#(django can't use its fast delete path while a receiver is connected), each one lowers its post's counter by one
+#nothing is carried from one signal to the next, so a delete that fails halfway leaves nothing behind for the next one
+#bulk_create sends nothing, PostCounterQuerySet.bulk_create takes care of that
+
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Comment)
+def increment_post_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw: #raw is True when loading fixtures, the fixture already has the right counts
+        bump_post_counters(sender.post_counter_field, {instance.post_id: 1})
+
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=Comment)
+def decrement_post_counter(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Post) and origin.pk == instance.post_id:
+        return #the post itself is being deleted, there is no counter left to update
+    bump_post_counters(sender.post_counter_field, {instance.post_id: -1})
+
+
+#following someone brings their recent posts into the timeline, unfollowing takes them out (blog/timeline.py)
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline_on_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        backfill_timeline(instance.follower_id, instance.followee_id)
+
+@receiver(post_delete, sender=Follow)
+def clean_timeline_on_unfollow(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, User):
+        return #one of the two users is being deleted, the timeline entries go with their rows
+    remove_from_timeline(instance.follower_id, instance.followee_id)
+
+
+#the cached post cards (blog/cards.py) show the post, the author's name and the author's profile picture
+#a post's own edits and deletes throw its cards away, for the author the cards don't need to be found at all:
+#the author's Profile.version goes up when their name or picture changes, it's part of every card's stamp and the
+#feeds' ETags (blog/conditional.py), so the old cards just stop matching, in every process
+#saves that change nothing a card shows (a login, the birthday) leave it alone and keep the cards and ETags valid
+
+CARD_PROFILE_FIELDS = {'image', 'renditions'} #the picture and its resized versions (the srcset)
+
+def bump_author_version(user_id):
+    Profile.objects.filter(user_id=user_id).update(version=F('version') + 1)
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_card(sender, instance, **kwargs):
+    invalidate_post_cards([instance.pk])
+
+@receiver(post_save, sender=Profile)
+def bump_version_on_picture_change(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return #a new user has no posts yet
+    if getattr(instance, 'saved_changes', CARD_PROFILE_FIELDS) & CARD_PROFILE_FIELDS:
+        bump_author_version(instance.user_id)
+
+@receiver(post_save, sender=User)
+def bump_version_on_rename(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    if instance.__dict__.get('username') != getattr(instance, '_loaded_username', None):
+        bump_author_version(instance.pk) #the name is the only thing of the user a card shows
+        instance._loaded_username = instance.username
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    instance._loaded_username = instance.__dict__.get('username') #not read when deferred, that would be a query
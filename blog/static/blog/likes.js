@@ -0,0 +1,27 @@
+//the like buttons (blog/like_button.html) on the feeds and the post page
+//a click posts the state the button should end up in, liked=1 or liked=0, to /post/<id>/like/ and shows what
+//the server answers, so a double click or a retried request can't flip the like back
+document.addEventListener('click', function (event) {
+    var button = event.target.closest('.like-button');
+    if (!button || button.disabled) {
+        return;
+    }
+    var liked = button.getAttribute('aria-pressed') !== 'true';
+    var token = document.querySelector('#like-form [name=csrfmiddlewaretoken]').value;
+    button.disabled = true;
+    fetch(button.dataset.likeUrl, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: {'X-CSRFToken': token, 'Content-Type': 'application/x-www-form-urlencoded'},
+        body: 'liked=' + (liked ? '1' : '0'),
+    }).then(function (response) {
+        return response.ok ? response.json() : Promise.reject(response.status);
+    }).then(function (data) {
+        button.setAttribute('aria-pressed', data.liked ? 'true' : 'false');
+        button.classList.toggle('active', data.liked);
+        button.querySelector('.like-label').textContent = data.liked ? 'Liked' : 'Like';
+        button.querySelector('.like-count').textContent = data.likes;
+    }).finally(function () {
+        button.disabled = false;
+    });
+});
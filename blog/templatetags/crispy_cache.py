@@ -0,0 +1,57 @@
+from crispy_forms.templatetags.crispy_forms_filters import as_crispy_form
+from django import template
+from django.conf import settings
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+register = template.Library()
+
+#{% load crispy_cache %}
+#{{ form|crispy_cached }}
+#the same html as {{ form|crispy }}, but an empty form (the comment box, register, login, upload...) is rendered by
+#crispy only once per process: it looks the same on every request, so the html is kept and reused
+#a form that shows anything request specific is rendered every time as usual: a submitted form (values, errors)
+#or a form for an existing object (the profile and update pages)
+#initial values (eg a model field's default) are part of the key, so a form is only reused with the same ones
+#the csrf token isn't part of it, it stays in the page template ({% csrf_token %} next to the filter) and is
+#filled in per request like before
+#on when CRISPY_RENDER_CACHE is True (production), off in development so edits to crispy templates show up
+
+MAX_ENTRIES = 256 #a handful of forms times the languages, the limit only guards against odd initial values
+_rendered = {}
+
+def render_key(form):
+    #None for a form that has to be rendered every time
+    instance = getattr(form, 'instance', None)
+    if form.is_bound or (instance is not None and instance.pk is not None):
+        return None
+    #model forms made by the generic views (modelform_factory) are a new class on every request, so the class is
+    #identified by name, model and fields rather than by the class object
+    form_class = type(form)
+    model = getattr(getattr(form, '_meta', None), 'model', None)
+    initial = tuple((name, form.get_initial_for_field(field, name)) for name, field in form.fields.items())
+    key = (
+        f'{form_class.__module__}.{form_class.__qualname__}', model and model._meta.label,
+        form.prefix, form.auto_id, get_language(), initial,
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return None #eg a list as initial value
+    return key
+
+@register.filter
+def crispy_cached(form):
+    key = render_key(form) if getattr(settings, 'CRISPY_RENDER_CACHE', False) else None
+    if key is None:
+        return as_crispy_form(form)
+    html = _rendered.get(key)
+    if html is None:
+        html = as_crispy_form(form)
+        #a form that renders its own token can't be shared
+        if 'csrfmiddlewaretoken' not in html and len(_rendered) < MAX_ENTRIES:
+            _rendered[key] = html
+    return mark_safe(html)
+
+def clear_render_cache():
+    _rendered.clear()
@@ -0,0 +1,35 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+#helpers for tests that guard the number of SQL queries a view runs
+#a view that does a query per row (N+1) looks fine with 2 rows in a test and falls over with 13 per page in production,
+#so the budget check requests the page, adds more rows, requests it again and fails if the count moved
+
+class QueryBudgetMixin:
+    #mix into a django TestCase, eg: class MyTests(QueryBudgetMixin, TestCase)
+
+    def count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data or {})
+        return response, queries
+
+    def assertQueryBudget(self, url, budget, grow=None, method='get', data=None, status_code=None):
+        #budget is the most queries the request may run, grow is a callable that adds rows the page will show
+        #(more posts, more comments...), after which the query count must be exactly the same as before
+        response, queries = self.count_queries(method, url, data)
+        if status_code is not None:
+            self.assertEqual(response.status_code, status_code)
+        executed = [query['sql'] for query in queries.captured_queries]
+        self.assertLessEqual(
+            len(executed), budget,
+            f'{method.upper()} {url} ran {len(executed)} queries, budget is {budget}:\n' + '\n'.join(executed),
+        )
+        if grow is not None:
+            grow()
+            _, more_queries = self.count_queries(method, url, data)
+            self.assertEqual(
+                len(more_queries), len(executed),
+                f'{method.upper()} {url} query count grows with the data ({len(executed)} -> {len(more_queries)}):\n'
+                + '\n'.join(query['sql'] for query in more_queries.captured_queries),
+            )
+        return response
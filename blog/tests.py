@@ -1,3 +1,1124 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock, skipUnless
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.http import HttpResponse
+from django.db.models.signals import pre_delete
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+from .models import Post, Comment, Like, Follow, TimelineEntry, liked_post_ids, set_like
+from .pagination import CursorPaginator, encode_cursor, decode_cursor
+from .testing import QueryBudgetMixin
+from . import importing
+from .search import FTS_TABLE, search_posts, search_terms
+from .timeline import fan_out_post, timeline_page
+from tutorial_project.replicas import PIN_COOKIE, ReplicaPinningMiddleware, ReplicaRouter, use_primary
+from .management.commands.sync_replicas import copy_database
+from tutorial_project.templating import warm_templates
+from .templatetags import crispy_cache
+from .cards import card_cache, card_cache_stats, card_key, render_post_cards, reset_card_cache_stats
+from users.models import Profile
 
 # Create your tests here.
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='writer', password='pass12345')
+        Post.objects.bulk_create(Post(title=f'Post {i}', content='...', author=cls.user) for i in range(30))
+        #half the posts share one timestamp so the id tie-breaker has to do its job
+        ids = list(Post.objects.order_by('id').values_list('id', flat=True))
+        now = timezone.now()
+        Post.objects.filter(id__in=ids[:15]).update(last_updated=now)
+        Post.objects.filter(id__in=ids[15:]).update(last_updated=now - timezone.timedelta(days=1))
+
+    def walk(self, paginator):
+        page = paginator.page()
+        seen = [post.id for post in page]
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            seen += [post.id for post in page]
+        return seen, page
+
+    def test_forward_walk_matches_offset_ordering(self):
+        paginator = CursorPaginator(Post.objects.all(), 13, ('-last_updated', '-id'))
+        seen, _ = self.walk(paginator)
+        expected = list(Post.objects.order_by('-last_updated', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_previous_cursor_returns_previous_page(self):
+        paginator = CursorPaginator(Post.objects.all(), 13, ('-last_updated', '-id'))
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        back = paginator.page(second.previous_cursor)
+        self.assertEqual([p.id for p in back], [p.id for p in first])
+        self.assertFalse(back.has_previous())
+
+    def test_last_cursor_returns_tail(self):
+        paginator = CursorPaginator(Post.objects.all(), 13, ('-last_updated', '-id'))
+        last = paginator.page(paginator.page().last_cursor)
+        expected = list(Post.objects.order_by('-last_updated', '-id').values_list('id', flat=True))[-13:]
+        self.assertEqual([p.id for p in last], expected)
+        self.assertFalse(last.has_next())
+
+    def test_cursor_round_trip_and_garbage(self):
+        self.assertEqual(decode_cursor(encode_cursor([1, 'a'], reverse=True)), ([1, 'a'], True))
+        with self.assertRaises(ValueError):
+            decode_cursor('not-a-cursor')
+
+    def test_feed_views_use_cursor(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('blog-home'))
+        self.assertTrue(response.context['cursor_pagination'])
+        self.assertEqual(len(response.context['posts']), 13)
+        response = self.client.get(reverse('blog-home'), {'cursor': response.context['page_obj'].next_cursor})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('user-posts', args=[self.user.username]), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(BLOG_PAGINATION='offset')
+    def test_offset_mode_still_available(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('blog-home'), {'page': 3})
+        self.assertFalse(response.context['cursor_pagination'])
+        self.assertEqual(response.context['page_obj'].number, 3)
+
+
+#every url in blog/urls.py gets a query budget, and pages that list rows must not grow with the number of rows
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='owner', password='pass12345')
+        cls.other = User.objects.create_user(username='reader', password='pass12345')
+        cls.post = Post.objects.create(title='Hello', content='World', author=cls.user)
+        cls.comment = Comment.objects.create(post=cls.post, user=cls.user, content='First')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def add_posts(self, count=12):
+        #posts by different authors so each card needs its own author and profile
+        authors = [User.objects.create_user(username=f'author{Post.objects.count()}_{i}') for i in range(count)]
+        Post.objects.bulk_create(Post(title='More', content='Hello again', author=author) for author in authors)
+
+    def add_own_posts(self, count=12):
+        Post.objects.bulk_create(Post(title='More', content='...', author=self.user) for _ in range(count))
+
+    def add_comments(self, count=12):
+        users = [User.objects.create_user(username=f'commenter{Comment.objects.count()}_{i}') for i in range(count)]
+        Comment.objects.bulk_create(Comment(post=self.post, user=user, content='...') for user in users)
+
+    def test_home(self):
+        self.assertQueryBudget(reverse('blog-home'), 3, grow=self.add_posts, status_code=200)
+
+    def test_user_posts(self):
+        self.assertQueryBudget(reverse('user-posts', args=[self.user.username]), 4, grow=self.add_own_posts, status_code=200)
+
+    def test_post_detail(self):
+        #the post's stamp, the shown comments' stamps (blog/conditional.py), then the post and the comments
+        self.assertQueryBudget(reverse('post-detail', args=[self.post.pk]), 4, grow=lambda: self.add_comments(30), status_code=200)
+
+    def test_post_detail_comment(self):
+        url = reverse('post-detail', args=[self.post.pk])
+        self.assertQueryBudget(url, 5, method='post', data={'content': 'Nice'}, status_code=302)
+
+    def test_post_create(self):
+        self.assertQueryBudget(reverse('post-create'), 0, status_code=200)
+        #the post, then the fan-out: its author's followers, their timeline entries and the fanned_out flag
+        self.assertQueryBudget(reverse('post-create'), 6, method='post', data={'title': 'T', 'content': 'C'}, status_code=302)
+
+    def test_post_update(self):
+        url = reverse('post-update', args=[self.post.pk])
+        self.assertQueryBudget(url, 1, status_code=200)
+        self.assertQueryBudget(url, 2, method='post', data={'title': 'T', 'content': 'C'}, status_code=302)
+
+    def test_post_delete(self):
+        url = reverse('post-delete', args=[self.post.pk])
+        self.assertQueryBudget(url, 1, status_code=200)
+        self.assertQueryBudget(url, 6, method='post', status_code=302)
+
+    def test_comment_update(self):
+        url = reverse('comment-update', args=[self.post.pk, self.comment.pk])
+        self.assertQueryBudget(url, 1, status_code=200)
+        self.assertQueryBudget(url, 2, method='post', data={'content': 'Edited'}, status_code=302)
+
+    def test_comment_delete(self):
+        url = reverse('comment-delete', args=[self.post.pk, self.comment.pk])
+        self.assertQueryBudget(url, 1, status_code=200)
+        self.assertQueryBudget(url, 3, method='post', status_code=302)
+
+    def test_only_the_owner_gets_in(self):
+        self.client.force_login(self.other)
+        self.assertQueryBudget(reverse('post-update', args=[self.post.pk]), 1, status_code=403)
+        self.assertQueryBudget(reverse('comment-delete', args=[self.post.pk, self.comment.pk]), 1, status_code=403)
+
+    def test_comment_must_belong_to_the_post_in_the_url(self):
+        other_post = Post.objects.create(title='Other', content='...', author=self.user)
+        response = self.client.get(reverse('comment-update', args=[other_post.pk, self.comment.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_search(self):
+        self.assertQueryBudget(reverse('post-search'), 3, grow=self.add_posts, data={'q': 'Hello'}, status_code=200)
+
+    def test_about(self):
+        self.assertQueryBudget(reverse('blog-about'), 0, status_code=200)
+
+    def test_timeline(self):
+        Follow.objects.create(follower=self.user, followee=self.other)
+        def grow():
+            for post in Post.objects.bulk_create(Post(title='More', content='...', author=self.other) for _ in range(12)):
+                fan_out_post(post)
+        #timeline entries, the followees with posts that weren't fanned out, those posts (blog/timeline.py), liked posts
+        self.assertQueryBudget(reverse('post-timeline'), 4, grow=grow, status_code=200)
+
+    def test_follow(self):
+        fan_out_post(Post.objects.create(title='Theirs', content='...', author=self.other))
+        url = reverse('user-follow', args=[self.other.username])
+        self.assertQueryBudget(url, 7, method='post', data={'follow': '1'}, status_code=302) #with their posts copied in
+        self.assertQueryBudget(url, 4, method='post', data={'follow': '0'}, status_code=302)
+
+
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='talker')
+        cls.post = Post.objects.create(title='Viral', content='...', author=cls.user)
+        Comment.objects.bulk_create(Comment(post=cls.post, user=cls.user, content=f'Comment {i}') for i in range(45))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('post-detail', args=[self.post.pk])
+
+    def test_pages_walk_all_comments_oldest_first(self):
+        seen, params = [], {}
+        while True:
+            page = self.client.get(self.url, params).context['comments']
+            self.assertLessEqual(len(page), 20)
+            seen += [comment.pk for comment in page]
+            if not page.has_next():
+                break
+            params = {'comments': page.next_cursor}
+        self.assertEqual(seen, list(self.post.post_comment.order_by('commented_at', 'id').values_list('id', flat=True)))
+
+    def test_new_comment_redirects_to_the_latest_page(self):
+        response = self.client.post(self.url, {'content': 'Newest'}, follow=True)
+        comments = [comment.content for comment in response.context['comments']]
+        self.assertEqual(comments[-1], 'Newest')
+        self.assertTrue(response.context['comments'].has_previous())
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.client.get(self.url, {'comments': 'nope'}).status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cached')
+        cls.post = Post.objects.create(title='Fresh', content='...', author=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('post-detail', args=[self.post.pk])) #the first form sets the csrf cookie, which is part of the etag
+
+    def revalidate(self, url):
+        #returns the status of a second request that sends back the validators of the first one
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        return lambda: self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code
+
+    def test_unchanged_pages_are_not_modified(self):
+        for url in [reverse('blog-home'), reverse('user-posts', args=['cached']), reverse('post-detail', args=[self.post.pk])]:
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url)(), 304)
+
+    def test_not_modified_skips_the_page_queries(self):
+        url = reverse('blog-home')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(2): #the aggregate and the liked posts, session and user come from the cache
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_make_pages_stale(self):
+        home = self.revalidate(reverse('blog-home'))
+        detail = self.revalidate(reverse('post-detail', args=[self.post.pk]))
+        Like.objects.create(post=self.post, user=self.user)
+        self.assertEqual(home(), 200)
+        self.assertEqual(detail(), 200)
+
+        detail = self.revalidate(reverse('post-detail', args=[self.post.pk]))
+        Comment.objects.create(post=self.post, user=self.user, content='New')
+        self.assertEqual(detail(), 200)
+
+        home = self.revalidate(reverse('blog-home'))
+        Post.objects.create(title='Newer', content='...', author=self.user)
+        self.assertEqual(home(), 200)
+
+    def test_author_changes_make_pages_stale(self):
+        checks = [self.revalidate(url) for url in [reverse('blog-home'), reverse('post-detail', args=[self.post.pk])]]
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertEqual([check() for check in checks], [200, 200])
+
+    def test_deleting_a_post_makes_the_feed_stale(self):
+        Post.objects.create(title='Doomed', content='...', author=self.user)
+        home = self.client.get(reverse('blog-home'))
+        self.assertNotIn('Last-Modified', home) #it wouldn't move when a post on the page is deleted
+        Post.objects.get(title='Doomed').delete()
+        self.assertEqual(self.client.get(reverse('blog-home'), HTTP_IF_NONE_MATCH=home['ETag']).status_code, 200)
+
+    def test_deleting_a_post_in_the_middle_of_the_page_makes_it_stale(self):
+        #the next page's first post slides in, so the number of rows, the newest post and the sums can stay the same
+        posts = [Post.objects.create(title=f'Filler {i}', content='...', author=self.user) for i in range(20)]
+        posts[0].save() #edited, first on the page: the smallest and the largest id on the page stay the same too
+        for url in [reverse('blog-home'), reverse('user-posts', args=['cached'])]:
+            with self.subTest(url=url):
+                check = self.revalidate(url)
+                posts.pop(10).delete()
+                self.assertEqual(check(), 200)
+
+    def test_commenter_changes_make_the_detail_page_stale(self):
+        commenter = User.objects.create_user(username='commenter')
+        comment = Comment.objects.create(post=self.post, user=commenter, content='First')
+        url = reverse('post-detail', args=[self.post.pk])
+        check = self.revalidate(url)
+        commenter.username = 'renamed-commenter'
+        commenter.save()
+        self.assertEqual(check(), 200)
+        self.assertContains(self.client.get(url), 'renamed-commenter')
+
+        check = self.revalidate(url)
+        comment.content = 'Edited'
+        comment.save()
+        self.assertEqual(check(), 200)
+
+    def test_etag_is_per_user(self):
+        check = self.revalidate(reverse('blog-home'))
+        self.client.force_login(User.objects.create_user(username='someone'))
+        self.assertEqual(check(), 200)
+
+    def test_last_modified(self):
+        url = reverse('post-detail', args=[self.post.pk])
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+
+class APITests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='integrator')
+        Post.objects.bulk_create(Post(title=f'Post {i}', content='...', author=cls.user) for i in range(7))
+        cls.post = Post.objects.latest('id')
+        for i in range(3):
+            Comment.objects.create(post=cls.post, user=cls.user, content=f'Comment {i}')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_posts_pages(self):
+        seen, url = [], f"{reverse('api-posts')}?per_page=3"
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 3)
+            seen += data['results']
+            url = data['next']
+        self.assertEqual([post['id'] for post in seen], list(Post.objects.order_by('-last_updated', '-id').values_list('id', flat=True)))
+        newest = seen[0]
+        self.assertEqual((newest['author'], newest['comment_count']), ('integrator', 3))
+        self.assertEqual(newest['url'], reverse('post-detail', args=[newest['id']]))
+
+    def test_post_comments(self):
+        data = self.client.get(reverse('api-post-comments', args=[self.post.pk])).json()
+        self.assertEqual([comment['content'] for comment in data['results']], ['Comment 0', 'Comment 1', 'Comment 2'])
+        self.assertEqual(self.client.get(reverse('api-post-comments', args=[0])).status_code, 404)
+
+    def test_pages_cost_constant_queries(self):
+        self.assertQueryBudget(reverse('api-posts'), 1, grow=lambda: Post.objects.create(title='More', content='...', author=User.objects.create_user(username='more')))
+        self.assertQueryBudget(reverse('api-post-comments', args=[self.post.pk]), 2, grow=lambda: Comment.objects.create(post=self.post, user=User.objects.create_user(username='talker'), content='...'))
+
+    def test_export_streams_ndjson(self):
+        with mock.patch('blog.api.EXPORT_CHUNK_SIZE', 2):
+            response = self.client.get(reverse('api-posts-export'))
+            self.assertTrue(response.streaming)
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['id'] for record in records], list(Post.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(records[-1]['comment_count'], 3)
+
+        comments = b''.join(self.client.get(reverse('api-comments-export')).streaming_content).decode().splitlines()
+        self.assertEqual(len(comments), 3)
+
+    def test_export_can_be_loaded_back(self):
+        export = b''.join(self.client.get(reverse('api-posts-export')).streaming_content).decode()
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as fp:
+            fp.write(export)
+        self.addCleanup(os.unlink, fp.name)
+        call_command('load_posts', fp.name, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 14)
+
+    def test_anonymous_clients_are_forbidden(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api-posts')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('api-posts-export')).status_code, 403)
+
+
+@override_settings(ROOT_URLCONF='tutorial_project.urls_async')
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='async')
+        Post.objects.bulk_create(Post(title=f'Post {i}', content='...', author=cls.user) for i in range(15))
+        cls.post = Post.objects.latest('id')
+        Comment.objects.create(post=cls.post, user=cls.user, content='Hi')
+
+    def setUp(self):
+        self.async_client.force_login(self.user)
+
+    async def test_feeds(self):
+        for url in [reverse('blog-home'), reverse('user-posts', args=['async'])]:
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                page = response.context['page_obj']
+                self.assertEqual(len(page), 13)
+                self.assertTrue(page.has_next())
+                self.assertContains(response, 'Post 14')
+                response = await self.async_client.get(url, {'cursor': page.next_cursor})
+                self.assertEqual(len(response.context['page_obj']), 2)
+
+    async def test_unknown_user_and_bad_cursor_are_404(self):
+        self.assertEqual((await self.async_client.get(reverse('user-posts', args=['nobody']))).status_code, 404)
+        self.assertEqual((await self.async_client.get(reverse('blog-home'), {'cursor': 'nope'})).status_code, 404)
+
+    async def test_post_detail_and_comment(self):
+        url = reverse('post-detail', args=[self.post.pk])
+        response = await self.async_client.get(url)
+        self.assertContains(response, 'Hi')
+        response = await self.async_client.post(url, {'content': 'From async'})
+        self.assertEqual(response.status_code, 302) #handed over to the sync view
+        self.assertContains(await self.async_client.get(url, {'comments': encode_cursor(None, reverse=True)}), 'From async')
+        self.assertEqual((await self.async_client.get(reverse('post-detail', args=[0]))).status_code, 404)
+
+    async def test_not_modified(self):
+        url = reverse('post-detail', args=[self.post.pk])
+        await self.async_client.get(url) #sets the csrf cookie
+        etag = (await self.async_client.get(url))['ETag']
+        self.assertEqual((await self.async_client.get(url, headers={'If-None-Match': etag})).status_code, 304)
+
+    async def test_gallery(self):
+        self.assertEqual((await self.async_client.get(reverse('gallery-home'))).status_code, 200)
+        self.assertEqual((await self.async_client.get(reverse('gallery-photos'))).json()['photos'], [])
+
+    async def test_login_required(self):
+        await self.async_client.alogout()
+        response = await self.async_client.get(reverse('blog-home'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'sqlite settings')
+class SQLiteSettingsTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connections_are_tuned(self):
+        #the test database lives in memory so journal_mode can't be WAL here, the rest applies as configured
+        self.assertEqual(self.pragma('synchronous'), 1) #NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 20000)
+        self.assertEqual(self.pragma('cache_size'), -32000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_go_to_replicas_and_writes_to_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'blog'))
+        self.assertIsNone(self.router.allow_migrate('default', 'blog'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_means_everything_on_default(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def seen_by(self, request):
+        #runs the middleware around a view that records which database its reads would use
+        seen = []
+        def view(request):
+            seen.append(self.router.db_for_read(Post))
+            return HttpResponse()
+        response = ReplicaPinningMiddleware(view)(request)
+        return seen[0], response
+
+    def test_writes_pin_the_browser_to_the_primary(self):
+        factory = RequestFactory()
+        db, response = self.seen_by(factory.get('/'))
+        self.assertEqual(db, 'replica')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        db, response = self.seen_by(factory.post('/'))
+        self.assertEqual(db, 'default')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        request = factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1' #the next page load after the write sees it
+        self.assertEqual(self.seen_by(request)[0], 'default')
+
+    def test_copy_database(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            primary, replica = os.path.join(workdir, 'primary.sqlite3'), os.path.join(workdir, 'replica.sqlite3')
+            with sqlite3.connect(primary) as db:
+                db.execute('CREATE TABLE t (x)')
+                db.execute('INSERT INTO t VALUES (42)')
+            db.close()
+            copy_database(primary, replica)
+            db = sqlite3.connect(replica)
+            self.addCleanup(db.close)
+            self.assertEqual(db.execute('SELECT x FROM t').fetchall(), [(42,)])
+
+
+class ServerTimingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='timed', password='pass12345')
+        self.post = Post.objects.create(title='Timed', content='...', author=self.user)
+        self.client.force_login(self.user)
+
+    def timings(self, response):
+        #{'db': (ms, desc), ...} from the Server-Timing header
+        entries = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            params = dict(param.split('=', 1) for param in params)
+            entries[name] = (float(params['dur']), params.get('desc'))
+        return entries
+
+    def test_header_and_log_line(self):
+        with self.assertLogs('tutorial_project.timing', 'INFO') as logs:
+            response = self.client.get(reverse('blog-home'))
+        timings = self.timings(response)
+        self.assertEqual(set(timings), {'total', 'db', 'tpl', 'view'})
+        self.assertEqual(timings['db'][1], '"3 queries"')
+        self.assertGreater(timings['tpl'][0], 0)
+        self.assertLessEqual(timings['db'][0] + timings['tpl'][0], timings['total'][0] + 0.1) #nothing counted twice
+        self.assertIn('url=blog-home method=GET status=200', logs.output[0])
+        self.assertEqual(logs.records[0].queries, 3)
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_with_their_view(self):
+        with self.assertLogs('tutorial_project.timing.slow_queries', 'WARNING') as logs:
+            self.client.get(reverse('post-detail', args=[self.post.pk]))
+        self.assertTrue(all(record.url_name == 'post-detail' for record in logs.records))
+        self.assertIn('blog_post', logs.output[0])
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_header_can_be_turned_off(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('blog-about')))
+
+
+@override_settings(CRISPY_RENDER_CACHE=True)
+class TemplateCacheTests(TestCase):
+    def setUp(self):
+        crispy_cache.clear_render_cache()
+        self.addCleanup(crispy_cache.clear_render_cache)
+        self.user = User.objects.create_user(username='former', password='pass12345')
+        self.post = Post.objects.create(title='Formed', content='...', author=self.user)
+        self.client.force_login(self.user)
+
+    def test_every_template_compiles(self):
+        compiled, errors = warm_templates()
+        self.assertGreater(compiled, 0)
+        self.assertEqual(errors, {})
+
+    def test_empty_form_is_rendered_once_and_keeps_its_own_csrf_token(self):
+        url = reverse('post-detail', args=[self.post.pk])
+        with mock.patch.object(crispy_cache, 'as_crispy_form', wraps=crispy_cache.as_crispy_form) as render:
+            first = self.client.get(url)
+            other = self.client_class()
+            other.force_login(User.objects.create_user(username='other'))
+            second = other.get(url)
+        self.assertEqual(render.call_count, 1)
+        self.assertContains(second, 'name="content"')
+        self.assertNotEqual(first.context['csrf_token'], second.context['csrf_token'])
+        self.assertContains(second, f'value="{second.context["csrf_token"]}"')
+
+    def test_forms_with_data_are_not_shared(self):
+        response = self.client.post(reverse('post-create'), {'title': '', 'content': ''}) #bound, with errors
+        self.assertContains(response, 'This field is required')
+        response = self.client.get(reverse('post-update', args=[self.post.pk])) #same template, an existing post
+        self.assertContains(response, 'value="Formed"')
+        self.client.get(reverse('post-create'))
+        self.assertContains(self.client.get(reverse('post-create')), 'name="title"')
+        self.assertEqual(len(crispy_cache._rendered), 1) #only the empty create form
+
+
+class StaticPipelineTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        override = override_settings(STATIC_ROOT=self.root, STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'tutorial_project.staticfiles.CompressedManifestStaticFilesStorage'},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.user = User.objects.create_user(username='styled', password='pass12345')
+        self.client.force_login(self.user)
+
+    def stylesheet(self):
+        #the main.css url the pages link to
+        html = self.client.get(reverse('blog-about')).content.decode()
+        start = html.index('/static/blog/main.')
+        return html[start:html.index('"', start)]
+
+    def test_pages_link_hashed_names_served_compressed_and_immutable(self):
+        url = self.stylesheet()
+        self.assertRegex(url, r'^/static/blog/main\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.root, 'blog', 'main.css'), 'rb') as fp:
+            original = fp.read()
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), original)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Content-Type'], 'text/css')
+
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(b''.join(plain.streaming_content), original)
+        self.assertNotEqual(plain['ETag'], response['ETag'])
+
+        again = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_encodings_refused_with_q0_are_not_served(self):
+        url = self.stylesheet()
+        for accept, encoding in [('gzip;q=0, deflate', None), ('identity, *;q=0', None), ('*', 'gzip'), ('GZIP; q=0.5', 'gzip')]:
+            with self.subTest(accept=accept):
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING=accept)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+
+    def test_names_without_hash_are_not_immutable(self):
+        response = self.client.get('/static/blog/main.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.client.get('/static/blog/missing.css').status_code, 404)
+
+
+class PostCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='counter')
+        cls.fans = [User.objects.create_user(username=f'fan{i}') for i in range(3)]
+
+    def setUp(self):
+        self.post = Post.objects.create(title='Counted', content='...', author=self.user)
+
+    def counts(self):
+        self.post.refresh_from_db()
+        return self.post.like_count, self.post.comment_count
+
+    def test_create_and_delete(self):
+        like = Like.objects.create(post=self.post, user=self.fans[0])
+        Comment.objects.create(post=self.post, user=self.fans[0], content='hi')
+        self.assertEqual(self.counts(), (1, 1))
+        like.delete()
+        self.assertEqual(self.counts(), (0, 1))
+
+    def test_bulk_create_and_queryset_delete(self):
+        Like.objects.bulk_create(Like(post=self.post, user=fan) for fan in self.fans)
+        Comment.objects.bulk_create(Comment(post=self.post, user=fan, content='hi') for fan in self.fans)
+        self.assertEqual(self.counts(), (3, 3))
+        Like.objects.bulk_create([Like(post=self.post, user=self.fans[0])], ignore_conflicts=True)
+        self.assertEqual(self.counts(), (3, 3))
+        Comment.objects.filter(user__in=self.fans[:2]).delete()
+        self.assertEqual(self.counts(), (3, 1))
+
+    def test_queryset_delete(self):
+        other = Post.objects.create(title='Other', content='...', author=self.user)
+        Like.objects.bulk_create([*(Like(post=self.post, user=fan) for fan in self.fans), Like(post=other, user=self.fans[0])])
+        Like.objects.all().delete()
+        self.assertEqual(self.counts(), (0, 0))
+        other.refresh_from_db()
+        self.assertEqual(other.like_count, 0)
+
+    def test_failed_delete_leaves_nothing_for_the_next_one(self):
+        likes = [Like.objects.create(post=self.post, user=fan) for fan in self.fans[:2]]
+        def fail(sender, **kwargs):
+            raise RuntimeError('storage is down')
+        pre_delete.connect(fail, sender=Like)
+        try:
+            with self.assertRaises(RuntimeError), transaction.atomic(): #rolled back, like the request it failed in
+                likes[0].delete()
+        finally:
+            pre_delete.disconnect(fail, sender=Like)
+        self.assertEqual(self.counts(), (2, 0))
+        likes[0].delete() #the retry counts once
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_drifted_counter_does_not_break_deletes(self):
+        like = Like.objects.create(post=self.post, user=self.fans[0])
+        Post.objects.filter(pk=self.post.pk).update(like_count=0)
+        like.delete()
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_cascade_delete(self):
+        Like.objects.create(post=self.post, user=self.fans[0])
+        Comment.objects.create(post=self.post, user=self.fans[0], content='hi')
+        self.fans[0].delete()
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_reconcile_counters(self):
+        Like.objects.create(post=self.post, user=self.fans[0])
+        Post.objects.filter(pk=self.post.pk).update(like_count=7, comment_count=2)
+        out = StringIO()
+        call_command('reconcile_counters', chunk_size=1, stdout=out)
+        self.assertEqual(self.counts(), (1, 0))
+        self.assertIn('repaired 1', out.getvalue())
+
+
+
+class PostLikeTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='liker', password='pass12345')
+        cls.post = Post.objects.create(title='Likeable', content='...', author=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('post-like', args=[self.post.pk])
+
+    def like(self, liked=None):
+        response = self.client.post(self.url, {} if liked is None else {'liked': liked})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_like_and_unlike_are_idempotent(self):
+        self.assertEqual(self.like('1'), {'post': self.post.pk, 'liked': True, 'likes': 1})
+        self.assertEqual(self.like('1'), {'post': self.post.pk, 'liked': True, 'likes': 1})
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 1)
+        self.assertEqual(self.like('0'), {'post': self.post.pk, 'liked': False, 'likes': 0})
+        self.assertEqual(self.like('0'), {'post': self.post.pk, 'liked': False, 'likes': 0})
+        self.assertFalse(Like.objects.exists())
+
+    def test_toggle_without_a_state(self):
+        self.assertTrue(self.like()['liked'])
+        self.assertFalse(self.like()['liked'])
+
+    def test_post_only_and_login_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        self.assertEqual(self.client.post(reverse('post-like', args=[self.post.pk + 100])).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.post(self.url).status_code, 403)
+
+    def test_query_budget(self):
+        #the write, the counter moved by what it wrote and read back, no recount (see set_like)
+        self.assertQueryBudget(self.url, 5, method='post', data={'liked': '1'}, status_code=200)
+        self.assertQueryBudget(self.url, 5, method='post', data={'liked': '0'}, status_code=200)
+        self.assertQueryBudget(self.url, 4, method='post', data={'liked': '0'}, status_code=200) #nothing to delete, no update
+
+    def test_missing_post_is_checked_in_the_write(self):
+        #no separate exists() before set_like, a post deleted in between would have broken the foreign key (500)
+        missing = self.post.pk + 100
+        with self.assertRaises(Post.DoesNotExist):
+            set_like(missing, self.user, True)
+        self.assertFalse(Like.objects.exists())
+        for liked in ('1', '0'):
+            response = self.client.post(reverse('post-like', args=[missing]), {'liked': liked})
+            self.assertEqual(response.status_code, 404)
+
+    def test_feed_shows_liked_posts_with_one_query(self):
+        others = Post.objects.bulk_create(Post(title=f'Other {i}', content='...', author=self.user) for i in range(12))
+        set_like(others[3].pk, self.user, True)
+        set_like(self.post.pk, self.user, True)
+        with self.assertNumQueries(1):
+            self.assertEqual(liked_post_ids(self.user, Post.objects.all()), {others[3].pk, self.post.pk})
+        response = self.client.get(reverse('blog-home'))
+        self.assertContains(response, 'aria-pressed="true"', count=2)
+        self.assertContains(response, 'aria-pressed="false"', count=11)
+        #the cards are cached per liked state, someone who didn't like the posts gets the other cards
+        self.client.force_login(User.objects.create_user(username='stranger'))
+        self.assertContains(self.client.get(reverse('blog-home')), 'aria-pressed="true"', count=0)
+
+    def test_liking_makes_the_pages_stale(self):
+        #a like and an unlike on the same page leave the counters as they were, the liked posts are in the ETag too
+        other = Post.objects.create(title='Other', content='...', author=self.user)
+        set_like(other.pk, self.user, True)
+        home = self.client.get(reverse('blog-home'))['ETag']
+        detail = self.client.get(reverse('post-detail', args=[self.post.pk]))['ETag']
+        set_like(other.pk, self.user, False)
+        Like.objects.create(post=self.post, user=User.objects.create_user(username='fan'))
+        set_like(self.post.pk, self.user, True)
+        Like.objects.filter(post=self.post).exclude(user=self.user).delete()
+        self.assertEqual(self.client.get(reverse('blog-home'), HTTP_IF_NONE_MATCH=home).status_code, 200)
+        response = self.client.get(reverse('post-detail', args=[self.post.pk]), HTTP_IF_NONE_MATCH=detail)
+        self.assertContains(response, 'aria-pressed="true"')
+
+
+class PostLikeConcurrencyTests(TransactionTestCase):
+    #real threads with their own database connections, so the writes really do race
+    def test_many_threads_on_one_post(self):
+        post = Post.objects.create(title='Hot', content='...', author=User.objects.create_user(username='hot'))
+        fans = [User.objects.create_user(username=f'racer{i}') for i in range(8)]
+        errors = []
+
+        def like(fan, liked):
+            #the in-memory test database is shared between the threads with table locks, and a locked table fails
+            #right away instead of waiting like the file database does, so try again like a client would:
+            #the request is idempotent, running it again is always safe
+            for attempt in range(200):
+                try:
+                    return set_like(post.pk, fan, liked)
+                except OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+                    time.sleep(0.001)
+            raise AssertionError('the table stayed locked')
+
+        def hammer(fan, rounds):
+            try:
+                for i in range(rounds):
+                    like(fan, i % 2 == 0) #like, unlike, like... and every fan ends on a like
+                    like(fan, i % 2 == 0) #the same request again, a double click
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=hammer, args=(fan, 5)) for fan in fans]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        post.refresh_from_db()
+        self.assertEqual(Like.objects.filter(post=post).count(), len(fans))
+        self.assertEqual(post.like_count, len(fans))
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader', password='pass12345')
+        cls.author = User.objects.create_user(username='writer')
+        cls.star = User.objects.create_user(username='star')
+        cls.stranger = User.objects.create_user(username='stranger')
+        for followee in (cls.author, cls.star):
+            Follow.objects.create(follower=cls.reader, followee=followee)
+        Follow.objects.create(follower=cls.stranger, followee=cls.star)
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def post(self, author, minutes_ago, fan_out=True):
+        post = Post.objects.create(
+            title=f'{author} {minutes_ago}', content='...', author=author,
+            date_posted=timezone.now() - timezone.timedelta(minutes=minutes_ago),
+        )
+        if fan_out:
+            fan_out_post(post)
+        return post
+
+    def read_all(self, user, per_page):
+        posts, cursor = [], None
+        while True:
+            page = timeline_page(user, per_page, cursor)
+            posts += page.object_list
+            cursor = page.next_cursor
+            if cursor is None:
+                return posts
+
+    def test_creating_a_post_fans_out(self):
+        self.client.force_login(self.author)
+        self.client.post(reverse('post-create'), {'title': 'Fresh', 'content': '...'})
+        post = Post.objects.get(title='Fresh')
+        self.assertTrue(post.fanned_out)
+        self.assertEqual(set(post.timeline_entries.values_list('user', flat=True)), {self.author.pk, self.reader.pk})
+        self.client.force_login(self.reader)
+        self.assertContains(self.client.get(reverse('post-timeline')), 'Fresh')
+        self.client.force_login(self.stranger)
+        self.assertNotContains(self.client.get(reverse('post-timeline')), 'Fresh')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_big_authors_are_merged_in_when_read(self):
+        starred = self.post(self.star, 5) #two followers, over the limit
+        self.assertFalse(starred.fanned_out)
+        self.assertFalse(TimelineEntry.objects.filter(post=starred).exists())
+        self.assertIn(starred, timeline_page(self.reader).object_list)
+        self.assertIn(starred, timeline_page(self.stranger).object_list)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_pages_merge_both_kinds_in_order(self):
+        posts = [self.post(self.star if i % 3 == 0 else self.author, minutes_ago=i) for i in range(20)]
+        self.post(self.stranger, 0) #not followed
+        own = self.post(self.reader, 30, fan_out=False) #eg created in the admin
+        expected = [*posts, own]
+        self.assertEqual(self.read_all(self.reader, 4), expected)
+        self.assertEqual(self.read_all(self.reader, 13), expected)
+
+    def test_a_page_is_three_queries(self):
+        for i in range(20):
+            self.post(self.author, i)
+        page = timeline_page(self.reader, 5)
+        #the timeline's range scan, who has posts that weren't fanned out, and those posts
+        with self.assertNumQueries(3):
+            timeline_page(self.reader, 5, page.next_cursor)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_merge_over_several_compound_queries(self):
+        posts = [self.post(self.star if i % 2 else self.author, minutes_ago=i, fan_out=False) for i in range(9)]
+        with mock.patch('blog.timeline.MERGE_CHUNK', 1): #one query per author
+            self.assertEqual(self.read_all(self.reader, 4), posts)
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        theirs = self.post(self.stranger, 1)
+        url = reverse('user-follow', args=[self.stranger.username])
+        self.assertRedirects(self.client.post(url, {'follow': '1'}), reverse('user-posts', args=[self.stranger.username]))
+        self.assertIn(theirs, timeline_page(self.reader).object_list)
+        self.assertContains(self.client.get(reverse('user-posts', args=[self.stranger.username])), 'Unfollow')
+        self.client.post(url, {'follow': '1'}) #following twice is still one follow
+        self.assertEqual(Follow.objects.filter(follower=self.reader, followee=self.stranger).count(), 1)
+        self.client.post(url, {'follow': '0'})
+        self.assertNotIn(theirs, timeline_page(self.reader).object_list)
+        self.assertTrue(TimelineEntry.objects.filter(post=theirs, user=self.stranger).exists()) #their own stays
+
+    def test_follow_during_a_fan_out_still_gets_the_post(self):
+        #a fan-out that read the followers before this follow existed won't write the entry, the backfill has to
+        theirs = self.post(self.stranger, 1, fan_out=False)
+        Follow.objects.create(follower=self.reader, followee=self.stranger)
+        self.assertTrue(TimelineEntry.objects.filter(post=theirs, user=self.reader).exists())
+        fan_out_post(theirs)
+        self.assertEqual(timeline_page(self.reader).object_list.count(theirs), 1)
+
+    def test_fan_out_posts_command(self):
+        old = self.post(self.author, 3, fan_out=False)
+        out = StringIO()
+        call_command('fan_out_posts', chunk_size=1, stdout=out)
+        old.refresh_from_db()
+        self.assertTrue(old.fanned_out)
+        self.assertTrue(TimelineEntry.objects.filter(post=old, user=self.reader).exists())
+        self.assertIn('Fanned out 1 posts into 2 timeline entries', out.getvalue())
+
+    def test_cannot_follow_yourself(self):
+        response = self.client.post(reverse('user-follow', args=[self.reader.username]), {'follow': '1'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(reverse('post-timeline'), {'cursor': 'nonsense'}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('post-timeline'), {'cursor': encode_cursor(None)}).status_code, 404)
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cached')
+        cls.post = Post.objects.create(title='Cached', content='...', author=cls.user)
+
+    def setUp(self):
+        card_cache().clear()
+
+    def posts(self):
+        return list(Post.objects.select_related('author__profile'))
+
+    def test_second_render_is_a_hit(self):
+        reset_card_cache_stats()
+        posts = self.posts()
+        render_post_cards(posts)
+        with self.assertNumQueries(0):
+            cards = render_post_cards(posts)
+        self.assertIn('Cached', cards[0])
+        self.assertEqual(card_cache_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_edits_and_profile_changes_invalidate(self):
+        render_post_cards(self.posts())
+        profile = Profile.objects.get(user=self.user)
+        profile.birthday = profile.birthday.replace(year=1990)
+        profile.save() #nothing a card shows
+        with self.assertNumQueries(1): #the UPDATE alone, no lookup of the author's posts to throw their cards away
+            self.user.save(update_fields=['last_login'])
+        reset_card_cache_stats()
+        render_post_cards(self.posts())
+        self.assertEqual(card_cache_stats()['hits'], 1)
+
+        profile.image = 'profile_pics/new.png'
+        profile.save()
+        reset_card_cache_stats()
+        self.assertIn('profile_pics/new.png', render_post_cards(self.posts())[0]) #the version in the stamp moved
+        self.assertEqual(card_cache_stats()['misses'], 1)
+
+        self.post.title = 'Renamed'
+        self.post.save()
+        self.assertIsNone(card_cache().get(card_key('feed', self.post.pk)))
+        self.assertIn('Renamed', render_post_cards(self.posts())[0])
+
+    def test_rename_seen_by_processes_the_signal_missed(self):
+        render_post_cards(self.posts())
+        #another process renamed the user: its signal cleared its own cache, not this one
+        with mock.patch('blog.signals.invalidate_post_cards'):
+            self.user.username = 'renamed'
+            self.user.save()
+        self.assertIn('renamed', render_post_cards(self.posts())[0])
+
+    def test_new_like_is_never_served_stale(self):
+        render_post_cards(self.posts())
+        Like.objects.create(post=self.post, user=self.user)
+        self.assertIn('<span class="like-count">1</span>', render_post_cards(self.posts())[0])
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+            with self.settings(CACHES=backend):
+                reset_card_cache_stats()
+                render_post_cards(self.posts())
+                render_post_cards(self.posts())
+                self.assertEqual(card_cache_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+
+def check_search_index():
+    with connection.cursor() as cursor: #raises "database disk image is malformed" when the index and the posts disagree
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('integrity-check', 1)")
+
+
+class PostSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='searcher')
+
+    def ids(self, text, **kwargs):
+        return [post.id for post in search_posts(text, **kwargs)]
+
+    def test_index_follows_create_update_delete(self):
+        post = Post.objects.create(title='Mountain trek', content='Walking to base camp', author=self.user)
+        self.assertEqual(self.ids('camp'), [post.id])
+        post.content = 'Walking to the lake'
+        post.save()
+        self.assertEqual(self.ids('camp'), [])
+        self.assertEqual(self.ids('lake'), [post.id])
+        Post.objects.bulk_create([Post(title='Lake swim', content='Cold', author=self.user)])
+        self.assertEqual(len(self.ids('lake')), 2)
+        post.delete()
+        self.assertEqual(len(self.ids('lake')), 1)
+
+    def test_title_matches_rank_first_and_cursor_pages(self):
+        body = Post.objects.create(title='Notes', content='momo momo recipe', author=self.user)
+        title = Post.objects.create(title='Momo recipe', content='Dumplings', author=self.user)
+        for i in range(3):
+            Post.objects.create(title=f'Other {i}', content='a momo mention', author=self.user)
+        first = search_posts('momo', per_page=2)
+        self.assertEqual(first.object_list[0].id, title.id)
+        rest = search_posts('momo', per_page=2, cursor=first.next_cursor)
+        last = search_posts('momo', per_page=2, cursor=rest.next_cursor)
+        seen = [p.id for p in first] + [p.id for p in rest] + [p.id for p in last]
+        self.assertEqual(len(set(seen)), 5)
+        self.assertIn(body.id, seen)
+        self.assertFalse(last.has_next())
+
+    def test_rebuild_in_one_transaction(self):
+        post = Post.objects.create(title='Rebuilt', content='...', author=self.user)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        self.assertEqual(self.ids('rebuilt'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 1 posts', out.getvalue())
+        self.assertEqual(self.ids('rebuilt'), [post.id])
+        post.delete() #the delete trigger finds the words it removes
+        check_search_index()
+
+    def test_user_input_cannot_break_the_query(self):
+        self.assertEqual(search_terms('NEAR(" OR *'), '"NEAR" "OR"*')
+        self.assertEqual(self.ids('"unbalanced AND ('), [])
+        self.assertEqual(self.ids(''), [])
+
+    def test_view(self):
+        Post.objects.create(title='Searchable', content='...', author=self.user)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('post-search'), {'q': 'searchable'})
+        self.assertContains(response, 'Searchable')
+        response = self.client.get(reverse('post-search'), {'q': 'x', 'cursor': 'junk'})
+        self.assertEqual(response.status_code, 404)
+
+
+class LoadPostsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='importer')
+
+    def load(self, text, suffix, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as fp:
+            fp.write(text)
+        self.addCleanup(os.unlink, fp.name)
+        out = StringIO()
+        call_command('load_posts', fp.name, stdout=out, **options)
+        return out.getvalue()
+
+    def test_streaming_array_reader_handles_chunk_boundaries(self):
+        records = [{'title': f'T{i}', 'content': 'x' * (i * 7), 'user_id': i} for i in range(200)]
+        with mock.patch.object(importing, 'CHUNK_SIZE', 13): #tiny chunks so records get cut in every possible place
+            self.assertEqual(list(importing.iter_records(StringIO(' \n' + json.dumps(records, indent=2)))), records)
+
+    def test_load_json_array(self):
+        records = ',\n'.join(
+            f'{{"title": "Post {i}", "content": "Body", "user_id": {self.user.pk}}}' for i in range(7)
+        )
+        out = self.load(f'[\n{records},\n{{"title": "Ghost", "content": "x", "user_id": 999}}\n]', '.json', batch_size=3)
+        self.assertEqual(Post.objects.filter(author=self.user).count(), 7)
+        self.assertIn('skipped 1', out)
+        self.assertEqual([post.id for post in search_posts('Post')][:1], [Post.objects.order_by('id').first().id])
+
+    def test_load_ndjson_with_deferred_index(self):
+        lines = '\n'.join(
+            f'{{"title": "Line {i}", "content": "Body", "user_id": {self.user.pk}, "date_posted": "2024-09-0{i + 1}T10:00:00"}}'
+            for i in range(3)
+        )
+        self.load(lines, '.ndjson', defer_search_index=True)
+        self.assertEqual(Post.objects.filter(title__startswith='Line').count(), 3)
+        self.assertEqual(len(search_posts('Line').object_list), 3)
+
+    def test_search_keeps_working_during_a_deferred_import(self):
+        Post.objects.create(title='Older', content='...', author=self.user)
+        from blog.management.commands.load_posts import Command
+        load_batch, found = Command.load_batch, []
+        def load_and_search(command, records):
+            load_batch(command, records)
+            found.append(len(search_posts('Older').object_list))
+            #the triggers are dropped in the import's own transaction, no other connection sees them gone
+            self.assertTrue(transaction.get_connection().in_atomic_block)
+        with mock.patch.object(Command, 'load_batch', load_and_search):
+            self.load('{"title": "Imported", "content": "Body", "user_id": %d}' % self.user.pk, '.ndjson', defer_search_index=True)
+        self.assertEqual(found, [1])
+        self.assertEqual(len(search_posts('Imported').object_list), 1)
+        Post.objects.create(title='Afterwards', content='...', author=self.user) #the triggers are back
+        self.assertEqual(len(search_posts('Afterwards').object_list), 1)
+        check_search_index()
+
+    def test_deferred_import_stopped_halfway_keeps_what_it_indexed(self):
+        lines = '{"title": "Kept", "content": "Body", "user_id": %d}\n{"title": "Ghost", "content": "x", "user_id": 999}' % self.user.pk
+        with self.assertRaises(CommandError):
+            self.load(lines, '.ndjson', defer_search_index=True, strict=True, batch_size=1)
+        self.assertEqual(len(search_posts('Kept').object_list), 1)
+        Post.objects.get(title='Kept').delete()
+        self.assertEqual(len(search_posts('Kept').object_list), 0)
+        check_search_index()
+
+    def test_strict_stops_on_unknown_user(self):
+        with self.assertRaises(CommandError):
+            self.load('{"title": "A", "content": "B", "user_id": 999}', '.ndjson', strict=True)
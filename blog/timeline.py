@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_datetime
+from .models import Follow, Post, TimelineEntry
+from .pagination import CursorPage, decode_cursor, encode_cursor
+
+#the "following" feed: the posts of the people a user follows (and their own), newest first
+#
+#fan-out on write: when a post is created its author's followers get a TimelineEntry (follower, post, posted_at)
+#each, written in bulk batches by fan_out_post(), so reading a timeline is one range scan on the
+#(user, posted_at, post) index however many people the user follows, instead of
+#Post.objects.filter(author__in=following) which has to go through the posts of every one of them
+#
+#authors with more than TIMELINE_FANOUT_LIMIT followers are the exception: writing that many rows for every post costs
+#more than the reads it saves, so their posts stay fanned_out=False and a timeline merges them in when it's read,
+#from a partial index that only holds those posts: first which of the people followed have any (one EXISTS seek per
+#followee), then the newest page of each of them, a seek per author glued with UNION ALL, so a read costs the same
+#however many posts those authors have written. The same goes for posts that were never fanned
+#out (created in the admin or by load_posts), `python manage.py fan_out_posts` writes those into the timelines
+#
+#following someone copies their latest TIMELINE_BACKFILL posts into the timeline and unfollowing takes their posts
+#out again (blog/signals.py)
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 5000)
+
+def batch_size():
+    return getattr(settings, 'TIMELINE_BATCH_SIZE', 500)
+
+def fan_out_post(post):
+    #writes post into the timelines of its author and the author's followers, returns how many entries were written
+    #(0 when the author has too many followers and the post is left to be merged in at read time)
+    limit = fanout_limit()
+    #the followers are read in the transaction that writes their entries: someone who follows the author meanwhile
+    #either is in this list or their backfill (which doesn't wait for fanned_out) finds the post
+    with transaction.atomic():
+        followers = Follow.objects.filter(followee_id=post.author_id).values_list('follower_id', flat=True)
+        follower_ids = list(followers[:limit + 1]) #the ids are needed anyway, so no COUNT(*) to decide
+        if len(follower_ids) > limit:
+            return 0
+        entries = [
+            TimelineEntry(user_id=user_id, post_id=post.pk, posted_at=post.date_posted)
+            for user_id in [post.author_id, *follower_ids]
+        ]
+        TimelineEntry.objects.bulk_create(entries, batch_size=batch_size(), ignore_conflicts=True)
+        #.update() so last_updated doesn't move, the post itself didn't change
+        Post.objects.filter(pk=post.pk).update(fanned_out=True)
+    post.fanned_out = True
+    return len(entries)
+
+def backfill_timeline(user_id, author_id):
+    #copies author's latest posts into user's timeline, when user starts following them
+    #fanned out or not: a post being fanned out right now may have read the followers before this follow existed,
+    #the ones that stay fanned_out=False are merged in at read time as well, timeline_page() drops the duplicate
+    posts = Post.objects.filter(author_id=author_id).order_by('-date_posted', '-id')
+    entries = [
+        TimelineEntry(user_id=user_id, post_id=post_id, posted_at=posted_at)
+        for post_id, posted_at in posts.values_list('id', 'date_posted')[:getattr(settings, 'TIMELINE_BACKFILL', 100)]
+    ]
+    TimelineEntry.objects.bulk_create(entries, batch_size=batch_size(), ignore_conflicts=True)
+
+def remove_from_timeline(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, post__author_id=author_id).delete()
+
+MERGE_CHUNK = 250 #per author slices in one UNION ALL, sqlite takes at most 500 selects in a compound statement
+
+def merged_authors(user):
+    #user and the people they follow who have posts that weren't fanned out
+    unfanned = Post.objects.filter(author=OuterRef('followee'), fanned_out=False)
+    return [user.pk, *Follow.objects.filter(follower=user).filter(Exists(unfanned)).values_list('followee', flat=True)]
+
+def merged_posts(author_ids, older, limit):
+    #the newest `limit` posts of each author that weren't fanned out (matching the Q older, the cursor), author selected
+    #every author's slice seeks blog_post_not_fanned_out_idx (author, date_posted, id) on its own: with an IN list of
+    #authors and one ORDER BY the database would have to read and sort all of their posts for every page
+    posts = []
+    for start in range(0, len(author_ids), MERGE_CHUNK):
+        parts, params = [], []
+        for n, author_id in enumerate(author_ids[start:start + MERGE_CHUNK]):
+            newest = Post.objects.filter(older, author_id=author_id, fanned_out=False).order_by('-date_posted', '-id')
+            sql, part_params = newest.values('pk')[:limit].query.sql_with_params()
+            parts.append(f'SELECT * FROM ({sql}) AS author_{n}') #wrapped, a compound select can't have its own LIMIT
+            params.extend(part_params)
+        ids = RawSQL(' UNION ALL '.join(parts), params)
+        posts += Post.objects.filter(pk__in=ids).select_related('author__profile')
+    return posts
+
+
+def _parse_cursor(token):
+    #(posted_at, post id) from a next page token, raises ValueError for anything we didn't hand out
+    values, reverse = decode_cursor(token)
+    try:
+        posted_at, post_id = parse_datetime(values[0]), int(values[1])
+    except (TypeError, ValueError, IndexError) as e:
+        raise ValueError('Invalid cursor') from e
+    if reverse or posted_at is None:
+        raise ValueError('Invalid cursor')
+    return posted_at, post_id
+
+def timeline_page(user, per_page=13, cursor=None):
+    #returns a CursorPage of posts (author and profile selected) for user's timeline, only forward (next_cursor)
+    #raises ValueError for a cursor we didn't hand out
+    entries = TimelineEntry.objects.filter(user=user)
+    older = Q()
+    if cursor:
+        posted_at, post_id = _parse_cursor(cursor)
+        entries = entries.filter(Q(posted_at__lt=posted_at) | Q(posted_at=posted_at, post_id__lt=post_id))
+        older = Q(date_posted__lt=posted_at) | Q(date_posted=posted_at, id__lt=post_id)
+
+    entries = entries.select_related('post__author__profile').order_by('-posted_at', '-post_id')[:per_page + 1]
+    posts = {entry.post_id: entry.post for entry in entries}
+    #posts of the people followed that weren't fanned out, and the user's own
+    for post in merged_posts(merged_authors(user), older, per_page + 1):
+        posts.setdefault(post.pk, post)
+
+    rows = sorted(posts.values(), key=lambda post: (post.date_posted, post.pk), reverse=True)
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor([rows[-1].date_posted.isoformat(), rows[-1].pk])
+    return CursorPage(rows, next_cursor)
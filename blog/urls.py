@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import PostListView, PostDetailView, PostCreateView, PostUpdateView, PostDeleteView, UserPostListView, CommentUpdateView, CommentDeleteView
+from .views import PostListView, PostDetailView, PostCreateView, PostUpdateView, PostDeleteView, UserPostListView, CommentUpdateView, CommentDeleteView, PostSearchView, PostLikeView, FollowView, TimelineView
 from . import views #. means current directory
+from . import api
 
 #always end url with a trailing slash, good practice
 urlpatterns = [
@@ -10,6 +11,8 @@ urlpatterns = [
     #we have to create a urlpattern that contains a variable, for detail view
     #django makes it so that we can add variables to our actual route
     path('user/<str:username>', UserPostListView.as_view(), name='user-posts'),
+    path('user/<str:username>/follow/', FollowView.as_view(), name='user-follow'), #POST only
+    path('following/', TimelineView.as_view(), name='post-timeline'), #posts of the people you follow, ?cursor=token
     path('post/<int:pk>/', PostDetailView.as_view(), name='post-detail'),
     #pk means primary key; i.e, post 1 has pk 1 and so on (using variable makes it so that we don't have to make url for each post)
     #specifying that we only want to see int after post, preventing string
@@ -19,7 +22,14 @@ urlpatterns = [
     path('post/<int:pk>/update/', PostUpdateView.as_view(), name='post-update'),
     #uses the same template the one we used for create view
     path('post/<int:pk>/delete/', PostDeleteView.as_view(), name='post-delete'),
+    path('post/<int:pk>/like/', PostLikeView.as_view(), name='post-like'), #POST only, json for the like buttons
     path('post/<int:post_id>/comment-update/<int:pk>/', CommentUpdateView.as_view(template_name = 'blog/comment_update.html'), name='comment-update'),
     path('post/<int:post_id>/comment-delete/<int:pk>/', CommentDeleteView.as_view(template_name = 'blog/comment_confirm_delete.html'), name='comment-delete'),
+    path('search/', PostSearchView.as_view(), name='post-search'), #?q=words&cursor=token
     path('about/', views.about, name='blog-about'),
+    #read only json api, see blog/api.py
+    path('api/posts/', api.PostListAPIView.as_view(), name='api-posts'),
+    path('api/posts/export/', api.PostExportAPIView.as_view(), name='api-posts-export'),
+    path('api/posts/<int:pk>/comments/', api.CommentListAPIView.as_view(), name='api-post-comments'),
+    path('api/comments/export/', api.CommentExportAPIView.as_view(), name='api-comments-export'),
 ]
\ No newline at end of file
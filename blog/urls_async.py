@@ -0,0 +1,10 @@
+from django.urls import path
+from . import async_views
+
+#the async read pages (blog/async_views.py), put in front of blog/urls.py by tutorial_project/urls_async.py
+#same urls and names as the sync views they replace
+urlpatterns = [
+    path('', async_views.post_list, name='blog-home'),
+    path('user/<str:username>', async_views.user_posts, name='user-posts'),
+    path('post/<int:pk>/', async_views.post_detail, name='post-detail'),
+]
@@ -1,12 +1,21 @@
 from django.db.models.query import QuerySet
 from django.shortcuts import render, get_object_or_404, redirect
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView, View
 from django.contrib.auth.models import User
-from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from .models import Post, Comment
+from django.contrib.auth.mixins import LoginRequiredMixin
+from .models import Post, Comment, Like, Follow, liked_post_ids, set_like
 from django.contrib.auth.decorators import login_required
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.http import Http404, JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.db.models import Exists, OuterRef
 from .forms import CommentForm
+from .mixins import OwnerRequiredMixin
+from .conditional import COMMENT_STAMP_FIELDS, ConditionalGetMixin, PageConditionalMixin, page_stamps, post_last_modified, post_stats
+from .pagination import CursorPaginationMixin, CursorPaginator, encode_cursor
+from .cards import render_post_cards
+from .search import search_posts
+from .timeline import fan_out_post, timeline_page
 
 '''
 post = [
@@ -49,7 +58,7 @@ def home(request):
     return render(request, 'blog/home.html', context) #render is also just returning a HTTP response in the bg, views alsways need to return a http response or an exception
 '''
     
-class PostListView(LoginRequiredMixin, ListView):
+class PostListView(LoginRequiredMixin, PageConditionalMixin, CursorPaginationMixin, ListView):
     #LoginRequiredMixin is a django built-in mixin which is used to add functionality to views, forms, and models, 
     #allowing developers to reuse code and improve the efficiency of their applications.
     #Mixins are typically defined as classes, and can be added to other classes by using inheritance.
@@ -61,28 +70,78 @@ class PostListView(LoginRequiredMixin, ListView):
     #2 ways to solve that, change variable name to object_list or let the class know that we want the variable to be
     #called post, we're doin the latter
     context_object_name = 'posts'
-    ordering = ['-last_updated'] #writing just date_posted orders from oldest to newest, so we added '-' for newest to oldest, ast_updated is used here
+    ordering = ['-last_updated', '-id'] #writing just date_posted orders from oldest to newest, so we added '-' for newest to oldest, ast_updated is used here
+    #id breaks ties between posts updated at the same moment, and (last_updated, id) is what the cursor and the index are keyed on
 
     #we dont need to import paginate at all, just use it as an attribute as we're using a CBV
+    #CursorPaginationMixin turns this into cursor pagination (see blog/pagination.py), no COUNT(*) and no OFFSET
     paginate_by = 13
 
+    def get_queryset(self):
+        #every post card shows the author's name and profile picture, select_related joins author and profile
+        #into the same query instead of running 2 more queries per post (the N+1 problem)
+        return super().get_queryset().select_related('author__profile')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        #pre-rendered (mostly cached) html for each post card, the posts this user liked get the pressed like button
+        context['cards'] = render_post_cards(context['posts'], 'feed', self.get_liked_ids(context['posts']))
+        return context
+
 #view for all of a user's post
-class UserPostListView(LoginRequiredMixin, ListView):
+class UserPostListView(LoginRequiredMixin, PageConditionalMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name = 'blog/user_posts.html'
     context_object_name = 'posts'
     paginate_by = 13
 
     def get_queryset(self):
-        user = get_object_or_404(User, username = self.kwargs.get('username'))
+        #PageConditionalMixin also calls get_queryset, so the user is looked up once and kept on the view
+        if not hasattr(self, 'author'):
+            #whether the user follows them comes along for the Follow/Unfollow button
+            users = User.objects.annotate(followed=Exists(Follow.objects.filter(follower=self.request.user, followee=OuterRef('pk'))))
+            self.author = get_object_or_404(users, username = self.kwargs.get('username'))
         #if user exists, username variable captures the username, if doesn't exists, instead of returning blank page which is bad ui, we're returning 404
-        return Post.objects.filter(author=user).order_by('-last_updated')
+        return Post.objects.filter(author=self.author).select_related('author__profile').order_by('-last_updated', '-id')
         #since we are overriding the query the list view will be making, the ordering is reset, so removed it above and added here
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cards'] = render_post_cards(context['posts'], 'user', self.get_liked_ids(context['posts']))
+        context['author'] = self.author
+        return context
+
+    def get_validators(self):
+        validators = super().get_validators()
+        if validators is None:
+            return None
+        parts, last_modified = validators
+        return [*parts, self.author.followed], last_modified #following them changes the button
+
 #detailed view for individual post
-class PostDetailView(LoginRequiredMixin, DetailView):
+class PostDetailView(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     model = Post
     template_name = 'blog/post_detail.html'
+    comments_per_page = 20
+
+    def get_queryset(self):
+        return Post.objects.select_related('author__profile') #author and their profile picture come with the post in one query
+
+    #ConditionalGetMixin (blog/conditional.py) answers with 304 Not Modified when the post, its counters and its comments
+    #haven't changed since the browser last got the page
+    def get_validators(self):
+        stats = post_stats(Post.objects, self.kwargs['pk'], self.request.user).first()
+        if stats is None:
+            return None #let the view raise its 404
+        try:
+            window = self.comment_paginator(Comment.objects.filter(post_id=self.kwargs['pk'])).window(self.request.GET.get('comments'))
+        except ValueError:
+            return None #the view's 404 for the cursor
+        self.liked = stats['liked'] #whether the user liked the post came with the stats, for the like button
+        return [*stats.values(), page_stamps(window, COMMENT_STAMP_FIELDS)], post_last_modified(stats)
+
+    def comment_paginator(self, comments):
+        return CursorPaginator(comments, self.comments_per_page, ('commented_at', 'id'))
 
     #method is used to add additional context to the template
     #get_context_data is detailview's method
@@ -91,10 +150,21 @@ class PostDetailView(LoginRequiredMixin, DetailView):
         #creating 2 keys for context and returning
         context['form'] = CommentForm() #Adds an empty CommentForm instance to the context, which will be used in the template to allow users to submit new comments.
         #adds a new CommentForm instance to the context, used in the template to allow users to submit new comments
+        if not hasattr(self, 'liked'): #get_validators didn't run (a message to show, or a comment was just posted)
+            self.liked = Like.objects.filter(post=self.object, user=self.request.user).exists()
+        context['liked'] = self.liked
 
-        context['comments'] = self.object.post_comment.all()
-        #This line adds the list of comments related to the current post to the context. self.object refers to the post object being viewed(self.object refers to the post instance), 
-        #and self.object.post_comment.all() retrieves all comments associated with this post. post_comment is related name for accessing the comments from the post model
+        #comments come a page at a time, oldest first, with the commenter joined in (comment.user in the template)
+        #a cursor on (commented_at, id) keeps the page cheap on a post with thousands of comments,
+        #the total is the comment_count counter on the post so there's no COUNT(*) either
+        comments = self.object.post_comment.select_related('user')
+        paginator = self.comment_paginator(comments)
+        try:
+            context['comments'] = paginator.page(self.request.GET.get('comments'))
+        except ValueError:
+            raise Http404('Invalid cursor')
+        #This adds the current page of comments related to the post to the context. self.object refers to the post object being viewed(self.object refers to the post instance),
+        #post_comment is related name for accessing the comments from the post model
         return context
     
     #handles the submission of the comment form
@@ -108,7 +178,8 @@ class PostDetailView(LoginRequiredMixin, DetailView):
             comment.post = post #Associates the comment with the current post
             comment.user = request.user #Sets the comment user to the one who made the request(commented)
             comment.save() #saving to datbase
-        return redirect('post-detail', pk=post.pk) #This prevents the form from being resubmitted if the user refreshes the page, pk is used in identifying which post to display as there could be a lot of posts.
+        #jump to the last page of comments where the new one is, "last" is a constant cursor (see blog/pagination.py)
+        return redirect(f"{reverse('post-detail', kwargs={'pk': post.pk})}?comments={encode_cursor(None, reverse=True)}#comments") #This prevents the form from being resubmitted if the user refreshes the page, pk is used in identifying which post to display as there could be a lot of posts.
 
 #create post using CBV
 class PostCreateView(LoginRequiredMixin, CreateView):
@@ -124,8 +195,10 @@ class PostCreateView(LoginRequiredMixin, CreateView):
         #form.instance refers to the object that is being created through the form. For example, if you are creating a new Post object, form.instance is that Post object in memory before it’s saved.
         #self.request.user refers to the currently logged-in user. Django tracks the user making the request, and the user object is available as self.request.user.
         #By setting form.instance.author = self.request.user, we are effectively saying: "Before saving the form to the database, set the author field of the post to the currently logged-in user."
-        return super().form_valid(form) #super().... performs the default behavior of saving the form.
+        response = super().form_valid(form) #super().... performs the default behavior of saving the form.
         #using super(), parent class is called. This ensures that Django continues with its normal form-handling logic
+        fan_out_post(self.object) #into the followers' timelines, see blog/timeline.py
+        return response
 
     #get_success_url in the view for redirecting to the home page after form submission is successful
     def get_success_url(self):
@@ -135,9 +208,11 @@ class PostCreateView(LoginRequiredMixin, CreateView):
         return reverse_lazy('blog-home')
         #return '' -- hardcoding isn't recommended, because if you want to change the home page, every hard coded link have to be changed
 
-class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):#mixins need to be left of the UpdateView
+class PostUpdateView(LoginRequiredMixin, OwnerRequiredMixin, UpdateView):#mixins need to be left of the UpdateView
     model = Post
     fields = ['title', 'content']
+    #OwnerRequiredMixin (blog/mixins.py) only lets the post's author in, checking self.request.user == post.author
+    #and reuses the post it fetched for that check in the view
 
     def form_valid(self, form):
         form.instance.author = self.request.user
@@ -145,19 +220,15 @@ class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):#mixin
     
     def get_success_url(self):
         return reverse_lazy('post-detail', kwargs={'pk': self.object.pk})
-    
-    def test_func(self):
-        #getting the exact post that we're currently updating using get
-        post = self.get_object()
-
-        #checking if current user is the author of this post, self.request.user-current logged in user
-        if self.request.user == post.author:
-                return True
-        return False
 
-class CommentUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class CommentUpdateView(LoginRequiredMixin, OwnerRequiredMixin, UpdateView):
     model = Comment
     fields = ['content']
+    owner_field = 'user' # Ensure only the comment author can update their comment
+    related_fields = ('post',)
+
+    def get_queryset(self):
+        return super().get_queryset().filter(post_id=self.kwargs['post_id']) #the comment has to belong to the post in the url
 
     def form_valid(self, form):
         form.instance.user = self.request.user  # Associate the current user with the comment
@@ -168,33 +239,92 @@ class CommentUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         return reverse_lazy('post-detail', kwargs={'pk': self.object.post.pk})
         #no need for post pk, the CommentUpdateView will use the comment's pk
 
-    # Ensure only the comment author can update their comment
-    def test_func(self):
-        comment = self.get_object()  # Retrieve the comment being updated
-        return self.request.user == comment.user
-
-class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class PostDeleteView(LoginRequiredMixin, OwnerRequiredMixin, DeleteView):
     model = Post
 
-    def test_func(self):
-        post = self.get_object()
-        if self.request.user == post.author:
-            return True
-        return False #after returning true it will exit the function so return False is not executeed
-    
     def get_success_url(self):
         return reverse_lazy('blog-home')
     
-class CommentDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class CommentDeleteView(LoginRequiredMixin, OwnerRequiredMixin, DeleteView):
     model = Comment
+    owner_field = 'user'
+    related_fields = ('post',)
 
-    def test_func(self):
-        comment = self.get_object()
-        return self.request.user == comment.user
+    def get_queryset(self):
+        return super().get_queryset().filter(post_id=self.kwargs['post_id'])
     
     def get_success_url(self):
         return reverse_lazy('post-detail' , kwargs={'pk': self.object.post.pk})
 
+#full text search over post titles and content, best matches first (see blog/search.py)
+class PostSearchView(LoginRequiredMixin, TemplateView):
+    template_name = 'blog/search.html'
+    paginate_by = 13
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        try:
+            page = search_posts(query, self.paginate_by, self.request.GET.get('cursor'))
+        except ValueError:
+            raise Http404('Invalid cursor')
+        context['title'] = 'Search'
+        context['query'] = query
+        context['page_obj'] = page
+        context['cards'] = render_post_cards(page.object_list, 'feed', liked_post_ids(self.request.user, page.object_list))
+        return context
+
+#like or unlike a post, called by the like buttons (blog/static/blog/likes.js), answers with json:
+#{"post": 7, "liked": true, "likes": 12}
+#the button sends the state it wants, liked=1 or liked=0, so the request is idempotent: a double click or a retry
+#can't undo itself. without liked the like is toggled
+class PostLikeView(LoginRequiredMixin, View):
+    raise_exception = True #403 instead of a redirect to the login page, a fetch() can't follow that to a form
+    http_method_names = ['post']
+
+    def post(self, request, pk):
+        liked = request.POST.get('liked')
+        if liked is None:
+            liked = not Like.objects.filter(post_id=pk, user=request.user).exists()
+        else:
+            liked = liked not in ('0', 'false', '')
+        try:
+            likes = set_like(pk, request.user, liked) #see blog/models.py, no read-then-write race between two requests
+        except Post.DoesNotExist: #checked in set_like's transaction, a post deleted just before can't slip through
+            raise Http404('No post found')
+        return JsonResponse({'post': pk, 'liked': liked, 'likes': likes})
+
+#follow or unfollow a user from their page (blog/user_posts.html), follow=1 or follow=0 like the like buttons
+#their posts show up in (or leave) the timeline, see blog/timeline.py
+class FollowView(LoginRequiredMixin, View):
+    http_method_names = ['post']
+
+    def post(self, request, username):
+        author = get_object_or_404(User, username=username)
+        if author == request.user:
+            raise PermissionDenied #your own posts are always in your timeline
+        if request.POST.get('follow') == '0':
+            Follow.objects.filter(follower=request.user, followee=author).delete()
+        else:
+            Follow.objects.get_or_create(follower=request.user, followee=author)
+        return redirect('user-posts', username=author.username)
+
+#the posts of the people the user follows, newest first, read from their timeline (blog/timeline.py)
+class TimelineView(LoginRequiredMixin, TemplateView):
+    template_name = 'blog/timeline.html'
+    paginate_by = 13
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            page = timeline_page(self.request.user, self.paginate_by, self.request.GET.get('cursor'))
+        except ValueError:
+            raise Http404('Invalid cursor')
+        context['title'] = 'Following'
+        context['page_obj'] = page
+        context['cards'] = render_post_cards(page.object_list, 'feed', liked_post_ids(self.request.user, page.object_list))
+        return context
+
 def about(request):
     return render(request, 'blog/about.html', {'title': 'About'}) #if it's small enough, you don't need to create a dictionary, and straight-up pass it as argument
 
@@ -0,0 +1,31 @@
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.urls import reverse
+from blog.pagination import CursorPaginator
+from .models import ImageUpload
+from .views import GALLERY_PAGE_SIZE, GALLERY_SIZES, photo_record
+
+#async versions of the gallery page and its json batches, used with ROOT_URLCONF = 'tutorial_project.urls_async'
+#(see blog/async_views.py for why), the photos are fetched with the async orm and rendering touches no database
+
+async def photo_page(request):
+    paginator = CursorPaginator(ImageUpload.objects.all(), GALLERY_PAGE_SIZE, ('-id',))
+    try:
+        return await paginator.apage(request.GET.get('cursor'))
+    except ValueError:
+        raise Http404('Invalid cursor')
+
+@login_required
+async def gallery(request):
+    request.user = await request.auser() #for the nav bar, so the template doesn't look the user up synchronously
+    page = await photo_page(request)
+    return render(request, 'gallery/photo_library.html', {
+        'photos': page, 'page_obj': page, 'gallery_sizes': GALLERY_SIZES,
+    })
+
+@login_required
+async def photo_batch(request):
+    page = await photo_page(request)
+    next_url = f"{reverse('gallery-photos')}?cursor={page.next_cursor}" if page.has_next() else None
+    return JsonResponse({'photos': [photo_record(photo) for photo in page], 'sizes': GALLERY_SIZES, 'next': next_url})
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0002_alter_imageupload_title'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageupload',
+            name='display',
+            field=models.ImageField(blank=True, upload_to='gallery_pics/derived'),
+        ),
+    ]
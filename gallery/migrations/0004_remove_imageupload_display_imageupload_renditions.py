@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0003_imageupload_display'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='imageupload',
+            name='display',
+        ),
+        migrations.AddField(
+            model_name='imageupload',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
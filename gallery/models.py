@@ -1,21 +1,24 @@
 from django.db import models
-from PIL import Image
+from imaging.models import ResponsiveImageModel
 
-class ImageUpload(models.Model):
+class ImageUpload(ResponsiveImageModel):
     title = models.CharField(max_length=20)
     image = models.ImageField(default='default_gallery.jpeg', upload_to='gallery_pics')
 
+    #the gallery column is at most ~730px wide, so up to 1200 covers 2x screens too
+    #(resized in the background by the process_image_jobs worker, renditions field comes from ResponsiveImageModel)
+    RENDITION_WIDTHS = (320, 640, 960, 1200)
+
     def __str__(self):
         return self.title
 
     #overriding save method
-    #reszing image
+    #the original is saved as uploaded and resizing is queued for the background worker instead of running in the request
+    #(the old code also never shrank anything: img.resize() returns a new image, and its result was thrown away)
     def save(self, *args, **kwargs):
-        #this method runs after our model is saved
         super().save(*args, **kwargs)
-        img = Image.open(self.image.path)
-
-        if img.height > 800 or img.width >1200:
-            output_size = (800, 1200)
-            img.resize(output_size)
-            img.save(self.image.path)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'image' not in update_fields:
+            return
+        if self.image:
+            self.enqueue_renditions()
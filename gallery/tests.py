@@ -1,3 +1,128 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .models import ImageUpload
+from .views import GALLERY_PAGE_SIZE
 
 # Create your tests here.
+
+class GalleryPaginationTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+        self.client.force_login(User.objects.create_user(username='viewer'))
+        #bulk_create skips save() so no resize jobs are queued, the default image is enough here
+        ImageUpload.objects.bulk_create(ImageUpload(title=f'Photo {i}') for i in range(GALLERY_PAGE_SIZE * 2 + 3))
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def test_gallery_renders_one_batch(self):
+        response = self.client.get(reverse('gallery-home'))
+        photos = list(response.context['photos'])
+        self.assertEqual(len(photos), GALLERY_PAGE_SIZE)
+        self.assertEqual(photos[0], ImageUpload.objects.latest('id'))
+        self.assertContains(response, 'loading="lazy"', count=GALLERY_PAGE_SIZE - 2)
+        self.assertContains(response, 'id="gallery-more"')
+
+    def test_json_batches_walk_the_whole_gallery(self):
+        first = self.client.get(reverse('gallery-home')).context['page_obj']
+        seen = [photo.pk for photo in first]
+        url = f"{reverse('gallery-photos')}?cursor={first.next_cursor}"
+        while url:
+            data = self.client.get(url).json()
+            seen += [photo['id'] for photo in data['photos']]
+            self.assertTrue(all(photo['src'] for photo in data['photos']))
+            url = data['next']
+        self.assertEqual(seen, list(ImageUpload.objects.order_by('-id').values_list('id', flat=True)))
+
+    def test_page_cost_does_not_grow_with_the_gallery(self):
+        def queries():
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get(reverse('gallery-photos'))
+            return len(captured)
+        before = queries()
+        ImageUpload.objects.bulk_create(ImageUpload(title='More') for _ in range(100))
+        self.assertEqual(queries(), before)
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.client.get(reverse('gallery-photos'), {'cursor': 'nope'}).status_code, 404)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.data = bytes(range(256)) * 4
+        for name in ('gallery_pics/photo.png', 'profile_pics/me.png', 'profile_pics/derived/abc_65w.png'):
+            os.makedirs(os.path.join(self.media, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(self.media, name), 'wb') as fp:
+                fp.write(self.data)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_gallery_needs_login_profiles_dont(self):
+        self.assertEqual(self.client.get('/media/gallery_pics/photo.png').status_code, 403)
+        response = self.client.get('/media/profile_pics/me.png')
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['Cache-Control'].startswith('public'))
+
+        self.client.force_login(User.objects.create_user(username='viewer'))
+        response = self.client.get('/media/gallery_pics/photo.png')
+        self.assertEqual(self.body(response), self.data)
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+        self.assertIn('immutable', self.client.get('/media/profile_pics/derived/abc_65w.png')['Cache-Control'])
+
+    def test_validators_and_ranges(self):
+        url = '/media/profile_pics/me.png'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(self.body(response), self.data[10:20])
+        self.assertEqual(self.body(self.client.get(url, HTTP_RANGE='bytes=-5')), self.data[-5:])
+        self.assertEqual(self.body(self.client.get(url, HTTP_RANGE='bytes=1000-')), self.data[1000:])
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=5000-').status_code, 416)
+        #the file changed since the first part was fetched: the whole new file
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag).status_code, 206)
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get('/media/profile_pics/nope.png').status_code, 404)
+        self.assertEqual(self.client.get('/media/profile_pics/../../etc/passwd').status_code, 404)
+
+    def test_dot_segments_dont_get_around_the_login(self):
+        for url in ['/media/profile_pics/../gallery_pics/photo.png', '/media/./gallery_pics/photo.png',
+                    '/media/profile_pics/%2e%2e/gallery_pics/photo.png', '/media/gallery_pics//photo.png']:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 403)
+
+    @override_settings(MEDIA_SERVER='nginx')
+    def test_offload_uses_the_normalized_path(self):
+        self.client.force_login(User.objects.create_user(username='viewer'))
+        response = self.client.get('/media/profile_pics/../gallery_pics/./photo.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/gallery_pics/photo.png')
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+
+    @override_settings(MEDIA_SERVER='nginx')
+    def test_offload_to_nginx(self):
+        response = self.client.get('/media/profile_pics/me.png')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/profile_pics/me.png')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/media/gallery_pics/photo.png').status_code, 403) #still checked here
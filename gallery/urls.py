@@ -3,5 +3,6 @@ from . import views
 
 urlpatterns = [
     path('home/', views.gallery, name='gallery-home'),
+    path('photos/', views.photo_batch, name='gallery-photos'),
     path('upload/', views.upload_photo, name='upload-photo'),
 ]
\ No newline at end of file
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import async_views
+
+#the async gallery pages (gallery/async_views.py), put in front of gallery/urls.py by tutorial_project/urls_async.py
+urlpatterns = [
+    path('home/', async_views.gallery, name='gallery-home'),
+    path('photos/', async_views.photo_batch, name='gallery-photos'),
+]
@@ -1,13 +1,46 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+from django.urls import reverse
+from blog.pagination import CursorPaginator
 from .models import ImageUpload
 from .forms import PhotoUpload
 
+#the gallery is shown a batch at a time, newest first, so the page costs the same however big the library gets
+#the first batch is rendered by the gallery view, the page then fetches the next ones from photo_batch (json) as you scroll
+#both use the cursor paginator from the blog, ordering by id alone is served by the primary key index
+GALLERY_PAGE_SIZE = 12
+GALLERY_SIZES = '(max-width: 767px) 100vw, 730px' #how wide a photo is drawn, for the browser to pick a rendition
+
+def photo_page(request):
+    paginator = CursorPaginator(ImageUpload.objects.all(), GALLERY_PAGE_SIZE, ('-id',))
+    try:
+        return paginator.page(request.GET.get('cursor'))
+    except ValueError:
+        raise Http404('Invalid cursor')
+
+def photo_record(photo):
+    return {
+        'id': photo.pk,
+        'title': photo.title,
+        'src': photo.display_image.url,
+        'srcset': photo.srcset(),
+    }
+
 #Gallery view to display the images
 @login_required()
 def gallery(request):
-    photos = ImageUpload.objects.all().distinct()
-    return render(request, 'gallery/photo_library.html', {'photos': photos})
+    page = photo_page(request)
+    return render(request, 'gallery/photo_library.html', {
+        'photos': page, 'page_obj': page, 'gallery_sizes': GALLERY_SIZES,
+    })
+
+#next batch of photos for the gallery page's infinite scroll
+@login_required()
+def photo_batch(request):
+    page = photo_page(request)
+    next_url = f"{reverse('gallery-photos')}?cursor={page.next_cursor}" if page.has_next() else None
+    return JsonResponse({'photos': [photo_record(photo) for photo in page], 'sizes': GALLERY_SIZES, 'next': next_url})
 
 #upload view
 def upload_photo(request):
@@ -18,4 +51,4 @@ def upload_photo(request):
             return redirect('gallery-home')
     else:
         form = PhotoUpload()
-    return render(request, 'gallery/photo_upload.html', {'form': form})
\ No newline at end of file
+    return render(request, 'gallery/photo_upload.html', {'form': form})
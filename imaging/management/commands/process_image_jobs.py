@@ -0,0 +1,112 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from imaging.models import ImageJob, ResponsiveImageModel
+from tutorial_project.replicas import use_primary
+
+#python manage.py process_image_jobs [--workers 4] [--batch-size 16] [--once]
+#the background worker for image resizing, run it next to the web server (eg as a systemd service)
+#jobs are claimed with a conditional UPDATE (status pending -> running), so several workers can run at once
+#without processing the same job twice, the claimed batch is then processed on a thread pool
+#(PIL does most of its decoding/resizing without holding the GIL, so threads keep several cores busy)
+#jobs left 'running' by a worker that died are handed out again after --stale-after seconds
+#everything reads from the primary database, a read replica could still show a job as pending after it was claimed
+
+class Command(BaseCommand):
+    help = 'Process queued image resizing jobs in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Threads processing images in parallel')
+        parser.add_argument('--batch-size', type=int, default=16, help='Jobs claimed per round')
+        parser.add_argument('--once', action='store_true', help='Stop when the queue is empty instead of waiting for more')
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--max-attempts', type=int, default=3, help='Give up on a job after this many failures')
+        parser.add_argument('--stale-after', type=int, default=600, help='Seconds before a running job is retried')
+        parser.add_argument(
+            '--enqueue-missing', action='store_true',
+            help='First queue every existing image that has no renditions yet (eg after upgrading)',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be at least 1')
+        self.max_attempts = options['max_attempts']
+
+        if options['enqueue_missing']:
+            self.enqueue_missing()
+
+        with use_primary():
+            workers = options['workers']
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while True:
+                    self.requeue_stale(options['stale_after'])
+                    job_ids = self.claim(options['batch_size'])
+                    if not job_ids:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll'])
+                        continue
+                    if workers == 1:
+                        results = [self.run_job(job_id) for job_id in job_ids] #no threads, handy when debugging
+                    else:
+                        results = list(pool.map(self.run_job_in_thread, job_ids))
+                    done = results.count(True)
+                    self.stdout.write(f'Processed {done} image(s), {len(results) - done} failed.')
+
+    def enqueue_missing(self):
+        queued = 0
+        for model in apps.get_models():
+            if not issubclass(model, ResponsiveImageModel):
+                continue
+            default = model._meta.get_field('image').default
+            for instance in model.objects.exclude(image='').exclude(image=default).iterator(chunk_size=1000):
+                if not instance.ready_renditions() and instance.enqueue_renditions():
+                    queued += 1
+        self.stdout.write(f'Queued {queued} image(s) without renditions.')
+
+    def requeue_stale(self, seconds):
+        cutoff = timezone.now() - timezone.timedelta(seconds=seconds)
+        ImageJob.objects.filter(status=ImageJob.RUNNING, updated_at__lt=cutoff).update(
+            status=ImageJob.PENDING, updated_at=timezone.now(),
+        )
+
+    def claim(self, batch_size):
+        candidates = ImageJob.objects.filter(status=ImageJob.PENDING).order_by('id').values_list('id', flat=True)[:batch_size]
+        claimed = []
+        for job_id in candidates:
+            #only one worker gets 1 back from this update, the others see it's not pending any more
+            if ImageJob.objects.filter(pk=job_id, status=ImageJob.PENDING).update(status=ImageJob.RUNNING, updated_at=timezone.now()):
+                claimed.append(job_id)
+        return claimed
+
+    def run_job_in_thread(self, job_id):
+        #django gives every thread its own database connection, close it so the pool doesn't leak them
+        #and the pin to the primary is per thread too (a context variable), so set it here again
+        try:
+            with use_primary():
+                return self.run_job(job_id)
+        finally:
+            connection.close()
+
+    def run_job(self, job_id):
+        job = ImageJob.objects.select_related('content_type').get(pk=job_id)
+        try:
+            instance = job.content_type.get_object_for_this_type(pk=job.object_id)
+            if instance.image.name == job.source: #otherwise a newer upload replaced it and has its own job
+                instance.process_image()
+        except job.content_type.model_class().DoesNotExist:
+            pass #deleted in the meantime, nothing to do
+        except Exception as e:
+            job.attempts += 1
+            job.status = ImageJob.FAILED if job.attempts >= self.max_attempts else ImageJob.PENDING
+            job.last_error = f'{type(e).__name__}: {e}'
+            job.save(update_fields=['attempts', 'status', 'last_error', 'updated_at'])
+            self.stderr.write(f'Job {job_id} failed: {job.last_error}')
+            return False
+        job.status = ImageJob.DONE
+        job.save(update_fields=['status', 'updated_at'])
+        return True
@@ -0,0 +1,99 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.utils.functional import cached_property
+
+#a queue of image resizing jobs, kept in the database so it needs no extra service
+#models with an uploaded image (users.Profile, gallery.ImageUpload) save the original straight away and enqueue a job,
+#the process_image_jobs command picks the jobs up in the background and calls the model's process_image()
+#until that happened, templates show the original (see ResponsiveImageModel below)
+
+class ImageJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    #the object whose image needs processing, any model with a process_image() method
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    source = models.CharField(max_length=255) #name of the image file when the job was created, a newer upload makes the job stale
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='imaging_job_status_idx'), #the worker asks for the oldest pending jobs
+        ]
+
+    def __str__(self):
+        return f"{self.content_type.model} {self.object_id} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, instance, source):
+        #creates a job for instance unless one for the same file is already waiting or running
+        content_type = ContentType.objects.get_for_model(instance) #cached by django after the first call
+        waiting = cls.objects.filter(
+            content_type=content_type, object_id=instance.pk, source=source, status__in=[cls.PENDING, cls.RUNNING],
+        )
+        if waiting.exists():
+            return None
+        return cls.objects.create(content_type=content_type, object_id=instance.pk, source=source)
+
+
+class Rendition:
+    #one resized copy of an image, quacks like a FieldFile as far as templates care ({{ image.url }})
+    def __init__(self, name, width, storage):
+        self.name = name
+        self.width = width
+        self.storage = storage
+
+    @cached_property
+    def url(self):
+        return self.storage.url(self.name)
+
+
+class ResponsiveImageModel(models.Model):
+    #abstract base for models with an uploaded `image` that is shown at several sizes (users.Profile, gallery.ImageUpload)
+    #subclasses set RENDITION_WIDTHS, the worker fills renditions, templates use {% responsive_image obj %}
+    #(imaging/templatetags/imaging_tags.py) which gives browsers a srcset to pick the smallest file that looks sharp
+    renditions = models.JSONField(default=dict, blank=True)
+
+    RENDITION_WIDTHS = ()
+
+    class Meta:
+        abstract = True
+
+    def enqueue_renditions(self):
+        return ImageJob.enqueue(self, self.image.name)
+
+    #called by the worker (imaging/management/commands/process_image_jobs.py)
+    def process_image(self):
+        from .processing import build_renditions #PIL is only needed by the worker
+        build_renditions(self)
+
+    def ready_renditions(self):
+        #renditions of the current image, smallest first, empty until the worker processed this upload
+        if not self.image or self.renditions.get('source') != self.image.name:
+            return []
+        widths = sorted(self.renditions.get('widths', {}).items(), key=lambda item: int(item[0]))
+        return [Rendition(name, int(width), self.image.storage) for width, name in widths]
+
+    def srcset(self):
+        #"<url> 320w, <url> 640w, ..." for an <img srcset>, empty until the renditions exist
+        return ', '.join(f'{rendition.url} {rendition.width}w' for rendition in self.ready_renditions())
+
+    #a single picture for places that don't use srcset: the largest rendition, or the original until they're ready
+    @property
+    def display_image(self):
+        ready = self.ready_renditions()
+        return ready[-1] if ready else self.image
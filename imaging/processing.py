@@ -0,0 +1,67 @@
+import hashlib
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image
+
+#the actual image work, only ever called from the process_image_jobs worker, never inside a request
+#
+#every image gets a set of renditions, one per width in the model's RENDITION_WIDTHS (never wider than the original),
+#named after a hash of the uploaded bytes: profile_pics/derived/<hash>_130w.png
+#the same picture uploaded twice (or by two users) maps to the same names, so it is resized and stored only once
+#a new image replaces the old renditions, the files nothing uses any more are deleted
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:24]
+
+def rendition_name(source_name, digest, width):
+    folder = os.path.join(os.path.dirname(source_name), 'derived')
+    ext = os.path.splitext(source_name)[1].lower()
+    return os.path.join(folder, f'{digest}_{width}w{ext}')
+
+def build_renditions(instance):
+    #makes the renditions of instance.image and records them in instance.renditions:
+    #{'source': <image name>, 'widths': {'65': <file name>, '130': ..., }}
+    source = instance.image
+    storage = source.storage
+    with source.open('rb') as fp:
+        data = fp.read()
+    digest = content_hash(data)
+
+    img = Image.open(BytesIO(data))
+    img.load()
+    image_format = img.format or 'PNG'
+    if image_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+
+    widths = {}
+    for width in sorted(instance.RENDITION_WIDTHS):
+        if width >= img.width:
+            break #never upscale, the original covers this width (added below)
+        name = rendition_name(source.name, digest, width)
+        if not storage.exists(name): #already there if this picture was uploaded before
+            height = max(1, round(img.height * width / img.width))
+            buffer = BytesIO()
+            img.resize((width, height), Image.LANCZOS).save(buffer, format=image_format, optimize=True)
+            name = storage.save(name, ContentFile(buffer.getvalue()))
+        widths[str(width)] = name
+    if img.width <= max(instance.RENDITION_WIDTHS):
+        widths[str(img.width)] = source.name #small originals are served as they are, as the largest candidate
+
+    previous = instance.renditions or {}
+    instance.renditions = {'source': source.name, 'widths': widths}
+    instance.save(update_fields=['renditions'])
+    delete_superseded(instance, previous)
+
+def delete_superseded(instance, previous):
+    #removes the renditions of the image instance had before, unless another row still uses them
+    #(renditions are named after the picture's content, the same picture uploaded twice shares its files)
+    current = set(instance.renditions['widths'].values())
+    storage = instance.image.storage
+    others = type(instance).objects.exclude(pk=instance.pk)
+    for name in set(previous.get('widths', {}).values()) - current:
+        if name == previous.get('source') or '/derived/' not in f'/{name}':
+            continue #an original served as it is, not ours to delete
+        if not others.filter(renditions__icontains=f'"{name}"').exists() and storage.exists(name):
+            storage.delete(name)
@@ -0,0 +1,24 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+#{% load imaging_tags %}
+#{% responsive_image profile sizes="65px" class="rounded-circle article-img" %}
+#renders an <img> with a srcset of the object's renditions (imaging.models.ResponsiveImageModel) and the given sizes,
+#the browser then downloads only the smallest rendition that is sharp enough for the screen,
+#until the renditions exist it's a plain <img> of the original
+#any other keyword (class, alt, loading, ...) becomes an attribute
+
+@register.simple_tag
+def responsive_image(obj, sizes='100vw', **attrs):
+    if not obj:
+        return '' #missing object (eg a user without a profile), like {{ obj.image.url }} would render
+    renditions = obj.ready_renditions()
+    attrs.setdefault('alt', '')
+    extra = format_html_join('', ' {}="{}"', sorted(attrs.items()))
+    if not renditions:
+        return format_html('<img src="{}"{}>', obj.image.url, extra)
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}"{}>', renditions[-1].url, obj.srcset(), sizes, extra,
+    )
@@ -0,0 +1,141 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from PIL import Image
+from gallery.models import ImageUpload
+from .models import ImageJob
+
+# Create your tests here.
+
+def upload(name, size, image_format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'teal').save(buffer, format=image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class ImageJobTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def work(self):
+        call_command('process_image_jobs', once=True, workers=1, stdout=StringIO(), stderr=StringIO())
+
+    def test_profile_upload_is_resized_in_the_background(self):
+        profile = User.objects.create_user(username='avatar').profile
+        profile.image = upload('me.png', (900, 600))
+        profile.save()
+
+        #the request only saved the original and queued a job
+        self.assertEqual(profile.display_image.name, profile.image.name)
+        self.assertEqual(ImageJob.objects.filter(status=ImageJob.PENDING).count(), 1)
+
+        self.work()
+        profile.refresh_from_db()
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.DONE)
+        self.assertEqual([r.width for r in profile.ready_renditions()], [65, 130, 250])
+        with Image.open(profile.display_image.storage.path(profile.display_image.name)) as img:
+            self.assertEqual(img.size, (250, 167))
+        with Image.open(profile.image.path) as img:
+            self.assertEqual(img.size, (900, 600)) #original untouched
+
+    def test_gallery_images_are_actually_shrunk(self):
+        photo = ImageUpload.objects.create(title='Big', image=upload('big.jpg', (2400, 1200), 'JPEG'))
+        self.work()
+        photo.refresh_from_db()
+        with Image.open(photo.display_image.storage.path(photo.display_image.name)) as img:
+            self.assertEqual(img.size, (1200, 600))
+
+    def test_small_originals_are_not_upscaled(self):
+        photo = ImageUpload.objects.create(title='Small', image=upload('small.png', (500, 300)))
+        self.work()
+        photo.refresh_from_db()
+        widths = {r.width: r.name for r in photo.ready_renditions()}
+        self.assertEqual(sorted(widths), [320, 500])
+        self.assertEqual(widths[500], photo.image.name)
+
+    def test_identical_uploads_share_renditions(self):
+        first = ImageUpload.objects.create(title='One', image=upload('a.png', (800, 800)))
+        second = ImageUpload.objects.create(title='Two', image=upload('b.png', (800, 800)))
+        self.work()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertNotEqual(first.image.name, second.image.name)
+        derived = lambda photo: [r.name for r in photo.ready_renditions() if r.width < 800] #800 is each one's own original
+        self.assertEqual(derived(first), derived(second))
+        self.assertEqual(len(derived(first)), 2)
+
+    def test_original_as_wide_as_the_largest_rendition_is_a_candidate(self):
+        profile = User.objects.create_user(username='exact').profile
+        profile.image = upload('exact.png', (250, 250))
+        profile.save()
+        self.work()
+        profile.refresh_from_db()
+        widths = {r.width: r.name for r in profile.ready_renditions()}
+        self.assertEqual(sorted(widths), [65, 130, 250])
+        self.assertEqual(widths[250], profile.image.name)
+
+    def test_new_upload_replaces_old_renditions(self):
+        profile = User.objects.create_user(username='changer').profile
+        profile.image = upload('one.png', (600, 600))
+        profile.save()
+        self.work()
+        profile.refresh_from_db()
+        storage = profile.image.storage
+        old = [r.name for r in profile.ready_renditions()]
+        profile.image = upload('two.png', (600, 300))
+        profile.save()
+        profile.refresh_from_db()
+        self.assertEqual(profile.ready_renditions(), []) #old renditions aren't shown for the new image
+        self.work()
+        profile.refresh_from_db()
+        self.assertEqual(len(profile.ready_renditions()), 3)
+        self.assertFalse(any(storage.exists(name) for name in old)) #the old image's renditions are deleted
+
+    def test_replaced_renditions_another_upload_uses_are_kept(self):
+        first = ImageUpload.objects.create(title='One', image=upload('a.png', (800, 800)))
+        second = ImageUpload.objects.create(title='Two', image=upload('b.png', (800, 800)))
+        self.work()
+        first.refresh_from_db()
+        shared = [r.name for r in first.ready_renditions() if r.width < 800]
+        first.image = upload('c.png', (700, 350))
+        first.save()
+        self.work()
+        self.assertTrue(all(first.image.storage.exists(name) for name in shared)) #second still shows them
+
+    def test_template_tag_emits_srcset(self):
+        photo = ImageUpload.objects.create(title='Tagged', image=upload('t.png', (1000, 500)))
+        template = Template('{% load imaging_tags %}{% responsive_image photo sizes="50vw" alt=photo.title %}')
+        html = template.render(Context({'photo': photo}))
+        self.assertNotIn('srcset', html) #not processed yet, just the original
+        self.work()
+        photo.refresh_from_db()
+        html = template.render(Context({'photo': photo}))
+        self.assertIn('320w', html)
+        self.assertIn('1000w', html)
+        self.assertIn('sizes="50vw"', html)
+        self.assertIn('alt="Tagged"', html)
+
+    def test_enqueue_missing(self):
+        photo = ImageUpload.objects.create(title='Old', image=upload('old.png', (700, 700)))
+        ImageJob.objects.all().delete()
+        call_command('process_image_jobs', once=True, workers=1, enqueue_missing=True, stdout=StringIO())
+        photo.refresh_from_db()
+        self.assertTrue(photo.ready_renditions())
+
+    def test_broken_image_fails_after_max_attempts(self):
+        photo = ImageUpload.objects.create(title='Broken', image=SimpleUploadedFile('broken.png', b'not an image'))
+        call_command('process_image_jobs', once=True, workers=1, max_attempts=2, stdout=StringIO(), stderr=StringIO())
+        job = ImageJob.objects.get(object_id=photo.pk)
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, 2))
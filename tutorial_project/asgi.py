@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tutorial_project.settings')
 
 application = get_asgi_application()
+
+#compile every template now rather than on the first requests (settings.WARM_TEMPLATES_ON_STARTUP)
+if settings.WARM_TEMPLATES_ON_STARTUP:
+    from tutorial_project.templating import warm_templates
+    warm_templates()
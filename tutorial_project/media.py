@@ -0,0 +1,144 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.views.static import was_modified_since
+
+#serves MEDIA_URL (profile pictures, gallery photos, their renditions) in development and production
+#django's static() view used to do this only with DEBUG on, reading the files through python with no validators
+#
+#every request goes through serve_media so the access rules apply: the gallery (MEDIA_LOGIN_REQUIRED) is only
+#for logged in users, like the gallery pages. what happens next depends on settings.MEDIA_SERVER:
+#  'django'    the file is streamed from here with a strong ETag, Last-Modified and byte ranges (206), the body is
+#              never read into memory, and under a WSGI server with wsgi.file_wrapper (gunicorn) it goes out with
+#              os.sendfile, straight from the page cache to the socket
+#  'nginx'     an empty response with X-Accel-Redirect: MEDIA_ACCEL_PREFIX + path, nginx then sends the file
+#              itself (ranges and validators included) from an `internal` location pointing at MEDIA_ROOT:
+#                  location /protected-media/ { internal; alias /srv/blog/media/; }
+#  'sendfile'  the same with X-Sendfile: <full path>, for apache mod_xsendfile and lighttpd
+#renditions are named after a hash of their content (imaging/processing.py), so they are cached as immutable
+
+BLOCK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    #a file opened at `start` that reads no further than `length` bytes, for a 206 response
+    #keeps fileno() so the WSGI server can still use sendfile (it starts at the current offset, for Content-Length)
+    def __init__(self, fp, start, length):
+        fp.seek(start)
+        self.fp = fp
+        self.remaining = length
+        self.name = fp.name
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.fp.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.fp.fileno()
+
+    def close(self):
+        self.fp.close()
+
+
+def login_required_for(path):
+    return any(path.startswith(prefix) for prefix in getattr(settings, 'MEDIA_LOGIN_REQUIRED', []))
+
+def cache_control(path, private):
+    if '/derived/' in f'/{path}':
+        max_age, immutable = 60 * 60 * 24 * 365, ', immutable'
+    else:
+        max_age, immutable = getattr(settings, 'MEDIA_MAX_AGE', 60 * 60), ''
+    return f"{'private' if private else 'public'}, max-age={max_age}{immutable}"
+
+def requested_range(request, size, etag, mtime):
+    #(start, end) of a single satisfiable "Range: bytes=..." request, None to send the whole file,
+    #False when the range can't be satisfied
+    header = request.headers.get('Range')
+    if not header or request.method != 'GET':
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != int(mtime):
+        return None #the file changed since the client got its first part, it needs all of it again
+    match = RANGE_RE.match(header.strip()) #several ranges at once are allowed to be answered with the whole file
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1 #the last n bytes
+    else:
+        return None
+    if start >= size or start > end:
+        return False
+    return start, end
+
+def serve_media(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation: #a path that leaves MEDIA_ROOT
+        raise Http404('Not found')
+    #the access rules and the offload headers go by the normalized path: profile_pics/../gallery_pics/x.png
+    #or ./gallery_pics/x.png is the gallery too
+    path = os.path.relpath(fullpath, os.path.abspath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+    if login_required_for(path) and not request.user.is_authenticated:
+        raise PermissionDenied
+    if not os.path.isfile(fullpath):
+        raise Http404('Not found')
+
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+    mode = getattr(settings, 'MEDIA_SERVER', 'django')
+    if mode != 'django':
+        response = HttpResponse(content_type=content_type)
+        if mode == 'nginx':
+            response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + path
+        else:
+            response['X-Sendfile'] = fullpath
+        response['Cache-Control'] = cache_control(path, login_required_for(path))
+        return response
+
+    stat = os.stat(fullpath)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"' #strong: a different file always has other size or mtime
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': cache_control(path, login_required_for(path)),
+    }
+
+    if_none_match = request.headers.get('If-None-Match')
+    if (if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*')) or (
+        not if_none_match and not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime)
+    ):
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    byte_range = requested_range(request, stat.st_size, etag, stat.st_mtime)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    fp = open(fullpath, 'rb')
+    if byte_range is None:
+        response = FileResponse(fp, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(fp, start, end - start + 1), content_type=content_type, status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response.block_size = BLOCK_SIZE
+    for name, value in headers.items():
+        response[name] = value
+    return response
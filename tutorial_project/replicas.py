@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import random
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+#read replicas: reads go to one of settings.DATABASE_REPLICAS, writes always go to 'default' (the primary)
+#
+#a replica lags behind the primary a little, so a user who just wrote something could reload the page and not see it,
+#to avoid that a request that writes (any method but GET/HEAD/OPTIONS/TRACE) and every request from the same browser
+#for READ_YOUR_WRITES_SECONDS afterwards read from the primary too (ReplicaPinningMiddleware, with a short cookie)
+#code outside requests that must see its own writes straight away uses `with use_primary():`
+#
+#no replicas configured means everything stays on 'default', see DATABASE_REPLICAS in settings.py
+
+PIN_COOKIE = 'pin_primary'
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+@contextmanager
+def use_primary():
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or _pinned.get():
+            return 'default'
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #a replica holds the same rows as the primary, objects loaded from either can point at each other
+        pool = {'default', *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False #replicas get their tables from the primary
+        return None
+
+
+def _writes(request):
+    return request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+def _pin(request, response):
+    #after a write, the next READ_YOUR_WRITES_SECONDS of requests from this browser read from the primary
+    if _writes(request):
+        seconds = getattr(settings, 'READ_YOUR_WRITES_SECONDS', 5)
+        response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+    return response
+
+@sync_and_async_middleware
+def ReplicaPinningMiddleware(get_response):
+    #put it near the top of MIDDLEWARE so the session and user lookups are pinned as well
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not replicas():
+                return await get_response(request)
+            if _writes(request) or PIN_COOKIE in request.COOKIES:
+                with use_primary():
+                    response = await get_response(request)
+            else:
+                response = await get_response(request)
+            return _pin(request, response)
+    else:
+        def middleware(request):
+            if not replicas():
+                return get_response(request)
+            if _writes(request) or PIN_COOKIE in request.COOKIES:
+                with use_primary():
+                    response = get_response(request)
+            else:
+                response = get_response(request)
+            return _pin(request, response)
+    return middleware
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
     'blog.apps.BlogConfig',
     'users.apps.UsersConfig',
     'gallery.apps.GalleryConfig',
+    'imaging.apps.ImagingConfig',
     'crispy_forms',
     'crispy_bootstrap4',
     'django.contrib.admin',
@@ -46,22 +47,25 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tutorial_project.timing.ServerTimingMiddleware', #Server-Timing header and a log line per request, keep it first
     'django.middleware.security.SecurityMiddleware',
+    'tutorial_project.staticfiles.StaticFilesMiddleware', #serves STATIC_ROOT in production, see STATIC_ROOT below
+    'tutorial_project.replicas.ReplicaPinningMiddleware', #read-your-writes for the read replicas
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware', #django's AuthenticationMiddleware, with request.user from the cache
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'tutorial_project.urls'
+ROOT_URLCONF = 'tutorial_project.urls' #'tutorial_project.urls_async' serves the read pages with async views, for ASGI servers
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'tutorial_project.timing.TimedDjangoTemplates', #django's DjangoTemplates, timing the rendering
+        'NAME': 'django',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -69,6 +73,15 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            #always the cached loader (what APP_DIRS picks on its own too, but spelled out so it doesn't depend on
+            #DEBUG or the django version): each template is compiled once per process, in development the
+            #autoreloader clears it when a template changes, see tutorial_project/templating.py for the warm up
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -79,13 +92,52 @@ WSGI_APPLICATION = 'tutorial_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+#sqlite set up for several workers reading and writing at the same time (benchmarks/sqlite_stress.py checks it):
+# - WAL journal: readers don't wait for a writer and a writer doesn't wait for readers, only writers queue up
+# - synchronous=NORMAL: with WAL still safe against corruption, a power cut can only lose the last commits
+# - timeout: a writer waits up to 20s for the lock instead of failing with "database is locked" straight away
+# - transaction_mode IMMEDIATE: transaction.atomic() takes the write lock at BEGIN, a deferred transaction that reads
+#   first and then tries to write can't be given the lock and fails at once without waiting for the timeout
+# - mmap_size/cache_size: reads served from the page cache / memory map instead of read() calls, per connection
+# - CONN_MAX_AGE: keep connections (and their pragmas and caches) between requests instead of one per request
+SQLITE_INIT_COMMAND = ';'.join([
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456', #256MB
+    'PRAGMA cache_size=-32000', #32MB, negative means KiB
+])
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_INIT_COMMAND,
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
+#read replicas (tutorial_project/replicas.py): reads go to the aliases in DATABASE_REPLICAS, writes to 'default',
+#a browser that just wrote something reads from 'default' for READ_YOUR_WRITES_SECONDS
+#to try it locally with a copy of db.sqlite3 standing in for a real replica:
+#    BLOG_REPLICA_DB=db-replica.sqlite3 python manage.py sync_replicas --every 1   (keeps the copy up to date)
+#    BLOG_REPLICA_DB=db-replica.sqlite3 python manage.py runserver
+#run the tests without it, they check the routing on their own with override_settings
+DATABASE_ROUTERS = ['tutorial_project.replicas.ReplicaRouter']
+DATABASE_REPLICAS = []
+READ_YOUR_WRITES_SECONDS = 5
+if os.environ.get('BLOG_REPLICA_DB'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['BLOG_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'}, #tests use the primary's test database for it
+    }
+    DATABASE_REPLICAS = ['replica']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -122,11 +174,26 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+#production: `python manage.py collectstatic` copies the files to STATIC_ROOT with a content hash in their names
+#plus gzip/brotli copies (brotli needs `pip install brotli`), StaticFilesMiddleware serves them with far-future
+#caching (tutorial_project/staticfiles.py), while developing runserver serves them from the apps as before
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STATIC_MAX_AGE = 60 #seconds, for the few files requested by their name without hash
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'tutorial_project.staticfiles.CompressedManifestStaticFilesStorage'},
+}
 
 MEDIA_ROOT = BASE_DIR.joinpath('media') #media root is the full path to directory where we'd like django to store uploaded files
 #for performance reasons, these files are stored not on the database but on the filesystem
 MEDIA_URL = '/media/' #eg: if pfp then media/pfp
 #media url is public url of that directory, i.e this is how we'll access the media throught the browser
+#media is served by tutorial_project/media.py: 'django' streams the files itself (ETag, ranges, sendfile under gunicorn),
+#'nginx' (X-Accel-Redirect to MEDIA_ACCEL_PREFIX) or 'sendfile' (X-Sendfile, apache/lighttpd) hand them to the front server
+MEDIA_SERVER = 'django'
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_LOGIN_REQUIRED = ['gallery_pics/'] #path prefixes only logged in users may download
+MEDIA_MAX_AGE = 60 * 60 #seconds, for files that can be replaced (renditions are cached for a year)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -145,3 +212,60 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get('DJANGO_EMAIL_SENDER')
 EMAIL_HOST_PASSWORD = os.environ.get('DJANGO_PASSWORD')
+
+#'cursor' pages the feeds on (last_updated, id) with next/previous tokens (no COUNT(*), no OFFSET, see blog/pagination.py)
+#'offset' goes back to django's numbered pages
+BLOG_PAGINATION = 'cursor'
+
+#the post cards on the feeds are cached as rendered html (blog/cards.py), local memory is per process,
+#switch to the file based cache to share the cards between worker processes:
+#'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': BASE_DIR / 'cache'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+BLOG_CARD_CACHE = 'default'
+BLOG_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+#the following feed (blog/timeline.py): a new post is written into the timeline of each of its author's followers,
+#in bulk inserts of TIMELINE_BATCH_SIZE rows, unless the author has more than TIMELINE_FANOUT_LIMIT followers,
+#then their posts are merged into the timelines when they're read. Following someone copies in their last
+#TIMELINE_BACKFILL posts
+TIMELINE_FANOUT_LIMIT = 5000
+TIMELINE_BATCH_SIZE = 500
+TIMELINE_BACKFILL = 100
+
+#authenticated requests without session and user queries: the session is read from the cache (written to both),
+#and request.user with their profile comes from the cache too (users/caching.py)
+#local memory is per process, so with several worker processes use a shared cache (see CACHES above) or a user edit
+#or password change in one process can take up to USERS_CACHE_TIMEOUT to reach the others,
+#`python manage.py check --deploy` fails with local memory here (users/checks.py)
+#to go back to plain database lookups remove SESSION_ENGINE and use 'django.contrib.auth.middleware.AuthenticationMiddleware'
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+USERS_CACHE = 'default'
+USERS_CACHE_TIMEOUT = 60 * 15
+
+#per request timings (tutorial_project/timing.py): db, template and view time as a Server-Timing header and a log line,
+#queries slower than SLOW_QUERY_MS are logged with the view that ran them
+#the header shows anyone how long the database took, set SERVER_TIMING_HEADER = False to keep that to the logs
+SERVER_TIMING_HEADER = True
+SLOW_QUERY_MS = 100
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        #one line per request at INFO, slow queries at WARNING (only those while the tests run, tutorial_project/test_runner.py)
+        'tutorial_project.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+TEST_RUNNER = 'tutorial_project.test_runner.TestRunner'
+
+#templates (tutorial_project/templating.py): compile every template when the server process starts,
+#and reuse the html of empty crispy forms (blog/templatetags/crispy_cache.py), both off while developing
+WARM_TEMPLATES_ON_STARTUP = not DEBUG
+CRISPY_RENDER_CACHE = not DEBUG
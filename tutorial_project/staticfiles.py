@@ -0,0 +1,158 @@
+import gzip
+import json
+import mimetypes
+import os
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.http import parse_etags
+
+try:
+    import brotli #optional: pip install brotli, without it only the gzip variants are made
+except ImportError:
+    brotli = None
+
+#the static file pipeline for production (STATIC_ROOT, `python manage.py collectstatic`)
+#
+#collect time, CompressedManifestStaticFilesStorage: django's manifest storage copies every file under a name with a
+#hash of its content (blog/main.css -> blog/main.4f2c9a1b0e3d.css, {% static %} gives out those names) and this
+#subclass writes a gzip (and with brotli installed a brotli) copy of every text file next to it: main.4f2c9a1b0e3d.css.gz
+#
+#request time, StaticFilesMiddleware: serves STATIC_URL straight from STATIC_ROOT before sessions and views run,
+#the precompressed copy the browser accepts (br, then gzip, then the plain file), and a hashed name with
+#Cache-Control: immutable for a year since its content can never change: browsers stop revalidating it on every page,
+#a new version of the file has a new name. Names without hash get a short max-age and an ETag.
+#a real web server or cdn in front can serve STATIC_ROOT the same way, the middleware is for when there is none
+
+COMPRESSIBLE = ('.css', '.js', '.mjs', '.map', '.svg', '.txt', '.html', '.json', '.xml', '.ico')
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')] #order of preference
+
+def compress_file(path):
+    #writes path.gz (and path.br), skipped when it isn't meaningfully smaller
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data)
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data) * 0.95:
+            with open(path + suffix, 'wb') as fp:
+                fp.write(compressed)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = [*paths, *self.hashed_files.values()]
+        for name in dict.fromkeys(names):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                compress_file(self.path(name))
+
+
+class StaticFile:
+    #one file in STATIC_ROOT and its precompressed variants, looked up once when the middleware starts
+    def __init__(self, path, immutable):
+        self.path = path
+        stat = os.stat(path)
+        self.etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.immutable = immutable
+        self.variants = [(encoding, path + suffix) for encoding, suffix in ENCODINGS if os.path.exists(path + suffix)]
+
+    def pick(self, accept_encoding):
+        #(encoding or None, file path) for a request's Accept-Encoding
+        #the variant the client weighs highest, on a tie the smaller one (ENCODINGS order), never one it gave q=0
+        accepted = parse_accept_encoding(accept_encoding)
+        best, best_q = (None, self.path), 0
+        for encoding, path in self.variants:
+            q = accepted.get(encoding, accepted.get('*', 0))
+            if q > best_q:
+                best, best_q = (encoding, path), q
+        return best
+
+
+def parse_accept_encoding(header):
+    #'br;q=1.0, gzip;q=0.5, *;q=0' -> {'br': 1.0, 'gzip': 0.5, '*': 0.0}, a q that isn't a number counts as 0
+    accepted = {}
+    for part in header.split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    return accepted
+
+
+def index_static_root(root):
+    #{url path below STATIC_URL: StaticFile}
+    manifest = os.path.join(root, 'staticfiles.json')
+    hashed = set()
+    if os.path.exists(manifest):
+        with open(manifest) as fp:
+            hashed = set(json.load(fp).get('paths', {}).values())
+    files = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(('.gz', '.br')) and os.path.exists(os.path.join(directory, filename[:-3])):
+                continue #a variant, served through its original
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            files[name] = StaticFile(path, immutable=name in hashed)
+    return files
+
+
+def serve(request, files, prefix):
+    if request.method not in ('GET', 'HEAD') or not request.path_info.startswith(prefix):
+        return None
+    static_file = files.get(request.path_info[len(prefix):])
+    if static_file is None:
+        return None
+    encoding, path = static_file.pick(request.headers.get('Accept-Encoding', ''))
+    etag = static_file.etag[:-1] + (f'-{encoding}"' if encoding else '"') #every variant is a different body
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    if static_file.immutable:
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={getattr(settings, "STATIC_MAX_AGE", 60)}'
+    return response
+
+
+@sync_and_async_middleware
+def StaticFilesMiddleware(get_response):
+    #put it right after SecurityMiddleware, static files need no session, user or csrf check
+    #not used while developing (runserver serves the files from the apps) or before collectstatic ran
+    root = settings.STATIC_ROOT
+    if settings.DEBUG or not root or not os.path.isdir(root):
+        raise MiddlewareNotUsed
+    files = index_static_root(str(root)) #files collected after the server started are found after a restart
+    prefix = '/' + settings.STATIC_URL.lstrip('/')
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            response = serve(request, files, prefix)
+            return response if response is not None else await get_response(request)
+    else:
+        def middleware(request):
+            response = serve(request, files, prefix)
+            return response if response is not None else get_response(request)
+    return middleware
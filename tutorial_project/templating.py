@@ -0,0 +1,35 @@
+import os
+
+from django.template import TemplateSyntaxError, engines
+from django.template.utils import get_app_template_dirs
+
+#"production" templates: TEMPLATES in settings.py always uses django's cached loader, a template is read and compiled
+#once per process and kept, instead of depending on DEBUG to decide
+#the cache fills on the first request that needs each template, warm_templates() compiles all of them up front
+#so no visitor pays for it: wsgi.py and asgi.py call it at startup when WARM_TEMPLATES_ON_STARTUP is set,
+#and `python manage.py warm_templates` does the same as a deploy check (it fails on a template that doesn't compile)
+
+TEMPLATE_EXTENSIONS = ('.html', '.txt')
+
+def template_names(backend):
+    #every template the loaders can find: the DIRS plus the templates folder of every installed app (admin and
+    #crispy's templates included), first one wins like in the loaders
+    names = []
+    for directory in [*backend.dirs, *get_app_template_dirs('templates')]:
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                if filename.endswith(TEMPLATE_EXTENSIONS):
+                    names.append(os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/'))
+    return list(dict.fromkeys(names))
+
+def warm_templates():
+    #compiles every template into the cached loader, returns (how many, {name: error} for the broken ones)
+    compiled, errors = 0, {}
+    for backend in engines.all():
+        for name in template_names(backend):
+            try:
+                backend.get_template(name)
+                compiled += 1
+            except TemplateSyntaxError as e:
+                errors[name] = str(e)
+    return compiled, errors
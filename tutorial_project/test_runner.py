@@ -0,0 +1,26 @@
+import logging
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+#`python manage.py test` runs with this (TEST_RUNNER in settings.py): django's own runner, with the few things that
+#are meant for a running server turned down while the tests run, instead of settings.py guessing from sys.argv
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        #the static files manifest only exists after collectstatic, the tests render pages without running it
+        self.storages = override_settings(STORAGES={
+            **settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        self.storages.enable()
+        #a timing line for every request the test client makes would bury the test output, slow queries still show
+        self.timing_logger = logging.getLogger('tutorial_project.timing')
+        self.timing_level = self.timing_logger.level
+        self.timing_logger.setLevel(logging.WARNING)
+
+    def teardown_test_environment(self, **kwargs):
+        self.timing_logger.setLevel(self.timing_level)
+        self.storages.disable()
+        super().teardown_test_environment(**kwargs)
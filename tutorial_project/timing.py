@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+from django.utils.decorators import sync_and_async_middleware
+
+#where does the time of a request go: ServerTimingMiddleware measures every request and reports
+#  total  the whole request, middleware included
+#  db     time spent in SQL queries (and how many), from a wrapper around every query django executes
+#  tpl    template rendering, from the template backend below (crispy forms templates count as part of the page)
+#  view   the rest: python in views, forms and middleware
+#as a Server-Timing header (shown by the browser dev tools under Network > Timing) and as one log line per request
+#on the 'tutorial_project.timing' logger, eg:
+#  url=post-detail method=GET status=200 total_ms=7.1 db_ms=1.2 queries=3 tpl_ms=4.9 view_ms=1.0
+#queries slower than SLOW_QUERY_MS are logged on 'tutorial_project.timing.slow_queries' with the view that ran them
+#
+#the cost is a couple of perf_counter() calls per query and per template, cheap enough to leave on in production
+#(a streamed response, eg the api exports, is measured until it starts streaming)
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger(__name__ + '.slow_queries')
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self, request):
+        self.request = request
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.templates = 0.0
+        self.rendering = 0 #nested templates (includes, crispy) are part of the outer one's time
+
+    @property
+    def url_name(self):
+        match = self.request.resolver_match #set once the url is resolved, None for a 404
+        return match.view_name if match else self.request.path
+
+    def finish(self, response):
+        total = time.perf_counter() - self.started
+        view = max(total - self.db - self.templates, 0)
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={total * 1000:.1f}',
+                f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+                f'tpl;dur={self.templates * 1000:.1f}',
+                f'view;dur={view * 1000:.1f}',
+            ])
+        logger.info(
+            'url=%s method=%s status=%s total_ms=%.1f db_ms=%.1f queries=%d tpl_ms=%.1f view_ms=%.1f',
+            self.url_name, self.request.method, response.status_code, total * 1000, self.db * 1000, self.queries,
+            self.templates * 1000, view * 1000,
+            extra={
+                'url_name': self.url_name, 'status_code': response.status_code, 'total_ms': total * 1000,
+                'db_ms': self.db * 1000, 'queries': self.queries, 'tpl_ms': self.templates * 1000,
+            },
+        )
+        return response
+
+
+def time_query(execute, sql, params, many, context):
+    #installed on every database connection, only measures while a request is being timed
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        timings.queries += 1
+        timings.db += elapsed
+        if elapsed * 1000 >= getattr(settings, 'SLOW_QUERY_MS', 100):
+            #the sql without its parameters, they can hold personal data
+            slow_query_logger.warning(
+                'view=%s ms=%.1f sql=%s', timings.url_name, elapsed * 1000, sql,
+                extra={'url_name': timings.url_name, 'duration_ms': elapsed * 1000, 'sql': sql},
+            )
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+connection_created.connect(install_query_timer)
+
+
+@contextmanager
+def timed_rendering():
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    timings.rendering += 1
+    try:
+        yield
+    finally:
+        timings.rendering -= 1
+        if not timings.rendering:
+            timings.templates += time.perf_counter() - started
+
+
+class TimedTemplate:
+    #wraps the template objects of the django backend, everything but render() is passed through
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timed_rendering():
+            return self.template.render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    #the usual django template backend, set as TEMPLATES['BACKEND'] so template rendering shows up in the timings
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+@sync_and_async_middleware
+def ServerTimingMiddleware(get_response):
+    #first in MIDDLEWARE so the other middleware (sessions, the user lookup) is measured as well
+    for connection in connections.all(initialized_only=True): #opened before this module was imported
+        install_query_timer(connection)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            timings = RequestTimings(request)
+            token = _current.set(timings) #sync_to_async copies the context, so queries in threads count too
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            return timings.finish(response)
+    else:
+        def middleware(request):
+            timings = RequestTimings(request)
+            token = _current.set(timings)
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            return timings.finish(response)
+    return middleware
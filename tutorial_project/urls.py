@@ -19,7 +19,7 @@ from django.contrib.auth import views as auth_views
 from django.urls import path, include
 from users import views as user_views #as is used because multiple views can be imported so just giving a name
 from django.conf import settings
-from django.conf.urls.static import static
+from . import media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -43,6 +43,8 @@ urlpatterns = [
     path('gallery/', include('gallery.urls')),
 ]
 
-#to serve media files during development, This configuration will serve media files correctly when running the development server.
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+#media files (uploads) in development and production, with the gallery behind the login and validators, ranges
+#and sendfile or front server offload, see tutorial_project/media.py (used to be static(), only with DEBUG on)
+urlpatterns += [
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", media.serve_media, name='media'),
+]
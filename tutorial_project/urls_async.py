@@ -0,0 +1,11 @@
+from django.urls import path, include
+from .urls import urlpatterns as sync_urlpatterns
+
+#ROOT_URLCONF = 'tutorial_project.urls_async' serves the feeds, post detail and gallery with async views
+#(blog/async_views.py, gallery/async_views.py), meant for running under an ASGI server:
+#    uvicorn tutorial_project.asgi:application --workers 4
+#the async patterns come first so they win, every other url (forms, profile, admin...) is the same sync view as in urls.py
+urlpatterns = [
+    path('', include('blog.urls_async')),
+    path('gallery/', include('gallery.urls_async')),
+] + sync_urlpatterns
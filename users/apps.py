@@ -6,4 +6,5 @@ class UsersConfig(AppConfig):
 
     def ready(self):
         import users.signals
+        import users.checks
         #django doc recommends doing it this way instead of creating signals.py in blog app to avoid some side affects with import
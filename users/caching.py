@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+#the logged in user (with their profile) kept in the cache, so an authenticated request needs no auth_user query
+#together with SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db' (session from the cache too)
+#a page view on a warm cache runs no queries at all just to know who is asking
+#
+#a cached user is only trusted if the session's auth hash matches it, exactly the check django does after loading
+#the user from the database, so a password change (which also saves the user and drops the entry) still logs out
+#other sessions, saving a User or a Profile drops that user's entry (users/signals.py), the next request reloads it
+#USER_CACHE_VERSION is part of every key, bump it when User or Profile change shape so old pickles are never read
+
+USER_CACHE_VERSION = 1
+
+def user_cache():
+    return caches[getattr(settings, 'USERS_CACHE', 'default')]
+
+def user_cache_key(user_id):
+    return f'users:user:{user_id}'
+
+def cache_user(user):
+    timeout = getattr(settings, 'USERS_CACHE_TIMEOUT', 60 * 15)
+    user_cache().set(user_cache_key(user.pk), user, timeout, version=USER_CACHE_VERSION)
+
+def invalidate_user(user_id):
+    user_cache().delete(user_cache_key(user_id), version=USER_CACHE_VERSION)
+
+def load_user(user_id):
+    #the user with the profile joined, as it goes into the cache, None if it doesn't exist
+    return User.objects.select_related('profile').filter(pk=user_id).first()
+
+def get_user(request):
+    #django.contrib.auth.get_user with the cache in front of it
+    try:
+        user_id = User._meta.pk.to_python(request.session[auth.SESSION_KEY])
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+        session_hash = request.session[auth.HASH_SESSION_KEY]
+    except KeyError:
+        return auth.get_user(request) #not logged in
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    user = user_cache().get(user_cache_key(user_id), version=USER_CACHE_VERSION)
+    if user is None:
+        user = load_user(user_id) #not cached yet, one query for the user and the profile
+        backend = auth.load_backend(backend_path)
+        if user is not None and getattr(backend, 'user_can_authenticate', lambda user: True)(user):
+            cache_user(user)
+        else:
+            user = None
+    if user is not None and constant_time_compare(session_hash, user.get_session_auth_hash()):
+        return user
+    #no such user or the session doesn't match (password changed, old secret key...), django's own lookup
+    #decides: it logs the session out, or re-signs it when it was made with one of the SECRET_KEY_FALLBACKS
+    invalidate_user(user_id)
+    return auth.get_user(request)
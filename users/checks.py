@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+#request.user comes from the cache (users/caching.py) and a password change only drops the entry in the cache it
+#runs against, with local memory that's one worker process, the others keep the old user until USERS_CACHE_TIMEOUT
+#runserver is a single process so that's fine while developing, `python manage.py check --deploy` refuses it
+
+@register(Tags.caches, deploy=True)
+def check_user_cache_is_shared(app_configs, **kwargs):
+    alias = getattr(settings, 'USERS_CACHE', 'default')
+    if 'users.middleware.CachedAuthenticationMiddleware' not in settings.MIDDLEWARE:
+        return []
+    if isinstance(caches[alias], LocMemCache):
+        return [Error(
+            f"USERS_CACHE ('{alias}') is a local memory cache, which every worker process has its own copy of.",
+            hint='Use a cache the processes share (redis, memcached, the database) so a password change logs out '
+                 'every session, or go back to django.contrib.auth.middleware.AuthenticationMiddleware.',
+            id='users.E001',
+        )]
+    return []
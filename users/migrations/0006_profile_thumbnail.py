@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_alter_profile_birthday'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='profile_pics/derived'),
+        ),
+    ]
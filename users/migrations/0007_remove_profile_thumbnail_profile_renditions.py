@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_profile_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='profile',
+            name='thumbnail',
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,14 +1,21 @@
 from django.db import models
 from django.contrib.auth.models import User
-from PIL import Image
+from imaging.models import ResponsiveImageModel
 import datetime
 
-class Profile(models.Model):
+class Profile(ResponsiveImageModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE) #we want a 1-1 relation with User so we passed that as argument
     #if user is deleted, profile is deleted(one way, not the other way round)
     image = models.ImageField(default='default.jpeg', upload_to='profile_pics')
     #profile_pics is the directory which is created (where pfps are stored)
     birthday = models.DateField(default=datetime.date.today)
+    #goes up whenever the user's name or their picture changes (blog/signals.py), the cached post cards and the feeds' ETags
+    #include it, so every process and every browser notices the change without being told
+    version = models.PositiveIntegerField(default=0)
+
+    #avatars are shown 65px wide on the feeds and 125px on the profile page, these cover 1x and 2x screens
+    #(resized in the background by the process_image_jobs worker, renditions field comes from ResponsiveImageModel)
+    RENDITION_WIDTHS = (65, 130, 250)
 
     #we're making a dunder str method so that when we print profile, we dont want it to say profile object(in admin) but
     #be more descriptive the way we want
@@ -17,14 +24,43 @@ class Profile(models.Model):
         return f"{self.user.username}'s Profile"
         #it will return eg;TestUser01 Profile when profile is printed
 
+    #change tracking: remember the field values as they came from the database so we can tell what was really edited
+    #(saving a User, eg on every login, used to save the profile and reprocess the image each time)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._current_values()
+        return instance
+
+    def _current_values(self):
+        #only fields already loaded (reading a deferred field here would cost a query), files compared by name
+        values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__:
+                value = self.__dict__[field.attname]
+                values[field.attname] = getattr(value, 'name', value)
+        return values
+
+    def changed_fields(self):
+        #names of the fields edited since the profile was loaded (all of them for a profile that isn't saved yet)
+        loaded = getattr(self, '_loaded_values', None)
+        current = self._current_values()
+        if loaded is None:
+            return set(current)
+        return {name for name, value in current.items() if loaded.get(name, value) != value}
+
     #overriding save method
-    #reszing image
+    #resizing used to happen right here (Image.open, thumbnail, save) which kept the request waiting on PIL,
+    #now the original is saved as uploaded and the resizing is queued for the background worker,
+    #and only when the image actually changed
     def save(self, *args, **kwargs):
-        #this method runs after our model is saved
+        #what this save changed, for the post_save receivers (blog/signals.py bumps version only for what cards show)
+        self.saved_changes = self.changed_fields()
+        image_changed = 'image' in self.saved_changes
         super().save(*args, **kwargs)
-        img = Image.open(self.image.path)
-
-        if img.height > 300 or img.width >300:
-            output_size = (300, 300)
-            img.thumbnail(output_size)
-            img.save(self.image.path)
+        self._loaded_values = self._current_values()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'image' not in update_fields:
+            return #eg the worker saving the renditions
+        if image_changed and self.image and self.image.name != self._meta.get_field('image').default:
+            self.enqueue_renditions()
@@ -1,11 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 #this is a signal that gets fired after an object is saved
 #in this case, we want to get a posts save signal when a user is created, hence user needs to be imported as well
 from django.contrib.auth.models import User
 #user model is the sender in this case, since it is what sends the signal
 from django.dispatch import receiver
 #a receiver is a function that receives this function and does some task
+from django.contrib.auth.signals import user_logged_in
 from .models import Profile
+from .caching import cache_user, invalidate_user, load_user
 
 @receiver(post_save, sender=User) #means when a user is saved, send post_save signal and that signal is going to be 
 #received by the receiver which is create_profile function
@@ -14,6 +16,33 @@ def create_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user = instance)
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs): #accepts any additional keyword argument onto the end of the function
-    instance.profile.save() #instance means user
-    #saves any changes made to the Profile object associated with the User.
\ No newline at end of file
+def save_profile(sender, instance, created, **kwargs): #accepts any additional keyword argument onto the end of the function
+    #saves any changes made to the Profile object associated with the User, eg user.profile.birthday = ...; user.save()
+    #but only if this user's profile was loaded and something on it was edited: a login saves the user too
+    #(last_login) and shouldn't cost a profile query, an UPDATE and an image check every time
+    if created or not User.profile.is_cached(instance): #instance means user
+        return
+    changed = instance.profile.changed_fields()
+    if changed:
+        instance.profile.save(update_fields=changed)
+
+
+#the cached request.user (users/caching.py) has to be dropped whenever the user or their profile changes
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return #the login itself (update_last_login), nothing shown on the pages changed
+    invalidate_user(instance.pk)
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_profile_user(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+#put the user in the cache right away when they log in, so their first page is already a hit
+@receiver(user_logged_in)
+def warm_cached_user(sender, request, user, **kwargs):
+    user = load_user(user.pk)
+    if user is not None:
+        cache_user(user)
@@ -1,3 +1,108 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.checks import run_checks
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from imaging.models import ImageJob
+from .caching import cache_user, invalidate_user
 
 # Create your tests here.
+
+class ProfileChangeTrackingTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+        self.user = User.objects.create_user(username='tracked', password='pass12345')
+        buffer = BytesIO()
+        Image.new('RGB', (500, 500)).save(buffer, format='PNG')
+        self.user.profile.image = SimpleUploadedFile('face.png', buffer.getvalue())
+        self.user.profile.save()
+        ImageJob.objects.all().delete()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def test_login_costs_no_image_work_and_no_profile_update(self):
+        with mock.patch('PIL.Image.open', wraps=Image.open) as image_open, CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('login'), {'username': 'tracked', 'password': 'pass12345'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(image_open.call_count, 0)
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE') and 'django_session' not in q['sql']]
+        self.assertEqual(len(updates), 1, updates) #just last_login (plus the session django writes on login)
+        self.assertIn('"last_login"', updates[0])
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_saving_user_only_saves_a_dirty_profile(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.profile #loaded but not edited
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertFalse(any('users_profile' in q['sql'] for q in queries.captured_queries))
+
+        user.profile.birthday = user.profile.birthday.replace(year=2000)
+        user.save()
+        self.assertEqual(User.objects.get(pk=user.pk).profile.birthday.year, 2000)
+        self.assertFalse(ImageJob.objects.exists()) #birthday changed, image didn't
+
+    def test_new_image_is_queued_once(self):
+        profile = User.objects.get(pk=self.user.pk).profile
+        buffer = BytesIO()
+        Image.new('RGB', (400, 400)).save(buffer, format='PNG')
+        profile.image = SimpleUploadedFile('new.png', buffer.getvalue())
+        profile.save()
+        profile.save()
+        self.assertEqual(ImageJob.objects.count(), 1)
+
+
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='regular', password='pass12345')
+        self.client.force_login(self.user)
+
+    def test_warm_requests_run_no_auth_queries(self):
+        self.client.get(reverse('blog-about'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('blog-about'))
+        self.assertEqual(response.context['user'], self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(response.wsgi_request.user.profile.user_id, self.user.pk) #profile came with the user
+
+    def test_profile_save_refreshes_the_cached_user(self):
+        profile = self.user.profile
+        profile.birthday = profile.birthday.replace(year=1999)
+        profile.save()
+        with self.assertNumQueries(1): #reloaded once, user and profile in one query
+            response = self.client.get(reverse('blog-about'))
+        self.assertEqual(response.wsgi_request.user.profile.birthday.year, 1999)
+
+    def test_password_change_logs_out_other_sessions(self):
+        self.user.set_password('another-pass-987')
+        self.user.save()
+        response = self.client.get(reverse('blog-home'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_entry_that_doesnt_match_the_session_is_ignored(self):
+        #eg left over from a user that was deleted and whose id was reused
+        impostor = User.objects.create_user(username='impostor')
+        invalidate_user(impostor.pk)
+        impostor.pk = self.user.pk
+        cache_user(impostor)
+        response = self.client.get(reverse('blog-about'))
+        self.assertEqual(response.wsgi_request.user.username, 'regular')
+
+    def test_deploy_check_wants_a_shared_cache(self):
+        errors = lambda: [e.id for e in run_checks(include_deployment_checks=True) if e.id.startswith('users.')]
+        self.assertEqual(errors(), ['users.E001']) #local memory, per process
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache_table'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(errors(), [])